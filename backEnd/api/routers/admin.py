@@ -0,0 +1,113 @@
+import asyncio
+import hmac
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+from core.database import SessionLocal
+from core.profiler import SamplingProfiler, profile_lock
+from services import bulk_load
+from services.retention import retention
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+# uploads larger than this are spooled to a temporary file while they arrive
+_SPOOL_BYTES = 8 * 1024 * 1024
+_bulk_lock = threading.Lock()
+_bulk_progress: Dict[str, Any] = {}
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    # hide admin routes entirely unless a token is configured
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=403, detail="admin token required")
+
+
+@router.get("/profile", dependencies=[Depends(require_admin)], response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(5.0, gt=0, le=60),
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+):
+    '''Sample this worker's stacks for N seconds and return collapsed stacks for flamegraph tools.'''
+    if not profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="a profile is already running on this worker")
+    try:
+        profiler = SamplingProfiler(interval=interval_ms / 1000.0)
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+    finally:
+        profile_lock.release()
+    return PlainTextResponse(
+        profiler.collapsed(),
+        headers={"Content-Disposition": 'attachment; filename="profile.collapsed"'},
+    )
+
+
+@router.post("/retention/run", dependencies=[Depends(require_admin)])
+async def run_retention():
+    '''Run one retention pass now and return what it removed.'''
+    return await run_in_threadpool(retention.run_once)
+
+
+@router.get("/retention", dependencies=[Depends(require_admin)])
+async def retention_status():
+    '''Result of this worker's last retention pass.'''
+    return {"enabled": settings.retention_enabled, "last_run": retention.last_run}
+
+
+@router.post("/bulk-load/{kind}", dependencies=[Depends(require_admin)])
+async def run_bulk_load(
+    kind: str,
+    request: Request,
+    provider: str = Query(..., min_length=1),
+    format: str = Query("csv", pattern="^(" + "|".join(bulk_load.FORMATS) + ")$"),
+    skip: int = Query(0, ge=0, description="records an earlier upload already loaded"),
+    chunk_size: int = Query(bulk_load.DEFAULT_CHUNK_SIZE, ge=100, le=100_000),
+):
+    '''Load the request body (CSV, NDJSON or Parquet) into observations or forecasts.
+
+    The returned ``records`` is the ``skip`` to resend the same body with if
+    the load is interrupted; rows already stored are not duplicated.
+    '''
+    if kind not in bulk_load.KINDS:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not _bulk_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="a bulk load is already running on this worker")
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=_SPOOL_BYTES) as body:
+            async for part in request.stream():
+                await run_in_threadpool(body.write, part)
+            body.seek(0)
+
+            def _run():
+                with SessionLocal() as db:
+                    return bulk_load.load(
+                        db, body, format, kind, provider, chunk_size=chunk_size, skip=skip,
+                        on_progress=lambda p: _bulk_progress.update(kind=kind, **p.as_dict()),
+                    )
+
+            _bulk_progress.clear()
+            try:
+                progress = await run_in_threadpool(_run)
+            except bulk_load.BulkLoadError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        _bulk_lock.release()
+    _bulk_progress.update(kind=kind, **progress.as_dict())
+    return progress.as_dict()
+
+
+@router.get("/bulk-load", dependencies=[Depends(require_admin)])
+async def bulk_load_status():
+    '''Progress of the running (or last) bulk load on this worker.'''
+    return {"running": _bulk_lock.locked(), "progress": _bulk_progress or None}
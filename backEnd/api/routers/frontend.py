@@ -0,0 +1,69 @@
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import FileResponse, Response
+
+from services.frontend import STATIC_PREFIX, bundle
+
+router = APIRouter(include_in_schema=False)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+INDEX = "html/index.html"
+
+
+def _encodings(accept_encoding: Optional[str]) -> set:
+    '''Content codings the client accepts (q > 0).'''
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        q = params.strip()
+        if name and not (q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000")):
+            accepted.add(name)
+    return accepted
+
+
+def _page(page: str, accept_encoding: Optional[str], if_none_match: Optional[str]) -> Response:
+    rendered = bundle.render(page)
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    # the bootstrap changes as forecasts refresh, so pages are revalidated on every load
+    headers = {"Cache-Control": "no-cache", "ETag": rendered.etag, "Vary": "Accept-Encoding"}
+    if if_none_match == rendered.etag:
+        return Response(status_code=304, headers=headers)
+    if "gzip" in _encodings(accept_encoding):
+        return Response(rendered.gzipped, media_type="text/html; charset=utf-8", headers={**headers, "Content-Encoding": "gzip"})
+    return Response(rendered.body, media_type="text/html; charset=utf-8", headers=headers)
+
+
+@router.get("/")
+async def index(accept_encoding: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None)):
+    '''The frontend's index page with the bootstrap inlined.'''
+    return _page(INDEX, accept_encoding, if_none_match)
+
+
+@router.get("/{page:path}.html")
+async def html_page(page: str, accept_encoding: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None)):
+    return _page(f"{page}.html", accept_encoding, if_none_match)
+
+
+@router.get(STATIC_PREFIX + "{path:path}")
+async def static_asset(path: str, accept_encoding: Optional[str] = Header(None)):
+    '''A fingerprinted asset, in the smallest precompressed variant the client accepts.
+
+    ``FileResponse`` hands the file to the server for ``sendfile`` where the
+    server supports the ASGI path-send extension and streams it otherwise.
+    '''
+    asset = bundle.assets.get(STATIC_PREFIX + path)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    accepted = _encodings(accept_encoding)
+    encoding = min(
+        (e for e in asset.files if e == "identity" or e in accepted),
+        key=lambda e: asset.files[e][1].st_size,
+    )
+    headers = {"Cache-Control": IMMUTABLE, "Vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    path, stat = asset.files[encoding]
+    return FileResponse(path, media_type=asset.media_type, headers=headers, stat_result=stat)
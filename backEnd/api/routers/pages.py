@@ -2,6 +2,8 @@ from typing import Optional
 from fastapi import APIRouter, Request, Query, Depends
 from services.weather_service import WeatherService
 from services.geo_service import GeoService
+from services import climatology
+from services import units as unit_systems
 from core.config import settings
 
 router = APIRouter()
@@ -15,6 +17,7 @@ async def home(
         q: Optional[str] = Query(None, description="Place name"),
         lat: Optional[float] = Query(None),
         lon : Optional[float] = Query(None),
+        units: Optional[str] = Query(None, pattern=unit_systems.UNITS_PATTERN),
         weather_service: WeatherService = Depends(get_weather_service),
         geo_service: GeoService = Depends(get_geo_service)):
     '''Determine the city and latitude and longitude of the given query.'''
@@ -37,7 +40,8 @@ async def home(
 
     '''fetch the weather data for the given latitude and longitude and build the context.'''
     data = await weather_service.fetch_data(lat, lon)
-    context = weather_service.build_context(data)
+    baseline = await climatology.baselines.lookup(lat, lon)
+    context = weather_service.build_context(data, units, baseline)
     '''add the query to the context if it was provided.'''
 
     context["place"] = display_city or context.get("place") or f"{lat:.4f}, {lon:.4f}"
@@ -1,18 +1,38 @@
-from typing import Optional
+from typing import List, Mapping, Optional
 from fastapi import APIRouter, Query, Depends
-from services.weather_service import WeatherService
+from services.weather_service import SUMMARY_FIELDS, WeatherService, forecast_cache
+from services import geo_service
 from services.geo_service import GeoService
+from services import ensemble as ensemble_service
+from services import grid as grid_service
+from services.push import hub as push_hub
+from services.tiling import tile_scheme, tile_stats
+from services.forecast_series import ForecastSeries
+from services import climatology, forecast_store, identity, payload_store
+from services import geocode_batch as geocode_batch_service
+from services import resample as resample_service
+from services import units as unit_systems
+from services.identity import LocationRef, ProviderRef
+from services.location_index import location_index, ensure_loaded as ensure_location_index, normalize as normalize_place
+from core import wire
 from core.config import settings
-from fastapi import Body, HTTPException, status
+from fastapi import Body, Header, HTTPException, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
 from datetime import date, datetime, timedelta
 from starlette.concurrency import run_in_threadpool
-from core.database import get_db
+from core.database import SessionLocal, get_db, insert_ignore
+from sqlalchemy import DateTime, Integer, Numeric, select
 from sqlalchemy.orm import Session
+from decimal import Decimal
+import asyncio
 import json
+import logging
+import time
 
-from models.model import Provider, Location, Request as RequestModel, WeatherForecast, Favorite
+from models.model import Location, LocationAlias, Request as RequestModel, WeatherForecast, Favorite, gen_uuid
 
+logger = logging.getLogger("weather.api")
 router = APIRouter(prefix="/api/weather", tags=["weather"])
 
 def get_weather_service() -> WeatherService:
@@ -26,25 +46,230 @@ async def summary(
     q: Optional[str] = Query(None),
     lat: Optional[float] = Query(None),
     lon: Optional[float] = Query(None),
+    units: Optional[str] = Query(None, pattern=unit_systems.UNITS_PATTERN, description="Defaults to WEATHER_UNITS"),
+    fields: Optional[str] = Query(None, description="Comma separated subset of: " + ", ".join(SUMMARY_FIELDS)),
+    accept: Optional[str] = Header(None),
     wx: WeatherService = Depends(get_weather_service),
     geo: GeoService = Depends(get_geocoding_service),
 ):
+    media = wire.negotiate(accept)
+    wanted = wire.parse_fields(fields, SUMMARY_FIELDS) or SUMMARY_FIELDS
+    place = None
     if q:
         resolved = await geo.resolve_coords_from_query(q)
         if resolved:
             lat, lon, place = resolved
         else:
             lat, lon = settings.default_lat, settings.default_lon
-            place = None
     else:
         lat = lat or settings.default_lat
         lon = lon or settings.default_lon
-        place = await geo.resolve_place_from_coords(lat, lon)
+        if "place" in wanted:
+            place = await geo.resolve_place_from_coords(lat, lon)
 
     data = await wx.fetch_data(lat, lon)
-    ctx = wx.build_context(data)
-    ctx["place"] = place or ctx.get("place") or f"{lat:.4f}, {lon:.4f}"
-    return ctx
+    baseline = await climatology.baselines.lookup(lat, lon) if "anomaly" in wanted else None
+    ctx = wx.build_context(data, units, baseline, wanted)
+    if "place" in ctx:
+        ctx["place"] = place or ctx["place"] or f"{lat:.4f}, {lon:.4f}"
+    return wire.respond(media, lambda: ctx)
+
+
+def summary_is_cached(path: str, query: Mapping[str, str]) -> bool:
+    '''Whether this worker can answer ``/summary`` for ``query`` from memory.
+
+    Mirrors how ``summary`` resolves its point; admission control admits
+    such requests ahead of ones that have to go upstream.
+    '''
+    if path != "/api/weather/summary":
+        return False
+    try:
+        if query.get("q"):
+            resolved = geo_service.cached_coords(query["q"])
+            if resolved is None:
+                return False
+            lat, lon = resolved[0], resolved[1]
+        else:
+            lat = float(query.get("lat") or 0) or settings.default_lat
+            lon = float(query.get("lon") or 0) or settings.default_lon
+            fields = query.get("fields")
+            wants_place = fields is None or "place" in (f.strip() for f in fields.split(","))
+            if wants_place and not geo_service.has_cached_place(lat, lon):
+                return False
+    except ValueError:
+        return False
+    return forecast_cache.peek(tile_scheme.tile_for(lat, lon).key) is not None
+
+
+@router.get("/providers")
+async def providers(wx: WeatherService = Depends(get_weather_service)):
+    '''Per-provider health and smoothed latency as seen by this worker.'''
+    return {"strategy": wx.router.strategy, "providers": [s.as_dict() for s in wx.router.stats.values()]}
+
+
+@router.get("/tiles/stats")
+async def tiles_stats(top: int = Query(20, ge=0, le=500)):
+    '''Forecast cache hit rates per tile for this worker.'''
+    return {"scheme": tile_scheme.scheme, **tile_stats.snapshot(top)}
+
+
+@router.get("/locations/suggest")
+async def suggest_locations(
+    prefix: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    fuzzy: bool = Query(True),
+    db: Session = Depends(get_db),
+):
+    '''Autocomplete known locations and aliases, most requested first.'''
+    if not location_index.loaded:
+        await run_in_threadpool(ensure_location_index, db)
+    return location_index.suggest(prefix, limit=limit, fuzzy=fuzzy)
+
+
+class GeocodeBatchBody(BaseModel):
+    queries: List[str] = Field(..., min_length=1)
+    # write resolved points as locations (and the queries as their aliases)
+    persist: bool = True
+
+
+# at most one progress line per this many seconds, besides the first and last
+_PROGRESS_INTERVAL = 0.5
+
+
+@router.post("/geocode/batch")
+async def geocode_batch(
+    body: GeocodeBatchBody,
+    stream: bool = Query(False, description="Stream NDJSON progress lines before the result"),
+    db: Session = Depends(get_db),
+):
+    '''Geocode many place queries, deduplicated, from cache and stored locations first.
+
+    With ``stream=true`` the response is NDJSON: ``{"progress": {"done",
+    "total"}}`` lines while upstream lookups run, then one ``{"items",
+    "stats"}`` line (or ``{"error"}``).
+    '''
+    if len(body.queries) > settings.geocode_batch_max_items:
+        raise HTTPException(status_code=400, detail=f"at most {settings.geocode_batch_max_items} queries per call")
+    queries = [q.strip() for q in body.queries]
+    bad = [i for i, q in enumerate(queries) if not q or len(q) > 200]
+    if bad:
+        raise HTTPException(status_code=400, detail=f"queries must be 1-200 characters; see items {bad[:10]}")
+    if not stream:
+        out = await geocode_batch_service.geocode(db, queries, body.persist)
+        return JSONResponse(out)
+
+    lines: asyncio.Queue = asyncio.Queue()
+    last = [0.0]
+
+    def progress(done: int, total: int) -> None:
+        now = time.monotonic()
+        if done in (0, total) or now - last[0] >= _PROGRESS_INTERVAL:
+            last[0] = now
+            lines.put_nowait({"progress": {"done": done, "total": total}})
+
+    async def run() -> None:
+        try:
+            # a session of its own: the job outlives the request's dependencies
+            with SessionLocal() as own:
+                lines.put_nowait(await geocode_batch_service.geocode(own, queries, body.persist, progress))
+        except HTTPException as e:
+            lines.put_nowait({"error": e.detail})
+        except Exception:
+            logger.exception("batch geocode failed")
+            lines.put_nowait({"error": "batch geocode failed"})
+        finally:
+            lines.put_nowait(None)
+
+    async def ndjson():
+        job = asyncio.create_task(run())
+        try:
+            while (line := await lines.get()) is not None:
+                yield json.dumps(line) + "\n"
+        finally:
+            # the client went away: stop asking upstream
+            job.cancel()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/grid")
+async def grid(
+    bbox: str = Query(..., description="min_lon,min_lat,max_lon,max_lat"),
+    res: str = Query("64x64", description="WIDTHxHEIGHT of the output raster"),
+    variables: str = Query("temp", description="Comma separated: temp, wind, precip"),
+    time: Optional[int] = Query(None, description="Unix seconds; the nearest forecast step is used"),
+    method: str = Query("bilinear", pattern="^(bilinear|idw)$"),
+    format: str = Query("bin", pattern="^(bin|png)$"),
+    wx: WeatherService = Depends(get_weather_service),
+):
+    '''Forecast field over a viewport as little-endian float32 (V, H, W) or a 16-bit PNG.'''
+    names = [v.strip() for v in variables.split(",") if v.strip()]
+    unknown = [v for v in names if v not in grid_service.EXTRACTORS]
+    if not names or unknown:
+        raise HTTPException(status_code=400, detail=f"variables must be drawn from: {', '.join(grid_service.EXTRACTORS)}")
+    if format == "png" and len(names) != 1:
+        raise HTTPException(status_code=400, detail="png output carries exactly one variable")
+    try:
+        box = grid_service.parse_bbox(bbox)
+        width, height = grid_service.parse_res(res)
+        key = (box, width, height, tuple(names), time and time - time % grid_service.STEP_SECONDS, method, format)
+        cached = grid_service.raster_cache.get(key)
+        if cached is not None:
+            body, headers, media_type = cached
+            return Response(body, media_type=media_type, headers=headers)
+        field = await grid_service.build_field(wx.fetch_data, box, names, time)
+    except grid_service.GridError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    raster = await run_in_threadpool(grid_service.rasterize, field, box, width, height, method)
+    headers = {
+        "X-Grid-Shape": f"{len(names)},{height},{width}",
+        "X-Grid-Variables": ",".join(names),
+        "X-Grid-BBox": ",".join(str(v) for v in box),
+        "X-Forecast-Time": str(field.forecast_time),
+    }
+    if format == "png":
+        body, lo, hi = await run_in_threadpool(grid_service.encode_png, raster[0])
+        headers["X-Grid-Range"] = f"{lo},{hi}"
+        media_type = "image/png"
+    else:
+        body = raster.tobytes()
+        headers["X-Grid-Dtype"] = "float32-le"
+        media_type = "application/octet-stream"
+    grid_service.raster_cache.set(key, (body, headers, media_type))
+    return Response(body, media_type=media_type, headers=headers)
+
+
+@router.get("/stream")
+async def stream(
+    loc: List[str] = Query([], description="lat,lon; repeat for multiple locations"),
+    q: Optional[str] = Query(None, description="Place name to subscribe to"),
+    units: Optional[str] = Query(None, pattern=unit_systems.UNITS_PATTERN, description="Defaults to WEATHER_UNITS"),
+    geo: GeoService = Depends(get_geocoding_service),
+):
+    '''Server-Sent Events: a snapshot per location, then diffs whenever its forecast refreshes.'''
+    points = []
+    for raw in loc:
+        try:
+            lat_s, lon_s = raw.split(",")
+            points.append((float(lat_s), float(lon_s)))
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"loc must be 'lat,lon', got {raw!r}")
+    if q:
+        resolved = await geo.resolve_coords_from_query(q)
+        if not resolved:
+            raise HTTPException(status_code=400, detail="Could not resolve location query")
+        points.append(resolved[:2])
+    if not points:
+        points.append((settings.default_lat, settings.default_lon))
+    tiles = list({t.key: t for t in (tile_scheme.tile_for(lat, lon) for lat, lon in points)}.values())
+    if len(tiles) > settings.push_max_locations:
+        raise HTTPException(status_code=400, detail=f"at most {settings.push_max_locations} locations per stream")
+    return StreamingResponse(
+        push_hub.stream(tiles, unit_systems.resolve(units)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # -----------------------------
@@ -68,29 +293,14 @@ def validate_date_range(start_date: date, end_date: date):
         raise HTTPException(status_code=400, detail="date range may not exceed 7 days")
 
 
-def db_get_or_create_provider(db: Session, name: str, base_url: str) -> Provider:
-    p = db.query(Provider).filter(Provider.name == name).first()
-    if p:
-        return p
-    p = Provider(name=name, base_url=base_url)
-    db.add(p)
+def db_add_location_alias(db: Session, location: LocationRef, alias: str) -> None:
+    # remember what the user typed when it differs from the canonical name
+    key = normalize_place(alias)
+    if not key or key == normalize_place(location.canonical_name):
+        return
+    insert_ignore(db, LocationAlias, [{"id": gen_uuid(), "location_id": location.id, "alias": key}], ["location_id", "alias"])
     db.commit()
-    db.refresh(p)
-    return p
-
-
-def db_get_or_create_location(db: Session, lat: float, lon: float, canonical_name: str | None = None) -> Location:
-    # round coordinates to 5 decimals to match schema uniqueness
-    key_lat = round(float(lat), 5)
-    key_lon = round(float(lon), 5)
-    loc = db.query(Location).filter(Location.latitude == key_lat, Location.longitude == key_lon).first()
-    if loc:
-        return loc
-    loc = Location(latitude=key_lat, longitude=key_lon, canonical_name=canonical_name or f"{key_lat:.5f}, {key_lon:.5f}")
-    db.add(loc)
-    db.commit()
-    db.refresh(loc)
-    return loc
+    location_index.add(location.id, location.canonical_name, location.latitude, location.longitude, aliases=[key])
 
 
 def db_create_request(db: Session, user_id: str | None, location_id: str, provider_id: str, query_raw: str | None, start_date: date, end_date: date, granularity: str) -> RequestModel:
@@ -101,32 +311,14 @@ def db_create_request(db: Session, user_id: str | None, location_id: str, provid
     return req
 
 
-def db_store_forecasts(db: Session, location: Location, provider: Provider, data: dict, start_date: date, end_date: date):
-    # store hourly forecasts from OpenWeather 'list' items
-    now = datetime.utcnow()
-    stored = 0
-    items = data.get("list", [])
-    for item in items:
-        dt = datetime.utcfromtimestamp(int(item.get("dt", 0)))
-        if dt.date() < start_date or dt.date() > end_date:
-            continue
-        main = item.get("main", {})
-        wf = WeatherForecast(
-            location_id=location.id,
-            provider_id=provider.id,
-            kind="hourly",
-            snapshot_time=now,
-            forecast_time=dt,
-            temperature_c=main.get("temp"),
-            temp_min_c=main.get("temp_min"),
-            temp_max_c=main.get("temp_max"),
-            humidity_pct=main.get("humidity"),
-            payload_raw=json.dumps(item),
-        )
-        db.add(wf)
-        stored += 1
-    db.commit()
-    return stored
+def db_store_forecasts(db: Session, location: LocationRef, provider: ProviderRef, series: ForecastSeries, start_date: date, end_date: date):
+    # store the steps whose UTC date falls in [start_date, end_date]
+    epoch = date(1970, 1, 1)
+    window = series.between((start_date - epoch).days * 86400, ((end_date - epoch).days + 1) * 86400)
+    # rows already stored for this snapshot (e.g. by the write-back) are kept as they are; the
+    # cached series has no provider items, so new rows get their payloads from the write-back
+    forecast_store.store(db, location, provider, window)
+    return len(window)
 
 
 @router.post("/requests", status_code=201)
@@ -145,15 +337,23 @@ async def create_request(body: CreateRequestBody, wx: WeatherService = Depends(g
         lat, lon = body.lat, body.lon
         place = await geo.resolve_place_from_coords(lat, lon)
 
-    # Run DB create operations in threadpool
-    provider = await run_in_threadpool(db_get_or_create_provider, db, "openweather", "https://api.openweathermap.org/data/2.5")
-    location = await run_in_threadpool(db_get_or_create_location, db, lat, lon, place)
+    # Fetch data from upstream; the router decides which provider answered
+    series = await wx.fetch_data(lat, lon)
+    # a series served from stored snapshots may name a provider no longer configured
+    source = wx.router.get(series.provider)
 
-    # Fetch data from upstream
-    data = await wx.fetch_data(lat, lon)
+    # Forecasts are stored against the tile center so nearby requests share rows;
+    # the user's point is kept in query_raw.
+    tile = tile_scheme.tile_for(lat, lon)
+
+    # Run DB create operations in threadpool
+    provider = await run_in_threadpool(identity.resolve_provider, db, series.provider, source.base_url if source is not None else None)
+    location = await run_in_threadpool(identity.resolve_location, db, tile.lat, tile.lon, place)
+    if body.q:
+        await run_in_threadpool(db_add_location_alias, db, location, body.q)
 
     # store forecasts in DB (sync)
-    stored = await run_in_threadpool(db_store_forecasts, db, location, provider, data, body.start_date, body.end_date)
+    stored = await run_in_threadpool(db_store_forecasts, db, location, provider, series, body.start_date, body.end_date)
 
     # create request record
     req = await run_in_threadpool(
@@ -167,6 +367,7 @@ async def create_request(body: CreateRequestBody, wx: WeatherService = Depends(g
         body.end_date,
         body.granularity,
     )
+    location_index.bump(location.id)
 
     return {"request_id": req.id, "forecasts_stored": stored}
 
@@ -241,7 +442,9 @@ async def create_favorite(body: FavoriteBody, geo: GeoService = Depends(get_geoc
         lat, lon = body.lat, body.lon
         place = await geo.resolve_place_from_coords(lat, lon)
 
-    location = await run_in_threadpool(db_get_or_create_location, db, lat, lon, place)
+    location = await run_in_threadpool(identity.resolve_location, db, lat, lon, place)
+    if body.q:
+        await run_in_threadpool(db_add_location_alias, db, location, body.q)
 
     def _create(db: Session):
         existing = db.query(Favorite).filter(Favorite.location_id == location.id, Favorite.user_id == None).first()
@@ -317,36 +520,150 @@ class ForecastFilter(BaseModel):
     end_date: Optional[date] = None
 
 
+# columns /forecasts can return, and the ones it returns without ``fields``
+FORECAST_FIELDS = tuple(c.name for c in WeatherForecast.__table__.columns if c.name not in ("payload_raw", "payload_hash"))
+FORECAST_DEFAULT_FIELDS = ("id", "location_id", "forecast_time", "temperature_c", "humidity_pct", "kind")
+
+
+def _wire_type(column) -> str:
+    if isinstance(column.type, DateTime):
+        return wire.TIMESTAMP
+    if isinstance(column.type, Numeric):
+        return wire.FLOAT
+    if isinstance(column.type, Integer):
+        return wire.INTEGER
+    return wire.STRING
+
+
 @router.get("/forecasts")
 async def list_forecasts(
     location_id: Optional[str] = Query(None),
     start_date: Optional[date] = Query(None),
     end_date: Optional[date] = Query(None),
+    fields: Optional[str] = Query(None, description="Comma separated columns; default: " + ", ".join(FORECAST_DEFAULT_FIELDS)),
+    accept: Optional[str] = Header(None),
     db: Session = Depends(get_db),
 ):
+    '''Stored forecast rows, oldest first, at most 1000.
+
+    JSON carries numbers as strings (they are stored as decimals);
+    MessagePack and Arrow carry them as floats and times as ISO strings and
+    timestamps respectively. Only the requested columns are selected.
+    '''
+    media = wire.negotiate(accept, tabular=True)
+    names = wire.parse_fields(fields, FORECAST_FIELDS) or list(FORECAST_DEFAULT_FIELDS)
+    columns = [WeatherForecast.__table__.c[name] for name in names]
+
     def _list(db: Session):
-        q = db.query(WeatherForecast)
+        stmt = select(*columns)
         if location_id:
-            q = q.filter(WeatherForecast.location_id == location_id)
+            stmt = stmt.where(WeatherForecast.location_id == location_id)
         if start_date:
-            q = q.filter(WeatherForecast.forecast_time >= start_date)
+            stmt = stmt.where(WeatherForecast.forecast_time >= start_date)
         if end_date:
             # include the full end day
-            q = q.filter(WeatherForecast.forecast_time < (end_date + timedelta(days=1)))
-        rows = q.order_by(WeatherForecast.forecast_time.asc()).limit(1000).all()
-        return [
-            {
-                "id": f.id,
-                "location_id": f.location_id,
-                "forecast_time": f.forecast_time.isoformat(),
-                "temperature_c": (str(f.temperature_c) if f.temperature_c is not None else None),
-                "humidity_pct": (str(f.humidity_pct) if f.humidity_pct is not None else None),
-                "kind": f.kind,
-            }
-            for f in rows
-        ]
+            stmt = stmt.where(WeatherForecast.forecast_time < (end_date + timedelta(days=1)))
+        return db.execute(stmt.order_by(WeatherForecast.forecast_time.asc()).limit(1000)).all()
+
+    rows = await run_in_threadpool(_list, db)
+    types = {c.name: _wire_type(c) for c in columns}
+
+    def _as(text_numbers: bool):
+        def value(v):
+            if isinstance(v, datetime):
+                return v.isoformat()
+            if isinstance(v, Decimal):
+                return str(v) if text_numbers else float(v)
+            return v
+        return [{name: value(v) for name, v in zip(names, row)} for row in rows]
+
+    def _table():
+        data = {}
+        for i, name in enumerate(names):
+            values = [row[i] for row in rows]
+            if types[name] == wire.FLOAT:
+                values = [None if v is None else float(v) for v in values]
+            data[name] = values
+        return wire.Table(data, types)
+
+    return wire.respond(media, lambda: _as(True), table=_table, binary_payload=lambda: _as(False))
+
+
+@router.get("/forecasts/{forecast_id}/payload")
+async def get_forecast_payload(forecast_id: str, db: Session = Depends(get_db)):
+    '''Provider item a forecast row was stored from, as the provider sent it; null if none was kept.'''
+    def _get(db: Session):
+        f = db.get(WeatherForecast, forecast_id)
+        if not f:
+            raise HTTPException(status_code=404, detail="Forecast not found")
+        if f.payload_hash:
+            return payload_store.load(db, f.payload_hash)
+        return json.loads(f.payload_raw) if f.payload_raw else None
 
-    return await run_in_threadpool(_list, db)
+    return await run_in_threadpool(_get, db)
+
+
+@router.get("/ensemble")
+async def ensemble(
+    location_id: List[str] = Query(..., description="Repeat for multiple locations"),
+    variables: Optional[str] = Query(None, description="Comma separated subset of forecast columns"),
+    accept: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    '''Blend the latest stored snapshot of every provider per location on a common 3-hour grid.'''
+    media = wire.negotiate(accept)
+    if len(location_id) > 1000:
+        raise HTTPException(status_code=400, detail="at most 1000 locations per call")
+    names = [v.strip() for v in variables.split(",") if v.strip()] if variables else list(ensemble_service.VARIABLES)
+    unknown = [v for v in names if v not in ensemble_service.VARIABLES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown variables: {', '.join(unknown)}")
+    out = await run_in_threadpool(ensemble_service.ensemble, db, location_id, names)
+    # already plain JSON types; skip FastAPI's recursive encoder for large payloads
+    return wire.respond(media, lambda: out)
+
+
+@router.get("/series/{location_id}")
+async def resampled_series(
+    location_id: str,
+    start: datetime = Query(..., description="UTC, inclusive"),
+    end: datetime = Query(..., description="UTC, exclusive"),
+    bucket: str = Query("1d", pattern=resample_service.BUCKET_PATTERN, description="e.g. 3h, 1d, 1w, 1mo"),
+    agg: str = Query("min,max,mean", description="Comma separated: min, max, mean, sum, count, p0-p100"),
+    fields: str = Query("temperature_c", description="Comma separated numeric columns"),
+    source: str = Query("observations", pattern="^(" + "|".join(resample_service.SOURCES) + ")$"),
+    provider: Optional[str] = Query(None, description="Only rows from this provider"),
+    accept: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+):
+    '''Aggregate stored observations or forecasts per time bucket, computed by the database.
+
+    In Arrow, each ``values[field][aggregate]`` list is a ``field.aggregate``
+    column next to ``time`` and ``count``; the echoed request is schema metadata.
+    '''
+    media = wire.negotiate(accept, tabular=True)
+    try:
+        spec = resample_service.parse_bucket(bucket)
+        aggregates = resample_service.parse_aggregates(agg)
+        names = resample_service.parse_fields(source, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    start, end = resample_service.naive_utc(start), resample_service.naive_utc(end)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if resample_service.max_buckets(start, end, spec) > settings.series_max_buckets:
+        raise HTTPException(status_code=400, detail=f"range spans more than {settings.series_max_buckets} buckets; use a larger bucket")
+
+    def _series(db: Session):
+        if db.get(Location, location_id) is None:
+            raise HTTPException(status_code=404, detail="Location not found")
+        try:
+            return resample_service.resample(db, location_id, source, spec, aggregates, names, start, end, provider)
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    out = await run_in_threadpool(_series, db)
+    return wire.respond(media, lambda: out, table=lambda: resample_service.as_table(out))
 
 
 class UpdateForecastBody(BaseModel):
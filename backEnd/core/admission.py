@@ -0,0 +1,317 @@
+"""Admission control: refuse work early instead of timing all of it out.
+
+Every request is put in a class by method and path (``ROUTE_CLASSES``):
+
+- ``cached``: cheap reads answered from memory, including summaries whose
+  forecast tile and geocode are already cached (see ``warm`` below);
+- ``upstream``: reads that may wait on a provider (cold summaries, grids);
+- ``db``: stored-data reads and every write, which hold a threadpool
+  thread and a database connection.
+
+Each class has its own concurrency limit, so cold upstream-bound requests
+cannot crowd cached ones out. ``ADMISSION_LIMITS`` caps it; below that it
+shrinks while the class's service time is inflated by contention and grows
+back when it recovers (``RouteClass``). A request over its
+class's limit waits in that class's queue, revalidations (``If-None-Match``
+on the frontend pages, the only routes that answer 304) ahead of the rest.
+Its wait is estimated as the requests ahead of it times the class's average
+service time over its limit; when that exceeds ``ADMISSION_MAX_WAIT`` it is refused
+at once with 503 and ``Retry-After``, and a request still queued when the
+deadline passes is refused the same way. Admitted requests therefore run in
+about the time they would unloaded, and past saturation the app keeps
+completing requests at capacity instead of letting every request's latency
+grow until all of them time out.
+
+With ``ADMISSION_CLIENT_RATE`` set, each client (its address, or the first
+``X-Forwarded-For`` hop with ``ADMISSION_TRUST_FORWARDED``) also has a token
+bucket of that many requests per second; a client that runs dry gets 429
+with ``Retry-After``.
+
+The SSE stream, batch geocoding, admin, docs and /metrics bypass admission.
+"""
+
+import asyncio
+import heapq
+import json
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+from starlette.datastructures import Headers, QueryParams
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from core.config import settings
+from core.metrics import REGISTRY, Counter, Gauge
+
+CLASSES = ("cached", "upstream", "db")
+
+# (methods or None for any, path pattern, class or None to bypass admission); first match wins
+ROUTE_CLASSES: Tuple[Tuple[Optional[Tuple[str, ...]], str, Optional[str]], ...] = (
+    (None, r"^/api/weather/stream$", None),
+    (None, r"^/api/admin/", None),
+    # long-running; its upstream calls are bounded by GEOCODE_BATCH_CONCURRENCY and GEOCODE_RATE_LIMIT instead
+    (("POST",), r"^/api/weather/geocode/batch$", None),
+    (None, r"^/(metrics|docs|redoc|openapi\.json)$", None),
+    (("GET", "HEAD"), r"^/api/weather/(summary|grid)$", "upstream"),
+    (("GET", "HEAD"), r"^/api/weather/(providers|tiles/stats|locations/suggest)$", "cached"),
+    (None, r"^/api/", "db"),
+)
+DEFAULT_CLASS = "cached"
+# routes that check If-None-Match and can answer 304; elsewhere the header buys no priority
+_REVALIDATED = re.compile(r"^/$|^/(?!api/).+\.html$")
+# service-time estimate (seconds) before the first request finishes
+_INITIAL_SERVICE_TIME = 0.1
+# weight of each new sample in the recent service time
+_SMOOTHING = 0.1
+# growth per request of the unloaded service-time estimate
+_BASE_DRIFT = 1.0002
+# recent service time may reach this multiple of the unloaded one before the limit shrinks
+_TOLERANCE = 2.0
+_MAX_CLIENTS = 10_000
+
+ADMISSIONS: Counter = REGISTRY.register(Counter(
+    "admission_requests_total", "Requests by admission class and outcome.", ("class", "result"),
+))
+
+
+def parse_limits(raw: str) -> Dict[str, int]:
+    """``"cached=512,upstream=64,db=32"`` -> {class: limit}."""
+    limits: Dict[str, int] = {}
+    for part in raw.split(","):
+        if not part.strip():
+            continue
+        name, _, value = part.partition("=")
+        name = name.strip()
+        if name not in CLASSES:
+            raise ValueError(f"unknown admission class {name!r}; use {', '.join(CLASSES)}")
+        limits[name] = int(value)
+        if limits[name] < 1:
+            raise ValueError(f"admission limit for {name} must be at least 1")
+    return limits
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, rate: float, burst: float, now: float) -> float:
+        """Spend a token; return 0, or the seconds until one is available."""
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class ClientLimiter:
+    """Token buckets for the most recently seen clients."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = _MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def check(self, client: str) -> float:
+        now = time.monotonic()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = TokenBucket(self.burst, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+        return bucket.take(self.rate, self.burst, now)
+
+
+class RouteClass:
+    """An adaptive concurrency limit with a priority queue in front of it.
+
+    The limit follows the ratio of the unloaded service time (the fastest
+    request seen lately) to the recent average: when requests take much longer
+    than they do unloaded, the class is running more at once than the
+    machine can serve, so the limit shrinks (never below 1) and the excess
+    queues or is shed; when they speed up it grows back by about its
+    square root per request, up to ``max_limit``.
+
+    Runs on the event loop only, so the counters need no lock.
+    """
+
+    def __init__(self, name: str, max_limit: int, max_wait: float):
+        self.name = name
+        self.max_limit = max_limit
+        # start low and grow, so a burst at startup cannot flood the class before it has measured anything
+        self.limit = math.sqrt(max_limit)
+        self.max_wait = max_wait
+        self.in_flight = 0
+        # recent average service time, and the fastest request seen lately
+        self.service_time = _INITIAL_SERVICE_TIME
+        self._base_time: Optional[float] = None
+        # queued requests per priority (0 before 1)
+        self.waiting = [0, 0]
+        self._queue: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = 0
+
+    def estimated_wait(self, priority: int) -> float:
+        ahead = self.waiting[0] if priority == 0 else sum(self.waiting)
+        return (ahead + 1) * self.service_time / self.limit
+
+    async def acquire(self, priority: int) -> Tuple[bool, float]:
+        """Take a slot, waiting if it is worth it; ``(admitted, estimated wait)``."""
+        if not any(self.waiting):
+            # entries left by waiters that gave up
+            self._queue.clear()
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                return True, 0.0
+        estimate = self.estimated_wait(priority)
+        if estimate > self.max_wait:
+            return False, estimate
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        self._seq += 1
+        heapq.heappush(self._queue, (priority, self._seq, granted))
+        self.waiting[priority] += 1
+        expire = loop.call_later(self.max_wait, lambda: granted.done() or granted.set_result(False))
+        try:
+            return await granted, estimate
+        except asyncio.CancelledError:
+            # the client went away; hand on a slot it was given in the meantime
+            if granted.done() and not granted.cancelled() and granted.result():
+                self.release()
+            raise
+        finally:
+            expire.cancel()
+            self.waiting[priority] -= 1
+
+    def _hand_on(self) -> bool:
+        """Give a slot to the first live waiter; False if there is none."""
+        while self._queue:
+            _, _, waiter = heapq.heappop(self._queue)
+            if not waiter.done():
+                waiter.set_result(True)
+                return True
+        return False
+
+    def release(self) -> None:
+        """Pass the slot on, or free it if the limit has dropped below what is in flight."""
+        if self.in_flight > self.limit or not self._hand_on():
+            self.in_flight -= 1
+
+    def observe(self, seconds: float) -> None:
+        """Feed a finished request's service time into the averages and the limit."""
+        if self._base_time is None:
+            self.service_time = self._base_time = seconds
+        self.service_time += _SMOOTHING * (seconds - self.service_time)
+        # the fastest request seen, creeping up so it can follow a real slowdown
+        self._base_time = min(self._base_time * _BASE_DRIFT, seconds)
+        gradient = max(0.5, min(1.0, _TOLERANCE * self._base_time / self.service_time))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = max(1.0, min(float(self.max_limit), 0.8 * self.limit + 0.2 * target))
+        while self.in_flight < self.limit and self._hand_on():
+            self.in_flight += 1
+
+
+class AdmissionController:
+    def __init__(self, limits: Mapping[str, int], max_wait: float, client_rate: float, client_burst: float, trust_forwarded: bool):
+        self.classes = {name: RouteClass(name, limits.get(name, 64), max_wait) for name in CLASSES}
+        self.clients = ClientLimiter(client_rate, client_burst) if client_rate > 0 else None
+        self.trust_forwarded = trust_forwarded
+        self._rules = [(methods, re.compile(pattern), name) for methods, pattern, name in ROUTE_CLASSES]
+
+    def classify(self, method: str, path: str) -> Optional[RouteClass]:
+        """The request's class, or None if it bypasses admission."""
+        for methods, pattern, name in self._rules:
+            if (methods is None or method in methods) and pattern.search(path):
+                return None if name is None else self.classes[name]
+        return self.classes[DEFAULT_CLASS]
+
+    def client_key(self, scope: Scope, headers: Headers) -> str:
+        if self.trust_forwarded:
+            forwarded = headers.get("x-forwarded-for")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    def samples(self):
+        for route_class in self.classes.values():
+            yield (route_class.name, "in_flight"), route_class.in_flight
+            yield (route_class.name, "waiting"), sum(route_class.waiting)
+            yield (route_class.name, "limit"), route_class.limit
+            yield (route_class.name, "max_limit"), route_class.max_limit
+            yield (route_class.name, "service_seconds"), route_class.service_time
+
+
+async def _refuse(send: Send, status: int, detail: str, retry_after: float) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying an ``AdmissionController``.
+
+    ``warm(path, query)`` says whether an ``upstream`` request can be
+    answered from cache; such requests are admitted as ``cached``.
+    """
+
+    def __init__(self, app: ASGIApp, controller: "AdmissionController", warm: Optional[Callable[[str, QueryParams], bool]] = None):
+        self.app = app
+        self.controller = controller
+        self.warm = warm
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route_class = self.controller.classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if self.controller.clients is not None:
+            wait = self.controller.clients.check(self.controller.client_key(scope, headers))
+            if wait:
+                ADMISSIONS.labels(route_class.name, "throttled").inc()
+                await _refuse(send, 429, "too many requests", wait)
+                return
+        if route_class.name == "upstream" and self.warm is not None and self.warm(scope["path"], QueryParams(scope.get("query_string", b""))):
+            route_class = self.controller.classes["cached"]
+        priority = 0 if "if-none-match" in headers and _REVALIDATED.search(scope["path"]) else 1
+        admitted, estimate = await route_class.acquire(priority)
+        if not admitted:
+            ADMISSIONS.labels(route_class.name, "shed").inc()
+            await _refuse(send, 503, "server busy, retry later", max(estimate, route_class.service_time))
+            return
+        ADMISSIONS.labels(route_class.name, "admitted").inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route_class.release()
+            route_class.observe(time.perf_counter() - started)
+
+
+controller = AdmissionController(
+    parse_limits(settings.admission_limits),
+    settings.admission_max_wait,
+    settings.admission_client_rate,
+    settings.admission_client_burst,
+    settings.admission_trust_forwarded,
+)
+REGISTRY.register(Gauge("admission_slots", "Admission slots and queues per class.", ("class", "state"), collect=controller.samples))
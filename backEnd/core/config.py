@@ -8,6 +8,96 @@ class Settings(BaseSettings):
     default_lat: float = Field(47.6061, env = "DEFAULT_LAT")
     default_lon: float = Field(-122.3328, env = "DEFAULT_LON")
     units: str = Field("metric", env="WEATHER_UNITS")
+    # Upstream base URLs; point these at tools/owm_emulator.py for load tests
+    forecast_base_url: str = Field("https://api.openweathermap.org/data/2.5", env="FORECAST_BASE_URL")
+    geo_base_url: str = Field("http://api.openweathermap.org/geo/1.0", env="GEO_BASE_URL")
+    open_meteo_base_url: str = Field("https://api.open-meteo.com/v1", env="OPEN_METEO_BASE_URL")
+    # Comma separated forecast providers in preference order
+    forecast_providers: str = Field("openweather", env="FORECAST_PROVIDERS")
+    # "fallback" tries providers in order; "race" takes the fastest healthy response
+    provider_strategy: str = Field("fallback", env="PROVIDER_STRATEGY")
+    # Per-provider deadline (seconds) before racing/falling back moves on
+    provider_timeout: float = Field(4.0, env="PROVIDER_TIMEOUT")
+    # Forecast cache tiling: "grid" (fixed degrees), "geohash" or "none" (exact point)
+    tile_scheme: str = Field("grid", env="TILE_SCHEME")
+    tile_size_deg: float = Field(0.05, env="TILE_SIZE_DEG")
+    geohash_precision: int = Field(5, env="GEOHASH_PRECISION")
+    forecast_cache_ttl: float = Field(600.0, env="FORECAST_CACHE_TTL")
+    forecast_cache_max_entries: int = Field(5000, env="FORECAST_CACHE_MAX_ENTRIES")
+    # Stored snapshots younger than this (seconds) answer cache misses without going upstream; 0 disables
+    forecast_db_max_age: float = Field(1800.0, env="FORECAST_DB_MAX_AGE")
+    # ...provided they still reach this many hours ahead
+    forecast_db_min_hours: float = Field(96.0, env="FORECAST_DB_MIN_HOURS")
+    # Store every upstream forecast in the background so the DB tier sees it
+    forecast_write_back: bool = Field(True, env="FORECAST_WRITE_BACK")
+    forecast_write_back_queue: int = Field(256, env="FORECAST_WRITE_BACK_QUEUE")
+    # Cache shared between workers: "local" (per worker), "sqlite" or "redis"
+    cache_backend: str = Field("local", env="CACHE_BACKEND")
+    # SQLite file path or redis://host:port/db for the shared cache
+    cache_url: str = Field("", env="CACHE_URL")
+    # Prefix for shared cache keys; change it to invalidate every shared entry
+    cache_namespace: str = Field("wa1", env="CACHE_NAMESPACE")
+    # Seconds a worker waits for another worker's in-flight fill before fetching itself
+    cache_fill_wait: float = Field(5.0, env="CACHE_FILL_WAIT")
+    geocode_cache_ttl: float = Field(86400.0, env="GEOCODE_CACHE_TTL")
+    # Upstream geocoding calls per second per worker, shared by all lookups (0 = unlimited), and the burst allowed
+    geocode_rate_limit: float = Field(0.0, env="GEOCODE_RATE_LIMIT")
+    geocode_rate_burst: int = Field(10, env="GEOCODE_RATE_BURST")
+    # Batch geocoding: queries per call, and upstream lookups in flight per worker across all batches
+    geocode_batch_max_items: int = Field(10000, env="GEOCODE_BATCH_MAX_ITEMS")
+    geocode_batch_concurrency: int = Field(8, env="GEOCODE_BATCH_CONCURRENCY")
+    # Directory for forecast/geocode cache snapshots restored on startup ("" disables); written every interval seconds and on shutdown
+    cache_snapshot_dir: str = Field("", env="CACHE_SNAPSHOT_DIR")
+    cache_snapshot_interval: float = Field(300.0, env="CACHE_SNAPSHOT_INTERVAL")
+    # /api/weather/grid limits: raster side, tiles per bbox, concurrent fetches, seconds
+    grid_max_pixels: int = Field(512, env="GRID_MAX_PIXELS")
+    grid_max_tiles: int = Field(256, env="GRID_MAX_TILES")
+    grid_fetch_concurrency: int = Field(8, env="GRID_FETCH_CONCURRENCY")
+    grid_fetch_budget: float = Field(5.0, env="GRID_FETCH_BUDGET")
+    # /api/weather/series: most buckets one response may span
+    series_max_buckets: int = Field(5000, env="SERIES_MAX_BUCKETS")
+    # Climatology normals: ±days pooled around each date, fewest observations for a z-score, cache of per-location arrays
+    climatology_window_days: int = Field(7, env="CLIMATOLOGY_WINDOW_DAYS")
+    climatology_min_samples: int = Field(30, env="CLIMATOLOGY_MIN_SAMPLES")
+    climatology_cache_ttl: float = Field(3600.0, env="CLIMATOLOGY_CACHE_TTL")
+    climatology_cache_max_entries: int = Field(2000, env="CLIMATOLOGY_CACHE_MAX_ENTRIES")
+    # Admission control (core/admission.py): concurrency per route class, longest queue wait before 503 (seconds),
+    # per-client requests/second (0 disables) and burst, and whether to key clients by X-Forwarded-For
+    admission_enabled: bool = Field(True, env="ADMISSION_ENABLED")
+    admission_limits: str = Field("cached=512,upstream=64,db=32", env="ADMISSION_LIMITS")
+    admission_max_wait: float = Field(1.0, env="ADMISSION_MAX_WAIT")
+    admission_client_rate: float = Field(0.0, env="ADMISSION_CLIENT_RATE")
+    admission_client_burst: float = Field(20.0, env="ADMISSION_CLIENT_BURST")
+    admission_trust_forwarded: bool = Field(False, env="ADMISSION_TRUST_FORWARDED")
+    # Server-Sent Events push: locations per connection, keepalive and refresh cadence (seconds)
+    push_max_locations: int = Field(25, env="PUSH_MAX_LOCATIONS")
+    push_keepalive: float = Field(15.0, env="PUSH_KEEPALIVE")
+    push_refresh_check: float = Field(30.0, env="PUSH_REFRESH_CHECK")
+    push_refresh_concurrency: int = Field(8, env="PUSH_REFRESH_CONCURRENCY")
+    # Forecast/observation retention (see services/retention.py); runs every retention_interval seconds
+    retention_enabled: bool = Field(False, env="RETENTION_ENABLED")
+    retention_interval: float = Field(3600.0, env="RETENTION_INTERVAL")
+    # Keep every snapshot this many days, then one per lead bucket until retention_bucket_days, then daily rollups
+    retention_full_days: int = Field(7, env="RETENTION_FULL_DAYS")
+    retention_bucket_days: int = Field(30, env="RETENTION_BUCKET_DAYS")
+    # Upper bounds (hours of lead time) of the snapshot buckets kept in the middle tier
+    retention_lead_buckets: str = Field("6,12,24,48,72,120", env="RETENTION_LEAD_BUCKETS")
+    # Delete daily rollups / observations older than this many days; 0 keeps them forever
+    retention_max_days: int = Field(365, env="RETENTION_MAX_DAYS")
+    retention_observation_days: int = Field(365, env="RETENTION_OBSERVATION_DAYS")
+    # Rows per delete transaction and pause between them (seconds)
+    retention_batch_size: int = Field(500, env="RETENTION_BATCH_SIZE")
+    retention_batch_pause: float = Field(0.01, env="RETENTION_BATCH_PAUSE")
+    # SQLite pages released per pass in incremental auto-vacuum mode
+    retention_vacuum_pages: int = Field(2000, env="RETENTION_VACUUM_PAGES")
+    # Postgres: monthly partitions to create ahead of the current month
+    partition_months_ahead: int = Field(2, env="PARTITION_MONTHS_AHEAD")
+    # Serve this frontend directory from / and /static ("" disables); assets are fingerprinted and
+    # precompressed into frontend_build_dir at startup ("" uses a new temporary directory)
+    frontend_dir: str = Field("", env="FRONTEND_DIR")
+    frontend_build_dir: str = Field("", env="FRONTEND_BUILD_DIR")
+    # Shared secret for /api/admin endpoints; admin routes are disabled when empty
+    admin_token: str = Field("", env="ADMIN_TOKEN")
     class Config:
         env_file = ".env"
         case_sensitive = False
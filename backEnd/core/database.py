@@ -1,8 +1,9 @@
-from typing import Generator, Optional
+from typing import Any, Dict, Generator, List, Optional, Sequence
 import logging
 import os
 import shutil
 from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, Session, declarative_base
 
 """
@@ -89,3 +90,37 @@ def get_db() -> Generator[Session, None, None]:
 	finally:
 		if db:
 			db.close()
+
+
+def insert_ignore(db: Session, model, rows: Sequence[Dict[str, Any]], index_elements: Sequence[str], returning: Sequence[Any] = ()) -> List[Any]:
+	"""Insert ``rows``, skipping any that hit the unique index on ``index_elements``.
+
+	Uses ``INSERT ... ON CONFLICT DO NOTHING`` where the dialect has it and
+	returns the ``returning`` columns of the rows actually inserted (empty when
+	``returning`` is not given or the database cannot return rows). Other
+	dialects insert row by row in savepoints. Runs in the caller's transaction.
+	"""
+	if not rows:
+		return []
+	dialect = db.get_bind().dialect
+	if dialect.name in ("postgresql", "sqlite"):
+		if dialect.name == "postgresql":
+			from sqlalchemy.dialects.postgresql import insert
+		else:
+			from sqlalchemy.dialects.sqlite import insert
+		stmt = insert(model).on_conflict_do_nothing(index_elements=list(index_elements))
+		if returning and dialect.insert_returning:
+			# executemany with RETURNING is batched into multi-row INSERTs by SQLAlchemy
+			return db.execute(stmt.returning(*returning), list(rows)).all()
+		db.execute(stmt, list(rows))
+		return []
+	inserted = []
+	for row in rows:
+		try:
+			with db.begin_nested():
+				db.execute(model.__table__.insert().values(row))
+		except IntegrityError:
+			continue
+		if returning:
+			inserted.append(tuple(row[col.key] for col in returning))
+	return inserted
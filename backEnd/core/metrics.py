@@ -0,0 +1,270 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+The hot path is kept lock-free: label children are created once (under a lock)
+and cached, after which ``observe``/``inc`` only do a bisect and a couple of
+in-place list updates. Under heavy thread contention an increment can
+occasionally be lost; that trade-off is accepted in exchange for not taking a
+lock per request.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core import timing
+
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+DB_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Return the (cached) child for the given label values."""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._new_child()
+                    self._children[values] = child
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(tuple(str(v) for v in values), child))
+        return lines
+
+    def _render_child(self, values: Tuple[str, ...], child) -> List[str]:
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # one slot per bound plus the +Inf overflow slot
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, values, child):
+        lines = []
+        counts = list(child.counts)
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Gauge whose samples are produced by a callback at render time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), collect: Optional[Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in (self.collect() if self.collect else ()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, tuple(values))} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_LATENCY: Histogram = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests by route.", ("method", "route", "status"),
+))
+UPSTREAM_LATENCY: Histogram = REGISTRY.register(Histogram(
+    "upstream_request_duration_seconds", "Latency of upstream API calls by endpoint and status.", ("endpoint", "status"),
+))
+DB_QUERY_LATENCY: Histogram = REGISTRY.register(Histogram(
+    "db_query_duration_seconds", "Duration of SQL statements by verb.", ("verb",), buckets=DB_BUCKETS,
+))
+CACHE_REQUESTS: Counter = REGISTRY.register(Counter(
+    "cache_requests_total", "Cache lookups by cache and result.", ("cache", "result"),
+))
+
+
+def _cache_ratios():
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), child in list(CACHE_REQUESTS._children.items()):
+        pair = totals.setdefault(cache, [0.0, 0.0])
+        pair[0 if result == "hit" else 1] += child.value
+    for cache, (hits, misses) in sorted(totals.items()):
+        if hits + misses:
+            yield (cache,), hits / (hits + misses)
+
+
+REGISTRY.register(Gauge("cache_hit_ratio", "Fraction of cache lookups that were hits.", ("cache",), collect=_cache_ratios))
+
+
+def _threadpool_samples():
+    try:
+        from anyio import to_thread
+
+        limiter = to_thread.current_default_thread_limiter()
+    except Exception:
+        return
+    yield ("in_use",), limiter.borrowed_tokens
+    yield ("capacity",), limiter.total_tokens
+    yield ("waiting",), limiter.statistics().tasks_waiting
+
+
+REGISTRY.register(Gauge("threadpool_tokens", "AnyIO worker threadpool usage.", ("state",), collect=_threadpool_samples))
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def observe_upstream(endpoint: str, status: str, seconds: float) -> None:
+    UPSTREAM_LATENCY.labels(endpoint, status).observe(seconds)
+
+
+_VERBS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+def instrument_engine(engine) -> None:
+    """Attach SQLAlchemy cursor events that time every statement."""
+    from sqlalchemy import event
+
+    children = {verb: DB_QUERY_LATENCY.labels(verb) for verb in _VERBS}
+    other = DB_QUERY_LATENCY.labels("OTHER")
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("_metrics_start")
+        if not stack:
+            return
+        elapsed = time.perf_counter() - stack.pop()
+        children.get(statement.lstrip()[:6].upper(), other).observe(elapsed)
+        timing.record("db", elapsed)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording request latency per matched route template."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_holder = [500]
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_LATENCY.labels(scope["method"], path, str(status_holder[0])).observe(time.perf_counter() - started)
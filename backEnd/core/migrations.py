@@ -0,0 +1,206 @@
+"""Versioned schema migrations.
+
+Each migration has an integer version and runs once per database, in its own
+transaction, recorded in ``schema_migrations``. Startup calls ``upgrade`` in
+place of a bare ``create_all`` so that databases created by older builds pick
+up the columns and indexes newer code expects (``create_all`` never alters a
+table that already exists).
+
+Migrations are written to be idempotent (``IF NOT EXISTS``, column checks),
+so a fresh database built from the current models records them as applied
+without doing any work. Several workers may start at once; the runner takes a
+write lock before checking what is applied so each migration runs once.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, Text, func, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from core.database import Base
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", Text, nullable=False),
+    Column("applied_at", DateTime, nullable=False, server_default=func.now()),
+)
+
+# arbitrary key for pg_advisory_xact_lock
+_PG_LOCK_KEY = 4_210_039
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+def _baseline(conn: Connection) -> None:
+    # only creates missing tables (and their indexes); existing ones are left alone
+    import models.model  # noqa: F401  registers the models on Base.metadata
+
+    Base.metadata.create_all(bind=conn)
+
+
+def _payload_hash(conn: Connection) -> None:
+    columns = {c["name"] for c in inspect(conn).get_columns("weather_forecasts")}
+    if "payload_hash" not in columns:
+        conn.execute(text("ALTER TABLE weather_forecasts ADD COLUMN payload_hash VARCHAR(64) REFERENCES payload_blobs (hash)"))
+    # retention looks up orphaned blobs through this index
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_weather_forecasts_payload_hash ON weather_forecasts (payload_hash)"))
+
+
+# tables that reference locations.id
+_LOCATION_REFS = ("location_aliases", "requests", "weather_forecasts", "weather_observations", "favorites")
+
+
+def _merge_duplicate_locations(conn: Connection) -> None:
+    """Fold locations sharing coordinates into the oldest row (by ``created_at``, then id) before the unique index."""
+    rows = conn.execute(text(
+        "SELECT l.id, l.latitude, l.longitude FROM locations l JOIN ("
+        " SELECT latitude, longitude FROM locations GROUP BY latitude, longitude HAVING COUNT(*) > 1"
+        ") d ON l.latitude = d.latitude AND l.longitude = d.longitude"
+        " ORDER BY l.latitude, l.longitude, l.created_at, l.id"
+    )).all()
+    keep: Dict[Tuple[Any, Any], str] = {}
+    params = []
+    for location_id, lat, lon in rows:
+        kept = keep.setdefault((lat, lon), location_id)
+        if kept != location_id:
+            params.append({"old": location_id, "keep": kept})
+    if not params:
+        return
+    for table in _LOCATION_REFS:
+        conn.execute(text(f"UPDATE {table} SET location_id = :keep WHERE location_id = :old"), params)
+    conn.execute(text("DELETE FROM locations WHERE id = :old"), params)
+    logger.warning("merged %d duplicate locations", len(params))
+
+
+def _delete_duplicates(conn: Connection, table: str, columns: str) -> None:
+    deleted = conn.execute(text(
+        f"DELETE FROM {table} WHERE id NOT IN (SELECT MIN(id) FROM {table} GROUP BY {columns})"
+    )).rowcount
+    if deleted:
+        logger.warning("removed %d duplicate rows from %s", deleted, table)
+
+
+# (name, table, columns, unique), matching db/db_schema.sql and models/model.py
+_INDEXES: Tuple[Tuple[str, str, str, bool], ...] = (
+    ("idx_users_email", "users", "email", False),
+    ("uq_locations_lat_lon", "locations", "latitude, longitude", True),
+    ("uq_locations_canonical", "locations", "canonical_name, country_code, admin1, admin2, postal_code", True),
+    ("idx_locations_canon", "locations", "canonical_name", False),
+    ("idx_locations_geo", "locations", "latitude, longitude", False),
+    ("uq_location_aliases_location_alias", "location_aliases", "location_id, alias", True),
+    ("idx_location_aliases_alias", "location_aliases", "alias", False),
+    ("idx_requests_loc_dates", "requests", "location_id, start_date, end_date", False),
+    ("idx_requests_user", "requests", "user_id", False),
+    ("idx_requests_status", "requests", "status", False),
+    ("idx_requests_created", "requests", "created_at", False),
+    ("uq_fc_loc_provider_kind_snap_time", "weather_forecasts", "location_id, provider_id, kind, snapshot_time, forecast_time", True),
+    ("idx_fc_loc_time", "weather_forecasts", "location_id, forecast_time", False),
+    ("idx_fc_loc_kind_snap", "weather_forecasts", "location_id, kind, snapshot_time", False),
+    ("idx_fc_time", "weather_forecasts", "forecast_time", False),
+    ("uq_obs_loc_provider_time", "weather_observations", "location_id, provider_id, observed_at", True),
+    ("idx_obs_loc_time", "weather_observations", "location_id, observed_at", False),
+    ("idx_obs_provider_time", "weather_observations", "provider_id, observed_at", False),
+    ("idx_obs_time", "weather_observations", "observed_at", False),
+    ("idx_favorites_loc_user", "favorites", "location_id, user_id", False),
+)
+
+
+def _schema_indexes(conn: Connection) -> None:
+    _merge_duplicate_locations(conn)
+    _delete_duplicates(conn, "location_aliases", "location_id, alias")
+    _delete_duplicates(conn, "weather_forecasts", "location_id, provider_id, kind, snapshot_time, forecast_time")
+    _delete_duplicates(conn, "weather_observations", "location_id, provider_id, observed_at")
+    for name, table, columns, unique in _INDEXES:
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        conn.execute(text(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+def _location_utc_offset(conn: Connection) -> None:
+    columns = {c["name"] for c in inspect(conn).get_columns("locations")}
+    if "utc_offset" not in columns:
+        conn.execute(text("ALTER TABLE locations ADD COLUMN utc_offset INTEGER"))
+
+
+# services.climatology.FIELDS when the table was introduced
+_CLIMATOLOGY_FIELDS = ("temperature_c", "humidity_pct", "wind_speed_ms")
+
+
+def _day_of_year_sql(dialect: str, column: str) -> str:
+    # day of year in a leap year, so Mar 1 is 61 whatever the year
+    if dialect == "postgresql":
+        return f"CAST(EXTRACT(DOY FROM make_date(2000, CAST(EXTRACT(MONTH FROM {column}) AS INT), CAST(EXTRACT(DAY FROM {column}) AS INT))) AS INT)"
+    return f"CAST(strftime('%j', '2000-' || strftime('%m-%d', {column})) AS INTEGER)"
+
+
+def _climatology(conn: Connection) -> None:
+    """Create the climatology table and seed it from the observations already stored."""
+    from models.model import ClimatologyStat
+
+    ClimatologyStat.__table__.create(bind=conn, checkfirst=True)
+    if conn.execute(text("SELECT 1 FROM climatology LIMIT 1")).first():
+        return
+    doy = _day_of_year_sql(conn.dialect.name, "observed_at")
+    for field in _CLIMATOLOGY_FIELDS:
+        # M2 from deviations about each group's own mean rather than sum(x^2) - n*mean^2
+        conn.execute(text(
+            "INSERT INTO climatology (location_id, field, day_of_year, count, mean, m2)"
+            f" SELECT location_id, '{field}', doy, COUNT(*), AVG(x), SUM((x - m) * (x - m)) FROM ("
+            f"  SELECT location_id, {doy} AS doy, CAST({field} AS DOUBLE PRECISION) AS x,"
+            f"  AVG(CAST({field} AS DOUBLE PRECISION)) OVER (PARTITION BY location_id, {doy}) AS m"
+            f"  FROM weather_observations WHERE {field} IS NOT NULL"
+            ") AS daily GROUP BY location_id, doy"
+        ))
+
+
+MIGRATIONS: Sequence[Migration] = (
+    Migration(1, "baseline tables", _baseline),
+    Migration(2, "weather_forecasts.payload_hash", _payload_hash),
+    Migration(3, "indexes and unique constraints from db_schema.sql", _schema_indexes),
+    Migration(4, "locations.utc_offset", _location_utc_offset),
+    Migration(5, "climatology baselines", _climatology),
+)
+
+
+def _lock(conn: Connection) -> None:
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _PG_LOCK_KEY})
+    elif conn.dialect.name == "sqlite":
+        # a write statement makes the driver BEGIN and SQLite take the RESERVED lock
+        conn.execute(text("DELETE FROM schema_migrations WHERE version < 0"))
+
+
+def applied_versions(engine: Engine) -> List[int]:
+    with engine.begin() as conn:
+        _metadata.create_all(bind=conn)
+        return list(conn.execute(select(schema_migrations.c.version).order_by(schema_migrations.c.version)).scalars())
+
+
+def upgrade(engine: Engine, target: int | None = None) -> List[int]:
+    """Apply pending migrations up to ``target`` (default: all); return the versions applied."""
+    applied_versions(engine)
+    done: List[int] = []
+    for migration in MIGRATIONS:
+        if target is not None and migration.version > target:
+            break
+        with engine.begin() as conn:
+            _lock(conn)
+            seen = conn.execute(select(schema_migrations.c.version).where(schema_migrations.c.version == migration.version)).first()
+            if seen:
+                continue
+            logger.info("applying migration %d: %s", migration.version, migration.name)
+            migration.apply(conn)
+            conn.execute(schema_migrations.insert().values(version=migration.version, name=migration.name))
+        done.append(migration.version)
+    return done
@@ -0,0 +1,64 @@
+"""Wall-clock sampling profiler producing collapsed stacks.
+
+Samples every thread's Python stack via ``sys._current_frames`` at a fixed
+interval and aggregates them into the "collapsed" format understood by
+flamegraph.pl, speedscope and similar tools (``frame;frame;frame count``).
+"""
+
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, max_depth: int = 128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample_once(self, names: Dict[int, str]) -> None:
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            depth = 0
+            while frame is not None and depth < self.max_depth:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+                depth += 1
+            stack.append(names.get(ident, f"thread-{ident}"))
+            stack.reverse()
+            self.samples[";".join(stack)] += 1
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            names = {t.ident: t.name for t in threading.enumerate() if t.ident is not None}
+            self._sample_once(names)
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+# Only one profile may run per worker at a time.
+profile_lock = threading.Lock()
+
@@ -0,0 +1,98 @@
+"""Per-request phase timing emitted as a ``Server-Timing`` header.
+
+Instrumented code calls :func:`record` (or uses :func:`span` / :func:`timed`)
+with a phase name such as ``geo``, ``forecast``, ``db``, ``build`` or
+``serialize``. Durations for the same phase are summed. When no request is
+being timed the calls reduce to a context variable lookup.
+"""
+
+import functools
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger("weather.timing")
+
+_spans: ContextVar[Optional[Dict[str, float]]] = ContextVar("server_timing_spans", default=None)
+
+
+def record(name: str, seconds: float) -> None:
+    """Add ``seconds`` to phase ``name`` for the current request, if any."""
+    spans = _spans.get()
+    if spans is not None:
+        spans[name] = spans.get(name, 0.0) + seconds
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def timed(name: str) -> Callable:
+    """Decorator recording the wall time of a sync function under ``name``."""
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+def format_header(spans: Dict[str, float], total: float) -> str:
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in spans.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+class ServerTimingMiddleware:
+    """Collect phase spans per request and expose them to the client and logs."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        spans: Dict[str, float] = {}
+        token = _spans.set(spans)
+        started = time.perf_counter()
+        status_holder = [500]
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", format_header(spans, time.perf_counter() - started))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _spans.reset(token)
+            if spans and logger.isEnabledFor(logging.INFO):
+                logger.info(json.dumps({
+                    "event": "request_timing",
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status_holder[0],
+                    "total_ms": round((time.perf_counter() - started) * 1000, 2),
+                    "spans_ms": {name: round(seconds * 1000, 2) for name, seconds in spans.items()},
+                }))
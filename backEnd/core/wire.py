@@ -0,0 +1,164 @@
+"""Response encodings chosen by the ``Accept`` header, and ``fields=`` projections.
+
+Endpoints that build plain dicts call :func:`negotiate` for the client's
+most preferred encoding this worker can produce, and hand the dict to
+:func:`respond`:
+
+- ``application/json`` (the default, and the answer to ``*/*``);
+- ``application/msgpack`` (also ``application/x-msgpack``), the same
+  document in MessagePack, if ``msgpack`` is installed;
+- ``application/vnd.apache.arrow.stream``, an Arrow IPC stream of one
+  record batch, for tabular endpoints only and if ``pyarrow`` is installed.
+
+Neither library is required: a worker without one simply never picks its
+encoding. A request that asks only for encodings the endpoint or worker
+cannot produce gets 406; one that names none of these types at all (say
+``text/plain``) gets JSON, as it always has. Responses carry ``Vary: Accept`` so caches keep the encodings apart.
+"""
+
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response
+
+from core.timing import span
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+_ALIASES = {"application/x-msgpack": MSGPACK, "application/vnd.msgpack": MSGPACK}
+
+# Arrow column types, by the names tabular endpoints use
+STRING, FLOAT, INTEGER, TIMESTAMP = "string", "float", "integer", "timestamp"
+
+_available: Dict[str, bool] = {}
+
+
+class Table(NamedTuple):
+    """Equal-length columns for Arrow, with a type name per column."""
+    columns: Mapping[str, Sequence[Any]]
+    types: Mapping[str, str]
+    metadata: Optional[Mapping[str, str]] = None
+
+
+def _importable(module: str) -> bool:
+    if module not in _available:
+        try:
+            __import__(module)
+            _available[module] = True
+        except ImportError:
+            _available[module] = False
+    return _available[module]
+
+
+def available(tabular: bool = False) -> List[str]:
+    """Encodings this worker can produce, JSON first."""
+    out = [JSON]
+    if _importable("msgpack"):
+        out.append(MSGPACK)
+    if tabular and _importable("pyarrow"):
+        out.append(ARROW)
+    return out
+
+
+def _accepted(accept: str) -> List[Tuple[str, float, int]]:
+    """``(media range, q, position)`` for each entry of an ``Accept`` header."""
+    ranges = []
+    for position, part in enumerate(accept.split(",")):
+        media, *params = [p.strip() for p in part.split(";")]
+        if not media:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges.append((_ALIASES.get(media.lower(), media.lower()), q, position))
+    return ranges
+
+
+def negotiate(accept: Optional[str], tabular: bool = False) -> str:
+    """The encoding to answer ``accept`` with; raises 406 if only unavailable binary ones are acceptable."""
+    offers = available(tabular)
+    if not accept:
+        return JSON
+    ranges = _accepted(accept)
+    refused = {media for media, q, _ in ranges if q <= 0}
+    best, best_key = None, None
+    for media, q, position in ranges:
+        if q <= 0:
+            continue
+        if media in ("*/*", "application/*"):
+            # a wildcard stands for the first offer not refused by name, and never outranks a named type with the same q
+            media = next((o for o in offers if o not in refused), None)
+            specificity = 0
+        elif media in offers:
+            specificity = 1
+        else:
+            continue
+        key = (q, specificity, -position)
+        if media is not None and (best_key is None or key > best_key):
+            best, best_key = media, key
+    if best is None:
+        if any(media in (MSGPACK, ARROW) for media, q, _ in ranges if q > 0):
+            raise HTTPException(status_code=406, detail=f"cannot produce {accept!r}; available: {', '.join(offers)}")
+        # nothing we encode was asked for: answer in JSON, as before negotiation existed
+        return JSON
+    return best
+
+
+def parse_fields(spec: Optional[str], allowed: Sequence[str]) -> Optional[List[str]]:
+    """``"a,b"`` -> ["a", "b"] in request order, or None for everything; raises 400 on unknown names."""
+    if spec is None:
+        return None
+    names = list(dict.fromkeys(f.strip() for f in spec.split(",") if f.strip()))
+    unknown = [f for f in names if f not in allowed]
+    if unknown or not names:
+        raise HTTPException(status_code=400, detail=f"unknown fields: {', '.join(unknown) or repr(spec)}; use {', '.join(allowed)}")
+    return names
+
+
+def _msgpack(payload: Any) -> bytes:
+    import msgpack
+
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def _arrow(table: Table) -> bytes:
+    import pyarrow as pa
+
+    columns, types, metadata = table
+    kinds = {STRING: pa.string(), FLOAT: pa.float64(), INTEGER: pa.int64(), TIMESTAMP: pa.timestamp("us")}
+    schema = pa.schema([pa.field(name, kinds[types[name]]) for name in columns], metadata=metadata)
+    batch = pa.record_batch([pa.array(values, type=field.type) for values, field in zip(columns.values(), schema)], schema=schema)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+def respond(
+    media: str,
+    payload: Callable[[], Any],
+    table: Optional[Callable[[], Table]] = None,
+    binary_payload: Optional[Callable[[], Any]] = None,
+) -> Response:
+    """Encode a response as ``media``, an encoding ``negotiate`` returned.
+
+    Endpoints negotiate before doing any work, so a 406 costs nothing.
+    ``payload()`` is the JSON document. Endpoints that can answer in Arrow
+    pass ``table()`` returning a ``Table``; ``binary_payload()``, if
+    given, replaces ``payload()`` for MessagePack, e.g. to send numbers
+    that JSON carries as strings as floats.
+    """
+    with span("serialize"):
+        if media == ARROW:
+            body = _arrow(table())
+        elif media == MSGPACK:
+            body = _msgpack((binary_payload or payload)())
+        else:
+            return JSONResponse(payload(), headers={"Vary": "Accept"})
+    return Response(body, media_type=media, headers={"Vary": "Accept"})
@@ -2,12 +2,28 @@
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 
-from api.routers import weather
-from core.database import engine, Base
+from api.routers import admin, frontend, weather
+from core.database import engine
+from core import admission, metrics, migrations
+from core.config import settings
+from core.timing import ServerTimingMiddleware
+from services.cache_snapshot import snapshots as cache_snapshots
+from services.forecast_store import write_back
+from services.frontend import bundle as frontend_bundle
+from services.geo_service import geocode_cache
+from services.push import hub as push_hub
+from services.retention import retention
+from services.shared_cache import shared_backend
+from services.weather_service import shared_forecasts
 
 app = FastAPI(title="Weather API")
 
+# Shed load with 503 + Retry-After before queues grow; innermost so refusals still get CORS headers and metrics.
+if settings.admission_enabled:
+    app.add_middleware(admission.AdmissionMiddleware, controller=admission.controller, warm=weather.summary_is_cached)
+
 # Enable CORS so the front end can call the API independently.
 app.add_middleware(
     CORSMiddleware,
@@ -17,14 +33,84 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Record per-route latency for /metrics.
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+# Per-phase Server-Timing header and structured timing log line.
+app.add_middleware(ServerTimingMiddleware)
+
+# Caches snapshotted to CACHE_SNAPSHOT_DIR so restarts start warm.
+cache_snapshots.register(shared_forecasts)
+cache_snapshots.register(geocode_cache)
+
 # Wire up API routers.
 app.include_router(weather.router)
+app.include_router(admin.router)
+# Ahead of the JSON root below, which answers / when the frontend is not served.
+if settings.frontend_dir:
+    app.include_router(frontend.router)
 
 
 @app.on_event("startup")
 def on_startup() -> None:
-    """Create database tables on startup during local development."""
-    Base.metadata.create_all(bind=engine)
+    """Create or upgrade the database schema."""
+    migrations.upgrade(engine)
+
+
+@app.on_event("startup")
+def build_frontend() -> None:
+    """Fingerprint and precompress the frontend assets."""
+    if settings.frontend_dir:
+        frontend_bundle.build(settings.frontend_dir, settings.frontend_build_dir)
+
+
+@app.on_event("startup")
+async def restore_cache_snapshots() -> None:
+    """Warm the forecast and geocode caches from the last snapshot, if any."""
+    if settings.cache_snapshot_dir:
+        cache_snapshots.restore()
+        cache_snapshots.start()
+
+
+@app.on_event("startup")
+async def start_push_refresher() -> None:
+    """Keep tiles with live SSE subscribers warm in the forecast cache."""
+    push_hub.start()
+
+
+@app.on_event("startup")
+async def start_retention() -> None:
+    """Periodically downsample and expire old forecast snapshots."""
+    if settings.retention_enabled:
+        retention.start()
+
+
+@app.on_event("shutdown")
+async def stop_push_refresher() -> None:
+    await push_hub.stop()
+
+
+@app.on_event("shutdown")
+async def stop_retention() -> None:
+    await retention.stop()
+
+
+@app.on_event("shutdown")
+async def flush_forecast_write_back() -> None:
+    """Store forecasts still queued for the database before exiting."""
+    await write_back.drain()
+
+
+@app.on_event("shutdown")
+async def save_cache_snapshots() -> None:
+    if settings.cache_snapshot_dir:
+        await cache_snapshots.stop()
+
+
+@app.on_event("shutdown")
+async def close_shared_cache() -> None:
+    if shared_backend is not None:
+        await shared_backend.close()
 
 
 @app.get("/")
@@ -32,4 +118,10 @@ async def root() -> dict[str, str]:
     return {"message": "Weather API is running", "docs": "/docs"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics() -> Response:
+    """Expose in-process metrics in the Prometheus text format."""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
 __all__ = ["app"]
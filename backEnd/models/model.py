@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime
 from sqlalchemy import (
-    Column, String, Text, Integer, Date, DateTime, Float, Numeric, ForeignKey, func
+    Column, String, Text, Integer, Date, DateTime, Float, Numeric, ForeignKey, Index, LargeBinary, func
 )
 from sqlalchemy.orm import relationship
 
@@ -15,10 +15,17 @@ def gen_uuid() -> str:
 # Simple ORM models for persistence. IDs are stored as strings for
 # cross-database portability in local dev; in production with Postgres you
 # can map to UUID types.
+#
+# Indexes mirror db/db_schema.sql and are named so that create_all and
+# core.migrations produce the same schema; unique constraints are declared
+# as unique indexes for the same reason.
 
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("idx_users_email", "email"),
+    )
     id = Column(String(36), primary_key=True, default=gen_uuid)
     email = Column(Text, unique=True, nullable=True)
     display_name = Column(Text, nullable=True)
@@ -38,6 +45,12 @@ class Provider(Base):
 
 class Location(Base):
     __tablename__ = "locations"
+    __table_args__ = (
+        Index("uq_locations_lat_lon", "latitude", "longitude", unique=True),
+        Index("uq_locations_canonical", "canonical_name", "country_code", "admin1", "admin2", "postal_code", unique=True),
+        Index("idx_locations_canon", "canonical_name"),
+        Index("idx_locations_geo", "latitude", "longitude"),
+    )
     id = Column(String(36), primary_key=True, default=gen_uuid)
     canonical_name = Column(Text, nullable=False)
     latitude = Column(Float, nullable=False)
@@ -48,12 +61,32 @@ class Location(Base):
     postal_code = Column(Text, nullable=True)
     landmark = Column(Text, nullable=True)
     tz_name = Column(Text, nullable=True)
+    # seconds east of UTC as reported with the last stored forecast
+    utc_offset = Column(Integer, nullable=True)
     created_at = Column(DateTime, nullable=False, server_default=func.now())
     updated_at = Column(DateTime, nullable=False, server_default=func.now(), onupdate=func.now())
 
 
+class LocationAlias(Base):
+    __tablename__ = "location_aliases"
+    __table_args__ = (
+        Index("uq_location_aliases_location_alias", "location_id", "alias", unique=True),
+        Index("idx_location_aliases_alias", "alias"),
+    )
+    id = Column(String(36), primary_key=True, default=gen_uuid)
+    location_id = Column(String(36), ForeignKey("locations.id"), nullable=False)
+    alias = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
 class Request(Base):
     __tablename__ = "requests"
+    __table_args__ = (
+        Index("idx_requests_loc_dates", "location_id", "start_date", "end_date"),
+        Index("idx_requests_user", "user_id"),
+        Index("idx_requests_status", "status"),
+        Index("idx_requests_created", "created_at"),
+    )
     id = Column(String(36), primary_key=True, default=gen_uuid)
     user_id = Column(String(36), ForeignKey("users.id"), nullable=True)
     location_id = Column(String(36), ForeignKey("locations.id"), nullable=False)
@@ -71,8 +104,32 @@ class Request(Base):
     provider = relationship("Provider")
 
 
+class PayloadDictionary(Base):
+    __tablename__ = "payload_dictionaries"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+class PayloadBlob(Base):
+    # raw provider payloads, keyed by the SHA-256 of their canonical JSON
+    __tablename__ = "payload_blobs"
+    hash = Column(String(64), primary_key=True)
+    dictionary_id = Column(Integer, ForeignKey("payload_dictionaries.id"), nullable=True)
+    raw_size = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
 class WeatherForecast(Base):
     __tablename__ = "weather_forecasts"
+    __table_args__ = (
+        Index("uq_fc_loc_provider_kind_snap_time", "location_id", "provider_id", "kind", "snapshot_time", "forecast_time", unique=True),
+        Index("idx_fc_loc_time", "location_id", "forecast_time"),
+        Index("idx_fc_loc_kind_snap", "location_id", "kind", "snapshot_time"),
+        Index("idx_fc_time", "forecast_time"),
+        Index("ix_weather_forecasts_payload_hash", "payload_hash"),
+    )
     id = Column(String(36), primary_key=True, default=gen_uuid)
     location_id = Column(String(36), ForeignKey("locations.id"), nullable=False)
     provider_id = Column(String(36), ForeignKey("providers.id"), nullable=False)
@@ -93,12 +150,20 @@ class WeatherForecast(Base):
     cloud_pct = Column(Numeric(5, 2), nullable=True)
     pop_pct = Column(Numeric(5, 2), nullable=True)
     weather_code = Column(Text, nullable=True)
+    # legacy inline JSON; new rows reference payload_blobs instead
     payload_raw = Column(Text, nullable=True)
+    payload_hash = Column(String(64), ForeignKey("payload_blobs.hash"), nullable=True)
     ingested_at = Column(DateTime, nullable=False, server_default=func.now())
 
 
 class WeatherObservation(Base):
     __tablename__ = "weather_observations"
+    __table_args__ = (
+        Index("uq_obs_loc_provider_time", "location_id", "provider_id", "observed_at", unique=True),
+        Index("idx_obs_loc_time", "location_id", "observed_at"),
+        Index("idx_obs_provider_time", "provider_id", "observed_at"),
+        Index("idx_obs_time", "observed_at"),
+    )
     id = Column(String(36), primary_key=True, default=gen_uuid)
     location_id = Column(String(36), ForeignKey("locations.id"), nullable=False)
     provider_id = Column(String(36), ForeignKey("providers.id"), nullable=False)
@@ -119,8 +184,22 @@ class WeatherObservation(Base):
     ingested_at = Column(DateTime, nullable=False, server_default=func.now())
 
 
+class ClimatologyStat(Base):
+    # running count/mean/M2 (Welford) of a location's observations on one day of the year
+    __tablename__ = "climatology"
+    location_id = Column(String(36), ForeignKey("locations.id"), primary_key=True)
+    field = Column(Text, primary_key=True)
+    day_of_year = Column(Integer, primary_key=True)  # 1-366, Feb 29 is always 60
+    count = Column(Integer, nullable=False)
+    mean = Column(Float, nullable=False)
+    m2 = Column(Float, nullable=False)
+
+
 class Favorite(Base):
     __tablename__ = "favorites"
+    __table_args__ = (
+        Index("idx_favorites_loc_user", "location_id", "user_id"),
+    )
     id = Column(String(36), primary_key=True, default=gen_uuid)
     user_id = Column(String(36), ForeignKey("users.id"), nullable=True)
     location_id = Column(String(36), ForeignKey("locations.id"), nullable=False)
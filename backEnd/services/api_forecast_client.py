@@ -1,18 +1,25 @@
+import time
 from typing import Optional, Dict, Any
 
 import httpx
 from fastapi import HTTPException
 from core.config import settings
+from core import timing
+from core.metrics import observe_upstream
 
 
 class ApiForecastClient:
 
-    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, name: str = "openweather"):
         """
         Simple OpenWeather forecast client.
+
+        ``name`` labels upstream metrics so other JSON forecast APIs can reuse
+        this client.
         """
         self.api_key = api_key
-        self.base_url = base_url or "https://api.openweathermap.org/data/2.5"
+        self.base_url = base_url or settings.forecast_base_url
+        self.name = name
 
     async def _make_request(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         url = f"{self.base_url}/{endpoint}"
@@ -22,14 +29,18 @@ class ApiForecastClient:
             params.setdefault("appid", self.api_key)
 
         timeout = httpx.Timeout(settings.api_timeout)
+        started = time.perf_counter()
+        status = "error"
 
         try:
             async with httpx.AsyncClient(timeout=timeout) as client:
                 response = await client.get(url, params=params)
+                status = str(response.status_code)
                 response.raise_for_status()
                 return response.json()
 
         except httpx.ReadTimeout:
+            status = "timeout"
             # propagate as HTTPException so FastAPI returns a 504
             raise HTTPException(status_code=504, detail="Upstream API request timed out")
         except httpx.HTTPStatusError as e:
@@ -38,3 +49,7 @@ class ApiForecastClient:
         except httpx.HTTPError as e:
             # catch other transport errors
             raise HTTPException(status_code=502, detail=f"Upstream API request failed: {str(e)}")
+        finally:
+            elapsed = time.perf_counter() - started
+            observe_upstream(f"{self.name}/{endpoint}", status, elapsed)
+            timing.record("forecast", elapsed)
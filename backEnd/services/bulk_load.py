@@ -0,0 +1,492 @@
+"""Streaming bulk loader for historical observations and forecasts.
+
+Records are read from CSV, NDJSON or Parquet in chunks of ``chunk_size``,
+so memory stays flat however large the input is. Each chunk is mapped onto
+the ``weather_observations`` or ``weather_forecasts`` columns, its points
+are resolved to locations in one batch (``identity.resolve_locations``) and
+the rows are written in one statement:
+
+- SQLite: one ``executemany`` of ``INSERT ... ON CONFLICT DO NOTHING``.
+- Postgres: ``COPY`` into a temporary staging table, then one
+  ``INSERT ... SELECT ... ON CONFLICT DO NOTHING`` into the target.
+- anything else: ``insert_ignore``.
+
+Rows that already exist (same location, provider and time) are skipped, so
+a chunk that was written but not checkpointed can safely be loaded again.
+After every committed chunk the number of input records consumed is saved
+to the checkpoint (when one is given); a later run with the same checkpoint
+skips that many records and carries on. Observations that are new are
+folded into the climatology statistics (``services.climatology.record``) in
+the same transaction.
+
+Source columns are matched by name (see ``ALIASES``); ``mapping`` overrides
+the match for individual target columns. Records without a usable
+position or time, and NDJSON lines that are not a JSON object, are counted
+as rejected rather than failing the load.
+"""
+
+import csv
+import io
+import json
+import logging
+import os
+import time
+from operator import itemgetter
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from core.database import insert_ignore
+from models.model import WeatherForecast, WeatherObservation, gen_uuid
+from services import climatology, identity
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson", "parquet")
+KINDS = ("observations", "forecasts")
+DEFAULT_CHUNK_SIZE = 20_000
+# negative: KiB rather than pages
+_SQLITE_CACHE_SIZE = -65_536
+
+# target column -> source names tried in order (case-insensitive)
+ALIASES: Dict[str, Tuple[str, ...]] = {
+    "lat": ("lat", "latitude"),
+    "lon": ("lon", "lng", "longitude"),
+    "name": ("name", "station", "station_name", "location"),
+    "observed_at": ("observed_at", "time", "timestamp", "datetime", "date", "dt"),
+    "forecast_time": ("forecast_time", "valid_time", "time", "timestamp", "dt"),
+    "snapshot_time": ("snapshot_time", "issued_at", "issue_time", "run_time"),
+    "kind": ("kind",),
+    "temperature_c": ("temperature_c", "temperature", "temp", "temp_c"),
+    "temp_min_c": ("temp_min_c", "temp_min"),
+    "temp_max_c": ("temp_max_c", "temp_max"),
+    "humidity_pct": ("humidity_pct", "humidity", "rh"),
+    "pressure_hpa": ("pressure_hpa", "pressure", "slp"),
+    "wind_speed_ms": ("wind_speed_ms", "wind_speed"),
+    "wind_gust_ms": ("wind_gust_ms", "wind_gust"),
+    "wind_deg": ("wind_deg", "wind_dir", "wind_direction"),
+    "precip_mm": ("precip_mm", "precipitation", "precip", "rain_3h"),
+    "snow_mm": ("snow_mm", "snow", "snow_3h"),
+    "cloud_pct": ("cloud_pct", "clouds", "cloud_cover"),
+    "pop_pct": ("pop_pct",),
+    "visibility_m": ("visibility_m", "visibility"),
+    "uv_index": ("uv_index", "uvi"),
+    "weather_code": ("weather_code", "code"),
+}
+
+
+class BulkLoadError(ValueError):
+    pass
+
+
+def _to_float(value: Any) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    number = float(value)
+    return None if number != number else number
+
+
+def _to_text(value: Any) -> Optional[str]:
+    return None if value is None or value == "" else str(value)
+
+
+def _to_time(value: Any) -> Optional[datetime]:
+    """Naive UTC datetime from ISO 8601 text, unix seconds or a datetime."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        moment = value
+    elif isinstance(value, (int, float)) or (isinstance(value, str) and value.lstrip("-").replace(".", "", 1).isdigit()):
+        return datetime.utcfromtimestamp(float(value))
+    else:
+        moment = datetime.fromisoformat(str(value))
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _memo(convert: Callable[[Any], Any], size: int = 65_536) -> Callable[[Any], Any]:
+    """``convert`` with its results remembered; timestamps repeat across stations."""
+    seen: Dict[Any, Any] = {}
+
+    def cached(value: Any) -> Any:
+        try:
+            return seen[value]
+        except KeyError:
+            pass
+        except TypeError:  # unhashable
+            return convert(value)
+        if len(seen) >= size:
+            seen.clear()
+        result = seen[value] = convert(value)
+        return result
+
+    return cached
+
+
+@dataclass(frozen=True)
+class Target:
+    model: Any
+    # columns of its unique index, for ON CONFLICT
+    key: Tuple[str, ...]
+    times: Tuple[str, ...]
+    values: Tuple[str, ...]
+    texts: Tuple[str, ...]
+    defaults: Tuple[Tuple[str, Any], ...] = ()
+
+
+TARGETS: Dict[str, Target] = {
+    "observations": Target(
+        WeatherObservation,
+        ("location_id", "provider_id", "observed_at"),
+        times=("observed_at",),
+        values=("temperature_c", "humidity_pct", "pressure_hpa", "wind_speed_ms", "wind_gust_ms", "wind_deg",
+                "precip_mm", "snow_mm", "cloud_pct", "visibility_m", "uv_index"),
+        texts=("weather_code",),
+    ),
+    "forecasts": Target(
+        WeatherForecast,
+        ("location_id", "provider_id", "kind", "snapshot_time", "forecast_time"),
+        times=("snapshot_time", "forecast_time"),
+        values=("temperature_c", "temp_min_c", "temp_max_c", "humidity_pct", "pressure_hpa", "wind_speed_ms",
+                "wind_gust_ms", "wind_deg", "precip_mm", "snow_mm", "cloud_pct", "pop_pct"),
+        texts=("kind", "weather_code"),
+        defaults=(("kind", "hourly"),),
+    ),
+}
+
+
+@dataclass
+class Progress:
+    records: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+    rows_per_second: float = 0.0
+    first_error: Optional[str] = None
+    done: bool = False
+    # records skipped because an earlier run had already loaded them
+    resumed_from: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+# -- readers -----------------------------------------------------------------
+
+
+def detect_format(name: str) -> str:
+    suffix = os.path.splitext(name)[1].lower().lstrip(".")
+    fmt = {"jsonl": "ndjson", "json": "ndjson", "parq": "parquet"}.get(suffix, suffix)
+    if fmt not in FORMATS:
+        raise BulkLoadError(f"cannot tell the format of {name!r}; pass one of: {', '.join(FORMATS)}")
+    return fmt
+
+
+def _csv_chunks(stream: IO[bytes], size: int) -> Iterator[List[Dict[str, Any]]]:
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    chunk: List[Dict[str, Any]] = []
+    for record in reader:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Unreadable(dict):
+    """Stands in for an input line that is not a JSON object, so it is rejected in its place."""
+
+    def __init__(self, error: str):
+        super().__init__()
+        self.error = error
+
+
+def _ndjson_chunks(stream: IO[bytes], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk: List[Dict[str, Any]] = []
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            record = _Unreadable(f"invalid JSON: {e}")
+        if not isinstance(record, dict):
+            record = _Unreadable(f"expected a JSON object, got {type(record).__name__}")
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _parquet_chunks(stream: IO[bytes], size: int) -> Iterator[List[Dict[str, Any]]]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise BulkLoadError("Parquet input needs pyarrow (pip install pyarrow)") from e
+    for batch in pq.ParquetFile(stream).iter_batches(batch_size=size):
+        yield batch.to_pylist()
+
+
+_READERS: Dict[str, Callable[[IO[bytes], int], Iterator[List[Dict[str, Any]]]]] = {
+    "csv": _csv_chunks,
+    "ndjson": _ndjson_chunks,
+    "parquet": _parquet_chunks,
+}
+
+
+def read_chunks(stream: IO[bytes], fmt: str, size: int = DEFAULT_CHUNK_SIZE, skip: int = 0) -> Iterator[List[Dict[str, Any]]]:
+    """Records of ``stream`` in lists of at most ``size``, after the first ``skip``."""
+    for chunk in _READERS[fmt](stream, size):
+        if skip >= len(chunk):
+            skip -= len(chunk)
+            continue
+        yield chunk[skip:]
+        skip = 0
+
+
+# -- mapping -----------------------------------------------------------------
+
+
+def resolve_columns(target: Target, fields: Sequence[str], mapping: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """target column -> source field, from ``mapping`` first and then ``ALIASES``."""
+    mapping = dict(mapping or {})
+    by_lower = {f.lower(): f for f in fields}
+    wanted = ("lat", "lon", "name") + target.times + target.values + target.texts
+    columns: Dict[str, str] = {}
+    for column in wanted:
+        if column in mapping:
+            if mapping[column] not in fields:
+                raise BulkLoadError(f"mapped source field {mapping[column]!r} for {column!r} is not in the input")
+            columns[column] = mapping[column]
+            continue
+        source = next((by_lower[a] for a in ALIASES.get(column, (column,)) if a in by_lower), None)
+        if source is not None and source not in columns.values():
+            columns[column] = source
+    missing = [c for c in ("lat", "lon") + target.times if c not in columns]
+    if missing:
+        raise BulkLoadError(f"input has no field for: {', '.join(missing)} (fields: {', '.join(fields)})")
+    return columns
+
+
+class _Mapper:
+    """Turns source records into (lat, lon, name, row) tuples for one target."""
+
+    def __init__(self, target: Target, columns: Dict[str, str]):
+        self.columns = columns
+        self.converters = [(c, columns[c], _memo(_to_time)) for c in target.times]
+        self.converters += [(c, columns[c], _to_float) for c in target.values if c in columns]
+        self.converters += [(c, columns[c], _to_text) for c in target.texts if c in columns]
+        self.defaults = dict(target.defaults)
+        self.name = columns.get("name")
+
+    def __call__(self, record: Dict[str, Any]) -> Tuple[float, float, Optional[str], Dict[str, Any]]:
+        lat = float(record[self.columns["lat"]])
+        lon = float(record[self.columns["lon"]])
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f"position out of range: {lat}, {lon}")
+        row = dict(self.defaults)
+        for column, source, convert in self.converters:
+            value = convert(record.get(source))
+            if value is not None:
+                row[column] = value
+        return lat, lon, (_to_text(record.get(self.name)) if self.name else None), row
+
+
+# -- writers -----------------------------------------------------------------
+
+
+def _copy_postgres(db: Session, target: Target, rows: List[Dict[str, Any]], columns: Sequence[str]) -> int:
+    table = target.model.__tablename__
+    stage = f"bulk_stage_{table}"
+    column_list = ", ".join(columns)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(["" if row.get(c) is None else row[c] for c in columns])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {stage} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS")
+        cursor.copy_expert(f"COPY {stage} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(
+            f"INSERT INTO {table} ({column_list}) SELECT {column_list} FROM {stage} "
+            f"ON CONFLICT ({', '.join(target.key)}) DO NOTHING"
+        )
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def _insert_sqlite(db: Session, target: Target, rows: List[Dict[str, Any]], columns: Sequence[str]) -> int:
+    # plain executemany: the ORM bulk path costs more per row than SQLite itself
+    table = target.model.__table__
+    dialect = db.get_bind().dialect
+    processors = []
+    for i, column in enumerate(columns):
+        process = table.c[column].type.dialect_impl(dialect).bind_processor(dialect)
+        if process is not None:
+            processors.append((i, _memo(process) if column in target.times else process))
+    params = []
+    for row in rows:
+        values = [row.get(c) for c in columns]
+        for i, process in processors:
+            if values[i] is not None:
+                values[i] = process(values[i])
+        params.append(tuple(values))
+    # inserting in id order keeps the primary key B-tree writes local
+    params.sort(key=itemgetter(0))
+    sql = (
+        f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+        f"ON CONFLICT ({', '.join(target.key)}) DO NOTHING"
+    )
+    conn = db.connection()
+    # a larger page cache while the chunk goes in; index pages are touched all over
+    previous = conn.exec_driver_sql("PRAGMA cache_size").scalar()
+    conn.exec_driver_sql(f"PRAGMA cache_size = {_SQLITE_CACHE_SIZE}")
+    try:
+        return conn.exec_driver_sql(sql, params).rowcount
+    finally:
+        conn.exec_driver_sql(f"PRAGMA cache_size = {int(previous)}")
+
+
+def _insert(db: Session, target: Target, rows: List[Dict[str, Any]], columns: Sequence[str]) -> int:
+    """Write ``rows`` in the session's transaction; return how many were new."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return _copy_postgres(db, target, rows, columns)
+    if dialect == "sqlite":
+        return _insert_sqlite(db, target, rows, columns)
+    # executemany needs every row to bind the same columns
+    for row in rows:
+        for column in columns:
+            row.setdefault(column, None)
+    return len(insert_ignore(db, target.model, rows, target.key, returning=(target.model.id,)))
+
+
+def _inserted(db: Session, target: Target, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The ``rows`` that went in: skipped duplicates never had their fresh id stored."""
+    model = target.model
+    stored = set()
+    for start in range(0, len(rows), identity.CHUNK_SIZE):
+        ids = [row["id"] for row in rows[start:start + identity.CHUNK_SIZE]]
+        stored.update(db.execute(select(model.id).where(model.id.in_(ids))).scalars())
+    return [row for row in rows if row["id"] in stored]
+
+
+# -- checkpoints -------------------------------------------------------------
+
+
+class Checkpoint:
+    """Records consumed so far, kept in a small JSON file next to the input."""
+
+    def __init__(self, path: str, source: Dict[str, Any]):
+        self.path = path
+        self.source = source
+
+    def load(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get("source") != self.source:
+            raise BulkLoadError(f"checkpoint {self.path} belongs to another input ({state.get('source')}); remove it to start over")
+        return int(state.get("records", 0))
+
+    def save(self, progress: Progress) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"source": self.source, **progress.as_dict()}, f)
+        os.replace(tmp, self.path)
+
+
+# -- driver ------------------------------------------------------------------
+
+
+def load(
+    db: Session,
+    stream: IO[bytes],
+    fmt: str,
+    kind: str,
+    provider: str,
+    mapping: Optional[Dict[str, str]] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    skip: int = 0,
+    checkpoint: Optional[Checkpoint] = None,
+    on_progress: Optional[Callable[[Progress], None]] = None,
+) -> Progress:
+    """Load every record of ``stream`` into the ``kind`` table, attributed to ``provider``.
+
+    ``skip`` (or the checkpoint, when it is further along) leaves out records
+    an earlier run already loaded.
+    """
+    if fmt not in FORMATS:
+        raise BulkLoadError(f"format must be one of: {', '.join(FORMATS)}")
+    if kind not in TARGETS:
+        raise BulkLoadError(f"kind must be one of: {', '.join(KINDS)}")
+    target = TARGETS[kind]
+    if checkpoint is not None:
+        skip = max(skip, checkpoint.load())
+    progress = Progress(records=skip, resumed_from=skip)
+    started = time.perf_counter()
+    mapper: Optional[_Mapper] = None
+    columns: List[str] = []
+    for records in read_chunks(stream, fmt, chunk_size, skip):
+        if mapper is None:
+            # optional fields may be absent from any one record, so look at the whole first chunk
+            fields = list(dict.fromkeys(field for record in records for field in record))
+            mapper = _Mapper(target, resolve_columns(target, fields, mapping))
+            mapped = [c for c, _ in target.defaults] + [c for c, _, _ in mapper.converters]
+            columns = ["id", "location_id", "provider_id"] + list(dict.fromkeys(mapped))
+            provider_ref = identity.resolve_provider(db, provider)
+        points: List[Tuple[float, float, Optional[str]]] = []
+        rows: List[Dict[str, Any]] = []
+        for n, record in enumerate(records, start=progress.records + 1):
+            try:
+                if isinstance(record, _Unreadable):
+                    raise ValueError(record.error)
+                lat, lon, name, row = mapper(record)
+                if any(row.get(c) is None for c in target.times):
+                    raise ValueError("missing time")
+            except (KeyError, TypeError, ValueError) as e:
+                progress.rejected += 1
+                if progress.first_error is None:
+                    progress.first_error = f"record {n}: {e!r}"
+                continue
+            points.append((lat, lon, name))
+            rows.append(row)
+        for row, location in zip(rows, identity.resolve_locations(db, points)):
+            row["id"] = gen_uuid()
+            row["location_id"] = location.id
+            row["provider_id"] = provider_ref.id
+        inserted = _insert(db, target, rows, columns) if rows else 0
+        touched = set()
+        if inserted and target.model is WeatherObservation:
+            # in the chunk's transaction, so a reloaded chunk is never counted twice
+            touched = climatology.record(db, rows if inserted == len(rows) else _inserted(db, target, rows))
+        db.commit()
+        climatology.baselines.invalidate(touched)
+        progress.records += len(records)
+        progress.inserted += inserted
+        progress.duplicates += len(rows) - inserted
+        progress.chunks += 1
+        progress.seconds = round(time.perf_counter() - started, 3)
+        progress.rows_per_second = round((progress.records - progress.resumed_from) / progress.seconds) if progress.seconds else 0.0
+        if checkpoint is not None:
+            checkpoint.save(progress)
+        if on_progress is not None:
+            on_progress(progress)
+    progress.done = True
+    progress.seconds = round(time.perf_counter() - started, 3)
+    if checkpoint is not None:
+        checkpoint.save(progress)
+    logger.info("bulk load of %s finished: %s", kind, progress.as_dict())
+    return progress
@@ -0,0 +1,115 @@
+"""In-process caching primitives shared by the services."""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Protocol, Tuple
+
+from core.metrics import record_cache
+
+_MISSING = object()
+
+
+class Restored(Protocol):
+    """Entries from an earlier process, handed over one key at a time."""
+
+    def take(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """Remove ``key`` and return ``(value, seconds left)``, or None."""
+
+    def discard(self, key: Hashable) -> None:
+        ...
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 5000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.restored: Optional[Restored] = None
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > now:
+                self._entries.move_to_end(key)
+                value = entry[1]
+            else:
+                if entry is not _MISSING:
+                    del self._entries[key]
+                value = _MISSING
+        if value is _MISSING and self.restored is not None:
+            # restored entries are decoded on first use, then live here
+            taken = self.restored.take(key)
+            if taken is not None:
+                value, remaining = taken
+                self.set(key, value, ttl=remaining)
+        record_cache(self.name, value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live entry without touching LRU order or hit statistics."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        if self.restored is not None:
+            # memory-only callers count restored entries as warm too
+            taken = self.restored.take(key)
+            if taken is not None:
+                value, remaining = taken
+                self.set(key, value, ttl=remaining)
+                return value
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        if self.restored is not None:
+            self.restored.discard(key)
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        if self.restored is not None:
+            self.restored.discard(key)
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def live_items(self) -> List[Tuple[Hashable, Any, float]]:
+        """``(key, value, seconds left)`` for unexpired entries, least recently used first."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value, expires - now) for key, (expires, value) in self._entries.items() if expires > now]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SingleFlight:
+    """Collapse concurrent async loads of the same key into one call."""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            # the load runs detached, so cancelling whichever caller started it leaves it running for the rest
+            task = asyncio.ensure_future(loader())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # mark retrieved so an error with no waiters left isn't logged
+            task.exception()
@@ -0,0 +1,266 @@
+"""Warm-start snapshots of the in-process caches.
+
+Each registered cache is written to ``<CACHE_SNAPSHOT_DIR>/<name>.snap``
+every ``CACHE_SNAPSHOT_INTERVAL`` seconds and on shutdown, and read back on
+startup so a new process does not begin with every tile and geocode cold.
+
+File layout (big-endian)::
+
+    header  magic "WASNAP\\0\\0" | version u16 | tag length u16 | entries u32 | crc32 u32
+    tag     the cache's shared-tier prefix (namespace, unit system, cache name)
+    entry   key length u16 | value length u32 | expires f64 (unix time) | crc32 u32 | key | value
+
+Values use the same encoding as the shared cache tier. Restoring maps the
+file and walks only the fixed-size entry headers to index keys; a value is
+checked and decoded the first time its key is asked for (see
+``TTLCache.restored``). A file with the wrong magic, version or tag, or
+whose entries do not add up, is ignored as a whole; an entry whose checksum
+or decoding fails is a miss. Snapshots are written to a temporary file and
+renamed into place, so a crash mid-write leaves the previous one intact.
+"""
+
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+from core.config import settings
+from services.shared_cache import TieredCache
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"WASNAP\0\0"
+VERSION = 1
+_HEADER = struct.Struct(">8sHHII")  # magic, version, tag length, entries, crc32(tag)
+_ENTRY = struct.Struct(">HIdI")  # key length, value length, expires, crc32(key + value)
+
+# (key, expires as unix time, encoded value)
+RawEntry = Tuple[str, float, bytes]
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def write(path: str, tag: str, entries: Iterable[RawEntry]) -> int:
+    """Atomically replace ``path`` with a snapshot of ``entries``; return how many were written."""
+    encoded_tag = tag.encode()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    count = 0
+    try:
+        with open(tmp, "wb") as f:
+            f.write(b"\0" * _HEADER.size)
+            f.write(encoded_tag)
+            for key, expires, value in entries:
+                encoded_key = key.encode()
+                crc = zlib.crc32(value, zlib.crc32(encoded_key))
+                f.write(_ENTRY.pack(len(encoded_key), len(value), expires, crc))
+                f.write(encoded_key)
+                f.write(value)
+                count += 1
+            f.seek(0)
+            f.write(_HEADER.pack(MAGIC, VERSION, len(encoded_tag), count, zlib.crc32(encoded_tag)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return count
+
+
+class SnapshotReader:
+    """A mapped snapshot file whose entries are decoded on demand.
+
+    Implements ``services.cache.Restored``; the mapping is closed once every
+    entry has been taken or discarded.
+    """
+
+    def __init__(self, path: str, tag: str, loads: Callable[[bytes], Any]):
+        self.loads = loads
+        self._lock = threading.Lock()
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # key -> (key offset, key length, value length, expires, crc32)
+            self._index: Dict[str, Tuple[int, int, int, float, int]] = self._scan(tag)
+        except Exception:
+            self._map.close()
+            raise
+        if not self._index:
+            self._map.close()
+
+    def _scan(self, tag: str) -> Dict[str, Tuple[int, int, int, float, int]]:
+        data = self._map
+        if len(data) < _HEADER.size:
+            raise SnapshotError("truncated header")
+        magic, version, tag_len, count, tag_crc = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise SnapshotError("not a cache snapshot")
+        if version != VERSION:
+            raise SnapshotError(f"unsupported snapshot version {version}")
+        pos = _HEADER.size
+        stored_tag = data[pos:pos + tag_len]
+        if len(stored_tag) != tag_len or zlib.crc32(stored_tag) != tag_crc:
+            raise SnapshotError("corrupt header")
+        if stored_tag != tag.encode():
+            raise SnapshotError(f"written for {stored_tag.decode(errors='replace')!r}, not {tag!r}")
+        pos += tag_len
+        now = time.time()
+        index: Dict[str, Tuple[int, int, int, float, int]] = {}
+        for _ in range(count):
+            if pos + _ENTRY.size > len(data):
+                raise SnapshotError("truncated entry")
+            key_len, value_len, expires, crc = _ENTRY.unpack_from(data, pos)
+            pos += _ENTRY.size
+            end = pos + key_len + value_len
+            if end > len(data):
+                raise SnapshotError("truncated entry")
+            if expires > now:
+                index[data[pos:pos + key_len].decode(errors="replace")] = (pos, key_len, value_len, expires, crc)
+            pos = end
+        if pos != len(data):
+            raise SnapshotError("trailing bytes")
+        return index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _value(self, entry: Tuple[int, int, int, float, int]) -> Optional[bytes]:
+        """The entry's encoded value, or None if it fails its checksum. Call with the lock held."""
+        offset, key_len, value_len, _, crc = entry
+        raw = self._map[offset:offset + key_len + value_len]
+        return raw[key_len:] if zlib.crc32(raw) == crc else None
+
+    def take(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            entry = self._index.pop(key, None)
+            if entry is None:
+                return None
+            value = self._value(entry)
+            if not self._index:
+                self._map.close()
+        remaining = entry[3] - time.time()
+        if value is None:
+            logger.warning("cache snapshot entry %r failed its checksum", key)
+            return None
+        if remaining <= 0:
+            return None
+        try:
+            return self.loads(value), remaining
+        except Exception as e:
+            logger.warning("cache snapshot entry %r could not be decoded: %s", key, e)
+            return None
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            if self._index.pop(key, None) is not None and not self._index:
+                self._map.close()
+
+    def pending(self) -> List[RawEntry]:
+        """Unexpired entries not yet taken, still encoded."""
+        now = time.time()
+        out: List[RawEntry] = []
+        with self._lock:
+            for key, entry in self._index.items():
+                value = self._value(entry) if entry[3] > now else None
+                if value is not None:
+                    out.append((key, entry[3], value))
+        return out
+
+
+class CacheSnapshots:
+    """Saves and restores a set of ``TieredCache`` local tiers."""
+
+    def __init__(self, directory: str, interval: float):
+        self.directory = directory
+        self.interval = interval
+        self._caches: List[TieredCache] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, cache: TieredCache) -> None:
+        self._caches.append(cache)
+
+    def _path(self, cache: TieredCache) -> str:
+        return os.path.join(self.directory, f"{cache.local.name}.snap")
+
+    def restore(self) -> Dict[str, int]:
+        """Attach each cache's snapshot for lazy loading; return entries restored per cache."""
+        restored: Dict[str, int] = {}
+        for cache in self._caches:
+            path = self._path(cache)
+            if not os.path.exists(path):
+                continue
+            try:
+                reader = SnapshotReader(path, cache.prefix, cache.loads)
+            except Exception as e:
+                logger.warning("ignoring cache snapshot %s: %s", path, e)
+                continue
+            cache.local.restored = reader
+            restored[cache.local.name] = len(reader)
+        if restored:
+            logger.info("restored cache snapshots: %s", restored)
+        return restored
+
+    def _entries(self, cache: TieredCache) -> Iterator[RawEntry]:
+        now = time.time()
+        live = set()
+        for key, value, remaining in cache.local.live_items():
+            if not isinstance(key, str) or value is None:
+                continue
+            try:
+                encoded = cache.dumps(value)
+            except Exception as e:
+                logger.warning("cannot snapshot %s entry %r: %s", cache.local.name, key, e)
+                continue
+            live.add(key)
+            yield key, now + remaining, encoded
+        reader = cache.local.restored
+        if isinstance(reader, SnapshotReader):
+            # entries restored at startup that nobody has asked for yet
+            for key, expires, encoded in reader.pending():
+                if key not in live:
+                    yield key, expires, encoded
+
+    def save(self) -> Dict[str, int]:
+        """Write every registered cache; return entries written per cache."""
+        os.makedirs(self.directory, exist_ok=True)
+        written: Dict[str, int] = {}
+        for cache in self._caches:
+            try:
+                written[cache.local.name] = write(self._path(cache), cache.prefix, self._entries(cache))
+            except OSError as e:
+                logger.warning("cache snapshot of %s failed: %s", cache.local.name, e)
+        return written
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.save)
+            except Exception:
+                logger.exception("cache snapshot failed")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the periodic writer and take a final snapshot."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.save)
+
+
+snapshots = CacheSnapshots(settings.cache_snapshot_dir, settings.cache_snapshot_interval)
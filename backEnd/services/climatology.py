@@ -0,0 +1,306 @@
+"""Per-location climatology baselines and anomaly scores.
+
+The ``climatology`` table holds, per location, field and day of the year,
+the running count, mean and M2 (sum of squared deviations) of every
+observation stored for that day. Ingest keeps it current: ``record`` reduces
+the rows a bulk-load chunk added to one partial per (location, field, day)
+and merges each into the stored row with Chan's parallel form of Welford's
+update, inside the same ``INSERT ... ON CONFLICT DO UPDATE``, so nothing is
+ever recomputed from the observations themselves (migration 5 seeds the
+table from the rows that existed before it).
+
+Days are numbered on a leap-year calendar (Feb 29 is always 60, Mar 1 is
+61). A location's normal for a day pools the ``CLIMATOLOGY_WINDOW_DAYS``
+days either side, wrapping around the new year.
+
+``baselines`` serves the normals. The first lookup for a location reads its
+rows (through the primary key) into one ``(fields, 366, 3)`` float32 array
+of smoothed count, mean and standard deviation, about 13 KB, kept in an LRU
+cache; after that a lookup is a tile key, a dict and an array index. A
+request is matched to the location with observations nearest the centre of
+its forecast tile, so a summary and the station data that describes it meet
+at the same tile.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from core.config import settings
+from core.database import SessionLocal
+from models.model import ClimatologyStat, Location
+from services import units as unit_systems
+from services.cache import TTLCache
+from services.forecast_series import ForecastSeries
+from services.tiling import tile_scheme
+
+logger = logging.getLogger(__name__)
+
+# (observation column, series column, summary key)
+FIELDS: Tuple[Tuple[str, str, str], ...] = (
+    ("temperature_c", "temp", "temp"),
+    ("humidity_pct", "humidity", "humidity"),
+    ("wind_speed_ms", "wind_speed", "wind"),
+)
+FIELD_INDEX = {column: i for i, (column, _, _) in enumerate(FIELDS)}
+DAYS = 366
+# first day of each month, less one, on a leap-year calendar
+_MONTH_START = (0, 0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335)
+_MISSING = object()
+_NO_BASELINE = object()
+
+# (location_id, field, day, count, mean, m2)
+Partial = Tuple[str, str, int, int, float, float]
+
+
+def day_of_year(moment: datetime) -> int:
+    """1-366 with Feb 29 fixed at 60, so a date has the same day in every year."""
+    return _MONTH_START[moment.month] + moment.day
+
+
+def partials(rows: Sequence[Dict[str, Any]]) -> List[Partial]:
+    """Count, mean and M2 of each field per (location, day) over ``rows``."""
+    groups: Dict[Tuple[str, int], int] = {}
+    index = np.fromiter(
+        (groups.setdefault((row["location_id"], day_of_year(row["observed_at"])), len(groups)) for row in rows),
+        dtype=np.int64,
+        count=len(rows),
+    )
+    keys = list(groups)
+    out: List[Partial] = []
+    for column, _, _ in FIELDS:
+        values = np.array([row.get(column) for row in rows], dtype=np.float64)
+        present = ~np.isnan(values)
+        if not present.any():
+            continue
+        g, x = index[present], values[present]
+        count = np.bincount(g, minlength=len(keys))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(g, weights=x, minlength=len(keys)) / count
+        m2 = np.bincount(g, weights=(x - mean[g]) ** 2, minlength=len(keys))
+        for i in np.flatnonzero(count):
+            location_id, day = keys[i]
+            out.append((location_id, column, day, int(count[i]), float(mean[i]), float(m2[i])))
+    return out
+
+
+def _merge_sql(db: Session, rows: List[Dict[str, Any]]) -> None:
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(ClimatologyStat)
+    old, new = ClimatologyStat.__table__.c, stmt.excluded
+    total = old.count + new.count
+    delta = new.mean - old.mean  # REAL, so the divisions below are not integer ones
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["location_id", "field", "day_of_year"],
+        set_={
+            "count": total,
+            "mean": old.mean + delta * new.count / total,
+            "m2": old.m2 + new.m2 + delta * delta * old.count * new.count / total,
+        },
+    )
+    db.execute(stmt, rows)
+
+
+def _merge_orm(db: Session, rows: List[Dict[str, Any]]) -> None:
+    for row in rows:
+        stat = db.get(ClimatologyStat, (row["location_id"], row["field"], row["day_of_year"]))
+        if stat is None:
+            db.add(ClimatologyStat(**row))
+            continue
+        total = stat.count + row["count"]
+        delta = row["mean"] - stat.mean
+        stat.mean += delta * row["count"] / total
+        stat.m2 += row["m2"] + delta * delta * stat.count * row["count"] / total
+        stat.count = total
+    db.flush()
+
+
+def record(db: Session, rows: Sequence[Dict[str, Any]]) -> Set[str]:
+    """Fold newly stored observation ``rows`` into the climatology; return the locations touched.
+
+    Runs in the caller's transaction, so the statistics commit with the rows.
+    """
+    merged = [
+        {"location_id": location_id, "field": field, "day_of_year": day, "count": count, "mean": mean, "m2": m2}
+        for location_id, field, day, count, mean, m2 in partials(rows)
+    ]
+    if not merged:
+        return set()
+    if db.get_bind().dialect.name in ("postgresql", "sqlite"):
+        _merge_sql(db, merged)
+    else:
+        _merge_orm(db, merged)
+    return {row["location_id"] for row in merged}
+
+
+def smooth(raw: np.ndarray, window: int) -> np.ndarray:
+    """Pool ``raw[field, day] = (count, mean, m2)`` over ±``window`` days into (count, mean, std)."""
+    count, mean, m2 = raw[..., 0], raw[..., 1], raw[..., 2]
+    # count, sum and sum of squares add across days; wrap the year so Jan 1 sees late December
+    sums = np.stack([count, count * mean, m2 + count * mean * mean], axis=-1)
+    padded = np.concatenate([sums[:, -window:], sums, sums[:, :window]], axis=1) if window else sums
+    running = np.concatenate([np.zeros_like(padded[:, :1]), np.cumsum(padded, axis=1)], axis=1)
+    pooled = running[:, 2 * window + 1:] - running[:, :DAYS]
+    n, s1, s2 = pooled[..., 0], pooled[..., 1], pooled[..., 2]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pooled_mean = np.where(n > 0, s1 / n, np.nan)
+        variance = np.where(n > 1, (s2 - n * pooled_mean * pooled_mean) / (n - 1), np.nan)
+    return np.stack([n, pooled_mean, np.sqrt(np.maximum(variance, 0))], axis=-1).astype(np.float32)
+
+
+class Baseline:
+    """Smoothed normals of one location: ``stats[field, day - 1] = (count, mean, std)``."""
+
+    __slots__ = ("location_id", "stats")
+
+    def __init__(self, location_id: str, stats: np.ndarray):
+        self.location_id = location_id
+        self.stats = stats
+
+    def normal(self, column: str, day: int) -> Tuple[int, float, float]:
+        count, mean, std = self.stats[FIELD_INDEX[column], day - 1]
+        return int(count), float(mean), float(std)
+
+
+def score(baseline: Baseline, series: ForecastSeries, units: str, min_samples: int) -> Optional[Dict[str, Any]]:
+    """z-scores of today's forecast (metric ``series``) against the normal for today's date.
+
+    "Today" is the local day of the first step; each field is the mean of
+    that day's steps. Fields whose normal rests on fewer than
+    ``min_samples`` observations get no score.
+    """
+    if not len(series):
+        return None
+    offset = int(series.city.get("timezone", 0))
+    local_days = (series.dt + offset) // 86400
+    today = local_days == local_days[0]
+    day = day_of_year(datetime.utcfromtimestamp(int(local_days[0]) * 86400))
+    out: Dict[str, Any] = {"day_of_year": day, "location_id": baseline.location_id}
+    for column, series_column, key in FIELDS:
+        count, mean, std = baseline.normal(column, day)
+        values = series.column(series_column)[today]
+        if count < min_samples or not std > 0 or np.isnan(values).all():
+            out[key] = None
+            continue
+        value = float(np.nanmean(values))
+        out[key] = {
+            "normal": round(unit_systems.convert_value(series_column, mean, units), 1),
+            "z": round((value - mean) / std, 2),
+            "samples": count,
+        }
+    return out
+
+
+class Baselines:
+    """Lazily loaded baselines, found through the forecast tile a point falls in."""
+
+    def __init__(self, ttl: float, max_entries: int, window: int, min_samples: int):
+        self.ttl = ttl
+        self.window = window
+        self.min_samples = min_samples
+        self._arrays = TTLCache("climatology", ttl, max_entries)
+        # tile key -> location_id with observations nearest the tile centre
+        self._tiles: Optional[Dict[str, str]] = None
+        self._tiles_expire = 0.0
+        self._lock = threading.Lock()
+
+    def _load_tiles(self, db: Session) -> Dict[str, str]:
+        with_stats = select(ClimatologyStat.location_id).distinct()
+        stmt = select(Location.id, Location.latitude, Location.longitude).where(Location.id.in_(with_stats))
+        nearest: Dict[str, Tuple[float, str]] = {}
+        for location_id, lat, lon in db.execute(stmt):
+            tile = tile_scheme.tile_for(lat, lon)
+            distance = (lat - tile.lat) ** 2 + (lon - tile.lon) ** 2
+            if tile.key not in nearest or distance < nearest[tile.key][0]:
+                nearest[tile.key] = (distance, location_id)
+        return {key: location_id for key, (_, location_id) in nearest.items()}
+
+    def load(self, db: Session, location_id: str) -> Optional[Baseline]:
+        """Read and smooth ``location_id``'s statistics; None when it has none."""
+        stmt = select(
+            ClimatologyStat.field, ClimatologyStat.day_of_year, ClimatologyStat.count, ClimatologyStat.mean, ClimatologyStat.m2,
+        ).where(ClimatologyStat.location_id == location_id)
+        raw = np.zeros((len(FIELDS), DAYS, 3))
+        found = False
+        for field, day, count, mean, m2 in db.execute(stmt):
+            i = FIELD_INDEX.get(field)
+            if i is not None and 1 <= day <= DAYS:
+                raw[i, day - 1] = (count, mean, m2)
+                found = True
+        return Baseline(location_id, smooth(raw, self.window)) if found else None
+
+    def _location_for(self, tile_key: str) -> Optional[str]:
+        """The tile's location_id, "" if it has none, None if the tile map needs loading."""
+        tiles = self._tiles
+        return None if tiles is None or time.monotonic() >= self._tiles_expire else tiles.get(tile_key, "")
+
+    def _cached(self, tile_key: str) -> Any:
+        """The tile's baseline or None from memory alone, or _MISSING when it has to be read."""
+        location_id = self._location_for(tile_key)
+        if location_id is None:
+            return _MISSING
+        if not location_id:
+            return None
+        baseline = self._arrays.get(location_id, _MISSING)
+        return None if baseline is _NO_BASELINE else baseline
+
+    def peek(self, lat: float, lon: float) -> Optional[Baseline]:
+        """The baseline for (lat, lon) if it is already in memory; never touches the database."""
+        baseline = self._cached(tile_scheme.tile_for(lat, lon).key)
+        return None if baseline is _MISSING else baseline
+
+    def get(self, lat: float, lon: float) -> Optional[Baseline]:
+        """The baseline for (lat, lon), reading what is missing; database errors count as none."""
+        tile_key = tile_scheme.tile_for(lat, lon).key
+        try:
+            with self._lock:
+                if self._location_for(tile_key) is None:
+                    with SessionLocal() as db:
+                        self._tiles = self._load_tiles(db)
+                    self._tiles_expire = time.monotonic() + self.ttl
+            location_id = self._tiles.get(tile_key, "")
+            if not location_id:
+                return None
+            baseline = self._arrays.peek(location_id)
+            if baseline is None:
+                with SessionLocal() as db:
+                    baseline = self.load(db, location_id) or _NO_BASELINE
+                self._arrays.set(location_id, baseline)
+        except Exception as e:
+            logger.warning("climatology lookup failed for %s: %s", tile_key, e)
+            return None
+        return None if baseline is _NO_BASELINE else baseline
+
+    async def lookup(self, lat: float, lon: float) -> Optional[Baseline]:
+        """``get`` without leaving the event loop when the baseline is already in memory."""
+        baseline = self._cached(tile_scheme.tile_for(lat, lon).key)
+        if baseline is not _MISSING:
+            return baseline
+        return await asyncio.to_thread(self.get, lat, lon)
+
+    def invalidate(self, location_ids: Iterable[str]) -> None:
+        """Drop cached baselines after new observations; new stations show up on the next lookup."""
+        known = set(self._tiles.values()) if self._tiles is not None else set()
+        for location_id in location_ids:
+            self._arrays.delete(location_id)
+            if location_id not in known:
+                self._tiles_expire = 0.0
+
+
+baselines = Baselines(
+    settings.climatology_cache_ttl,
+    settings.climatology_cache_max_entries,
+    settings.climatology_window_days,
+    settings.climatology_min_samples,
+)
@@ -0,0 +1,252 @@
+"""Multi-provider ensemble blending over stored forecast snapshots.
+
+For each location the latest hourly snapshot of every provider is aligned on a
+common 3-hour grid into a ``(providers, times, variables)`` array. Aligned
+arrays are cached per location and keyed by the set of snapshot times, so a
+repeat read for an unchanged location skips the row load entirely.
+"""
+
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Float, and_, func, select, tuple_, type_coerce
+from sqlalchemy.orm import Session
+
+from models.model import Provider, WeatherForecast, WeatherObservation
+
+VARIABLES: Tuple[str, ...] = (
+    "temperature_c", "humidity_pct", "pressure_hpa", "wind_speed_ms", "wind_gust_ms", "precip_mm", "cloud_pct", "pop_pct",
+)
+GRID_STEP = 3 * 3600
+PERCENTILES = (10, 50, 90)
+
+# (provider_id, snapshot_time) pairs identifying the data behind an aligned array
+SnapshotKey = Tuple[Tuple[str, datetime], ...]
+
+
+class AlignedSeries:
+    __slots__ = ("grid", "values", "provider_ids")
+
+    def __init__(self, grid: np.ndarray, values: np.ndarray, provider_ids: List[str]):
+        self.grid = grid
+        self.values = values
+        self.provider_ids = provider_ids
+
+
+class AlignedCache:
+    """Bounded LRU of aligned arrays keyed by location and snapshot set."""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[SnapshotKey, AlignedSeries]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, location_id: str, key: SnapshotKey) -> Optional[AlignedSeries]:
+        with self._lock:
+            entry = self._entries.get(location_id)
+            if entry is None or entry[0] != key:
+                return None
+            self._entries.move_to_end(location_id)
+            return entry[1]
+
+    def put(self, location_id: str, key: SnapshotKey, series: AlignedSeries) -> None:
+        with self._lock:
+            self._entries[location_id] = (key, series)
+            self._entries.move_to_end(location_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+aligned_cache = AlignedCache()
+
+_weights_cache: Dict[str, Any] = {"expires": 0.0, "weights": {}}
+WEIGHTS_TTL_SECONDS = 3600.0
+
+
+def _epoch(values: Sequence[datetime]) -> np.ndarray:
+    return np.array([v.replace(tzinfo=timezone.utc).timestamp() for v in values], dtype=np.float64)
+
+
+def latest_snapshots(db: Session, location_ids: Sequence[str]) -> Dict[str, SnapshotKey]:
+    """Latest hourly snapshot per (location, provider), via idx_fc_loc_kind_snap."""
+    stmt = (
+        select(WeatherForecast.location_id, WeatherForecast.provider_id, func.max(WeatherForecast.snapshot_time))
+        .where(WeatherForecast.location_id.in_(location_ids), WeatherForecast.kind == "hourly")
+        .group_by(WeatherForecast.location_id, WeatherForecast.provider_id)
+    )
+    out: Dict[str, List[Tuple[str, datetime]]] = {}
+    for loc_id, prov_id, snap in db.execute(stmt):
+        out.setdefault(loc_id, []).append((prov_id, snap))
+    return {loc_id: tuple(sorted(pairs)) for loc_id, pairs in out.items()}
+
+
+def _load_aligned(db: Session, wanted: Dict[str, SnapshotKey]) -> Dict[str, AlignedSeries]:
+    """Load the rows behind ``wanted`` in one query and align each location."""
+    triples = [(loc_id, prov_id, snap) for loc_id, key in wanted.items() for prov_id, snap in key]
+    if not triples:
+        return {}
+    columns = [type_coerce(getattr(WeatherForecast, v), Float) for v in VARIABLES]
+    stmt = (
+        select(WeatherForecast.location_id, WeatherForecast.provider_id, WeatherForecast.forecast_time, *columns)
+        .where(
+            WeatherForecast.kind == "hourly",
+            tuple_(WeatherForecast.location_id, WeatherForecast.provider_id, WeatherForecast.snapshot_time).in_(triples),
+        )
+        .order_by(WeatherForecast.location_id, WeatherForecast.provider_id, WeatherForecast.forecast_time)
+    )
+    rows = db.execute(stmt).all()
+    if not rows:
+        return {}
+
+    loc_col = np.array([r[0] for r in rows], dtype=object)
+    prov_col = np.array([r[1] for r in rows], dtype=object)
+    times = _epoch([r[2] for r in rows])
+    values = np.array([r[3:] for r in rows], dtype=np.float64)  # None -> nan
+
+    # rows are sorted, so each (location, provider) run is contiguous
+    changes = np.flatnonzero((loc_col[1:] != loc_col[:-1]) | (prov_col[1:] != prov_col[:-1])) + 1
+    boundaries = [0, *changes.tolist(), len(rows)]
+    runs: Dict[str, List[Tuple[str, slice]]] = {}
+    for start, stop in zip(boundaries[:-1], boundaries[1:]):
+        runs.setdefault(loc_col[start], []).append((prov_col[start], slice(start, stop)))
+
+    out: Dict[str, AlignedSeries] = {}
+    for loc_id, provider_runs in runs.items():
+        t_min = min(times[s][0] for _, s in provider_runs)
+        t_max = max(times[s][-1] for _, s in provider_runs)
+        grid = np.arange(np.floor(t_min / GRID_STEP) * GRID_STEP, t_max + 1, GRID_STEP)
+        aligned = np.full((len(provider_runs), grid.size, len(VARIABLES)), np.nan)
+        for p, (_, s) in enumerate(provider_runs):
+            t = times[s]
+            block = values[s]
+            for v in range(len(VARIABLES)):
+                col = block[:, v]
+                ok = ~np.isnan(col)
+                if ok.sum() >= 1:
+                    aligned[p, :, v] = np.interp(grid, t[ok], col[ok], left=np.nan, right=np.nan)
+        out[loc_id] = AlignedSeries(grid, aligned, [prov_id for prov_id, _ in provider_runs])
+    return out
+
+
+def provider_weights(db: Session, days: int = 30) -> Dict[str, float]:
+    """Inverse-MSE temperature skill per provider against stored observations.
+
+    Providers without verification data get the mean weight of the others, or
+    1.0 when nothing has been verified yet.
+    """
+    now = time.monotonic()
+    if _weights_cache["expires"] > now:
+        return _weights_cache["weights"]
+    since = datetime.utcnow() - timedelta(days=days)
+    err = type_coerce(WeatherForecast.temperature_c, Float) - type_coerce(WeatherObservation.temperature_c, Float)
+    stmt = (
+        select(WeatherForecast.provider_id, func.avg(err * err), func.count())
+        .join(
+            WeatherObservation,
+            and_(
+                WeatherObservation.location_id == WeatherForecast.location_id,
+                WeatherObservation.observed_at == WeatherForecast.forecast_time,
+            ),
+        )
+        .where(WeatherForecast.forecast_time >= since, WeatherForecast.temperature_c.isnot(None), WeatherObservation.temperature_c.isnot(None))
+        .group_by(WeatherForecast.provider_id)
+    )
+    weights = {prov_id: 1.0 / (float(mse) + 0.25) for prov_id, mse, n in db.execute(stmt) if mse is not None and n}
+    _weights_cache.update(weights=weights, expires=now + WEIGHTS_TTL_SECONDS)
+    return weights
+
+
+def effective_weights(provider_ids: Sequence[str], weights: Dict[str, float]) -> np.ndarray:
+    """Normalized weights, giving unverified providers the mean known weight."""
+    known = [weights[p] for p in provider_ids if p in weights]
+    default = float(np.mean(known)) if known else 1.0
+    w = np.array([weights.get(p, default) for p in provider_ids])
+    return w / w.sum()
+
+
+def _nan_percentiles(x: np.ndarray, percentiles: Sequence[float]) -> np.ndarray:
+    """Linear-interpolated percentiles over axis 0 ignoring NaN.
+
+    Equivalent to ``np.nanpercentile(x, q, axis=0)`` but fully vectorized;
+    numpy's version falls back to a per-column Python loop when NaNs exist.
+    """
+    ordered = np.sort(x, axis=0)  # NaN sorts last
+    n = (~np.isnan(x)).sum(axis=0)
+    out = np.full((len(percentiles),) + x.shape[1:], np.nan)
+    last = np.maximum(n - 1, 0)
+    for k, pct in enumerate(percentiles):
+        rank = last * (pct / 100.0)
+        lo = np.floor(rank).astype(np.intp)
+        hi = np.minimum(lo + 1, last)
+        frac = rank - lo
+        v_lo = np.take_along_axis(ordered, lo[None], axis=0)[0]
+        v_hi = np.take_along_axis(ordered, hi[None], axis=0)[0]
+        out[k] = np.where(n > 0, v_lo + (v_hi - v_lo) * frac, np.nan)
+    return out
+
+
+def blend(series: AlignedSeries, w: np.ndarray, variables: Sequence[str]) -> Dict[str, Any]:
+    """Weighted mean, spread and percentile bands for ``variables``."""
+    w = w[:, None]
+    idx = [VARIABLES.index(v) for v in variables]
+    x = series.values[:, :, idx]  # (P, T, V)
+    present = ~np.isnan(x)
+    wx = np.where(present, x, 0.0) * w[:, :, None]
+    wsum = (present * w[:, :, None]).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = wx.sum(axis=0) / wsum
+        dev = np.where(present, x - mean[None], 0.0)
+        spread = np.sqrt((dev * dev * w[:, :, None]).sum(axis=0) / wsum)
+        bands = _nan_percentiles(x, PERCENTILES)  # (len(PERCENTILES), T, V)
+
+    out: Dict[str, Any] = {}
+    for j, name in enumerate(variables):
+        entry = {"mean": _column(mean[:, j]), "spread": _column(spread[:, j])}
+        for k, pct in enumerate(PERCENTILES):
+            entry[f"p{pct}"] = _column(bands[k, :, j])
+        out[name] = entry
+    return out
+
+
+def _column(arr: np.ndarray) -> List[Optional[float]]:
+    rounded = np.round(arr, 2)
+    return [None if v != v else v for v in rounded.tolist()]
+
+
+def ensemble(db: Session, location_ids: Sequence[str], variables: Sequence[str] = VARIABLES) -> Dict[str, Any]:
+    """Blend the latest snapshots of every provider for each location."""
+    snapshots = latest_snapshots(db, location_ids)
+    aligned: Dict[str, AlignedSeries] = {}
+    misses: Dict[str, SnapshotKey] = {}
+    for loc_id, key in snapshots.items():
+        cached = aligned_cache.get(loc_id, key)
+        if cached is None:
+            misses[loc_id] = key
+        else:
+            aligned[loc_id] = cached
+    if misses:
+        for loc_id, series in _load_aligned(db, misses).items():
+            aligned_cache.put(loc_id, misses[loc_id], series)
+            aligned[loc_id] = series
+
+    weights = provider_weights(db)
+    names = dict(db.execute(select(Provider.id, Provider.name).where(Provider.id.in_({p for s in aligned.values() for p in s.provider_ids}))).all()) if aligned else {}
+    locations: Dict[str, Any] = {}
+    for loc_id in location_ids:
+        series = aligned.get(loc_id)
+        if series is None:
+            continue
+        w = effective_weights(series.provider_ids, weights)
+        locations[loc_id] = {
+            "time": [int(t) for t in series.grid.tolist()],
+            "providers": [names.get(p, p) for p in series.provider_ids],
+            "weights": {names.get(p, p): round(float(x), 4) for p, x in zip(series.provider_ids, w)},
+            "variables": blend(series, w, variables),
+        }
+    return {"percentiles": list(PERCENTILES), "locations": locations, "cache_misses": len(misses)}
@@ -0,0 +1,217 @@
+"""Column-oriented in-memory form of a forecast payload.
+
+Provider payloads are OpenWeather-shaped dicts: a ``list`` of ~40 items, each
+a handful of nested dicts with string keys. ``ForecastSeries`` is built once
+when a payload is ingested and keeps the same data as a timestamp array, one
+(variables x steps) float matrix with NaN for missing values, and indexes
+into a process-wide table of interned weather conditions. It is what the
+forecast cache holds and what ``build_context``, the grid sampler and
+``db_store_forecasts`` read.
+"""
+
+import json
+import struct
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# column name -> path into an OpenWeather list item
+COLUMNS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("temp", ("main", "temp")),
+    ("feels_like", ("main", "feels_like")),
+    ("temp_min", ("main", "temp_min")),
+    ("temp_max", ("main", "temp_max")),
+    ("pressure", ("main", "pressure")),
+    ("humidity", ("main", "humidity")),
+    ("wind_speed", ("wind", "speed")),
+    ("wind_deg", ("wind", "deg")),
+    ("wind_gust", ("wind", "gust")),
+    ("clouds", ("clouds", "all")),
+    ("pop", ("pop",)),
+    ("rain_3h", ("rain", "3h")),
+    ("snow_3h", ("snow", "3h")),
+    ("visibility", ("visibility",)),
+)
+COLUMN_INDEX = {name: i for i, (name, _) in enumerate(COLUMNS)}
+# written back as ints when rebuilding items
+_INT_COLUMNS = frozenset(("pressure", "humidity", "wind_deg", "clouds", "visibility"))
+
+# (id, main, description, icon) -> index; shared by every series in the process
+_conditions: List[Tuple[Any, str, str, str]] = []
+_condition_index: Dict[Tuple[Any, str, str, str], int] = {}
+_condition_lock = threading.Lock()
+
+_WIRE_HEADER = struct.Struct(">III")  # meta length, steps, columns
+
+
+def intern_condition(weather: Dict[str, Any]) -> int:
+    key = (
+        weather.get("id"),
+        sys.intern(str(weather.get("main") or "")),
+        sys.intern(str(weather.get("description") or "")),
+        sys.intern(str(weather.get("icon") or "")),
+    )
+    idx = _condition_index.get(key)
+    if idx is None:
+        with _condition_lock:
+            idx = _condition_index.get(key)
+            if idx is None:
+                idx = len(_conditions)
+                _conditions.append(key)
+                _condition_index[key] = idx
+    return idx
+
+
+def condition(idx: int) -> Optional[Dict[str, Any]]:
+    if idx < 0:
+        return None
+    cid, main, description, icon = _conditions[idx]
+    return {"id": cid, "main": main, "description": description, "icon": icon}
+
+
+def _lookup(item: Dict[str, Any], path: Tuple[str, ...]) -> float:
+    value: Any = item
+    for part in path:
+        if not isinstance(value, dict):
+            return np.nan
+        value = value.get(part)
+    return float(value) if value is not None else np.nan
+
+
+class ForecastSeries:
+    __slots__ = ("provider", "city", "dt", "values", "codes", "fetched_at")
+
+    def __init__(
+        self,
+        provider: str,
+        city: Dict[str, Any],
+        dt: np.ndarray,
+        values: np.ndarray,
+        codes: np.ndarray,
+        fetched_at: Optional[float] = None,
+    ):
+        self.provider = provider
+        self.city = city
+        self.dt = dt  # (N,) int64 unix seconds, ascending
+        self.values = values  # (len(COLUMNS), N) float64, NaN when missing
+        self.codes = codes  # (N,) int16 index into the condition table, -1 when missing
+        # unix seconds when the provider produced it; stored as the snapshot time
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any], fetched_at: Optional[float] = None) -> "ForecastSeries":
+        items = sorted(payload.get("list") or [], key=lambda it: int(it.get("dt", 0)))
+        n = len(items)
+        dt = np.fromiter((int(it.get("dt", 0)) for it in items), dtype=np.int64, count=n)
+        values = np.empty((len(COLUMNS), n))
+        codes = np.full(n, -1, dtype=np.int16)
+        for j, item in enumerate(items):
+            for i, (_, path) in enumerate(COLUMNS):
+                values[i, j] = _lookup(item, path)
+            weather = item.get("weather") or []
+            if weather:
+                codes[j] = intern_condition(weather[0])
+        return cls(payload.get("provider", "openweather"), dict(payload.get("city") or {}), dt, values, codes, fetched_at)
+
+    def __len__(self) -> int:
+        return len(self.dt)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.values[COLUMN_INDEX[name]]
+
+    def __getitem__(self, window: slice) -> "ForecastSeries":
+        """Slice steps; the result shares memory with this series."""
+        if not isinstance(window, slice):
+            raise TypeError("ForecastSeries only supports slicing; use item() for a single step")
+        return ForecastSeries(self.provider, self.city, self.dt[window], self.values[:, window], self.codes[window], self.fetched_at)
+
+    def between(self, start: Optional[int] = None, end: Optional[int] = None) -> "ForecastSeries":
+        """Steps with ``start <= dt < end`` (unix seconds), without copying."""
+        lo = 0 if start is None else int(np.searchsorted(self.dt, start, side="left"))
+        hi = len(self.dt) if end is None else int(np.searchsorted(self.dt, end, side="left"))
+        return self[lo:hi]
+
+    def nearest(self, target: int) -> int:
+        """Index of the step closest to ``target``."""
+        return int(np.abs(self.dt - target).argmin())
+
+    def weather(self, j: int) -> List[Dict[str, Any]]:
+        cond = condition(int(self.codes[j]))
+        return [cond] if cond is not None else []
+
+    def item(self, j: int) -> Dict[str, Any]:
+        """Rebuild the OpenWeather-shaped list item for step ``j``."""
+        ts = int(self.dt[j])
+        item: Dict[str, Any] = {"dt": ts}
+        for i, (name, path) in enumerate(COLUMNS):
+            value = self.values[i, j]
+            if np.isnan(value):
+                continue
+            value = int(value) if name in _INT_COLUMNS and value.is_integer() else float(value)
+            target = item
+            for part in path[:-1]:
+                target = target.setdefault(part, {})
+            target[path[-1]] = value
+        item["weather"] = self.weather(j)
+        item["dt_txt"] = datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        return item
+
+    def items(self) -> Iterator[Dict[str, Any]]:
+        for j in range(len(self.dt)):
+            yield self.item(j)
+
+    def to_payload(self) -> Dict[str, Any]:
+        items = list(self.items())
+        return {"cod": "200", "cnt": len(items), "list": items, "city": self.city, "provider": self.provider}
+
+    def to_bytes(self) -> bytes:
+        """Compact wire form for the shared cache."""
+        used = sorted({int(c) for c in self.codes if c >= 0})
+        remap = np.full(max(used, default=-1) + 2, -1, dtype=np.int16)
+        for local, idx in enumerate(used):
+            remap[idx] = local
+        meta = json.dumps(
+            {
+                "provider": self.provider,
+                "city": self.city,
+                "fetched_at": self.fetched_at,
+                "columns": [name for name, _ in COLUMNS],
+                "conditions": [list(_conditions[idx]) for idx in used],
+            },
+            separators=(",", ":"),
+        ).encode()
+        codes = remap[self.codes].astype(">i2")
+        return b"".join((
+            _WIRE_HEADER.pack(len(meta), len(self.dt), len(COLUMNS)),
+            meta,
+            self.dt.astype(">i8").tobytes(),
+            np.ascontiguousarray(self.values).astype(">f8").tobytes(),
+            codes.tobytes(),
+        ))
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "ForecastSeries":
+        meta_len, n, ncols = _WIRE_HEADER.unpack_from(blob)
+        offset = _WIRE_HEADER.size
+        meta = json.loads(blob[offset:offset + meta_len])
+        offset += meta_len
+        dt = np.frombuffer(blob, dtype=">i8", count=n, offset=offset).astype(np.int64)
+        offset += 8 * n
+        raw = np.frombuffer(blob, dtype=">f8", count=n * ncols, offset=offset).reshape(ncols, n)
+        offset += 8 * n * ncols
+        local_codes = np.frombuffer(blob, dtype=">i2", count=n, offset=offset).astype(np.int16)
+        # map columns by name so entries written with another column set still load
+        values = np.full((len(COLUMNS), n), np.nan)
+        for i, name in enumerate(meta["columns"]):
+            if name in COLUMN_INDEX:
+                values[COLUMN_INDEX[name]] = raw[i]
+        table = np.array(
+            [intern_condition(dict(zip(("id", "main", "description", "icon"), c))) for c in meta["conditions"]] + [-1],
+            dtype=np.int16,
+        )
+        codes = table[local_codes]
+        return cls(meta["provider"], meta["city"], dt, values, codes, meta.get("fetched_at"))
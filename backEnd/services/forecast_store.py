@@ -0,0 +1,277 @@
+"""Stored forecast snapshots as a cache tier behind the forecast caches.
+
+``store`` writes a series as one snapshot: a row per step in
+``weather_forecasts``, all with ``snapshot_time`` set to when the series was
+fetched. The provider's own ``list`` items go to the payload blob store when
+the caller has them: the series keeps only its columns, so items rebuilt from
+it would drop every other upstream key. Storing the same snapshot twice is a
+no-op (``uq_fc_loc_provider_kind_snap_time``), so the request endpoint and
+the write-back below can both store what they see; the request endpoint works
+from cached series and has no items, so its rows get their payloads when the
+write-back of the same snapshot lands.
+
+``latest`` is the read side. On a forecast cache miss ``WeatherService``
+asks it for the newest snapshot of the tile that is younger than
+``forecast_db_max_age`` and still reaches ``forecast_db_min_hours`` ahead,
+found through ``idx_fc_loc_kind_snap``; only tiles without one go upstream.
+After a restart the first request for each tile then reads the database
+instead of every worker calling the provider at once.
+
+Forecasts fetched upstream are handed to ``write_back``, which stores them
+from one background worker so the request that fetched them does not wait
+on the insert. The queue is bounded; when it is full the series is dropped
+(the next refresh stores a newer one).
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+from core.database import SessionLocal, insert_ignore
+from core.metrics import record_cache
+from models.model import Location, Provider, WeatherForecast, gen_uuid
+from services import identity, payload_store
+from services.forecast_series import ForecastSeries
+from services.identity import LocationRef, ProviderRef
+from services.tiling import Tile
+
+logger = logging.getLogger(__name__)
+
+KIND = "hourly"
+# length of one forecast step; a step is still useful until it has ended
+STEP_SECONDS = 3 * 3600
+_EPOCH = datetime(1970, 1, 1)
+
+# series column -> weather_forecasts column
+_VALUE_COLUMNS = (
+    ("temp", "temperature_c"),
+    ("temp_min", "temp_min_c"),
+    ("temp_max", "temp_max_c"),
+    ("humidity", "humidity_pct"),
+    ("pressure", "pressure_hpa"),
+    ("wind_speed", "wind_speed_ms"),
+    ("wind_gust", "wind_gust_ms"),
+    ("wind_deg", "wind_deg"),
+    ("rain_3h", "precip_mm"),
+    ("snow_3h", "snow_mm"),
+    ("clouds", "cloud_pct"),
+)
+_SNAPSHOT_KEY = ["location_id", "provider_id", "kind", "snapshot_time", "forecast_time"]
+
+
+def _utc(epoch: float) -> datetime:
+    return datetime.utcfromtimestamp(epoch)
+
+
+def _epoch(moment: datetime) -> float:
+    return (moment - _EPOCH).total_seconds()
+
+
+def _payload_hashes(db: Session, steps: List[int], items: Optional[Sequence[Dict[str, Any]]]) -> List[Optional[str]]:
+    """Blob hash of the provider item for each step, None where there is none."""
+    if not items:
+        return [None] * len(steps)
+    by_time = {int(item.get("dt", 0)): item for item in items}
+    found = [by_time.get(ts) for ts in steps]
+    hashes = iter(payload_store.put_many(db, [item for item in found if item is not None]))
+    return [next(hashes) if item is not None else None for item in found]
+
+
+def store(
+    db: Session,
+    location: LocationRef,
+    provider: ProviderRef,
+    series: ForecastSeries,
+    items: Optional[Sequence[Dict[str, Any]]] = None,
+) -> int:
+    """Store ``series`` as the snapshot taken at ``series.fetched_at``; return the rows inserted.
+
+    ``items`` are the provider's ``list`` items the series was built from;
+    without them rows are stored with no payload.
+    """
+    snapshot = _utc(series.fetched_at)
+    steps = series.dt.tolist()
+    # one Python list per column instead of a NumPy scalar per cell
+    columns = {name: [None if v != v else v for v in series.column(name).tolist()] for name, _ in _VALUE_COLUMNS + (("pop", None),)}
+    # provider items go to the content-addressed blob store; rows keep the hash
+    hashes = _payload_hashes(db, steps, items)
+    rows: List[Dict[str, Any]] = []
+    for j, ts in enumerate(steps):
+        weather = series.weather(j)
+        pop = columns["pop"][j]
+        row = {
+            "id": gen_uuid(),
+            "location_id": location.id,
+            "provider_id": provider.id,
+            "kind": KIND,
+            "snapshot_time": snapshot,
+            "forecast_time": _utc(ts),
+            "pop_pct": pop * 100 if pop is not None else None,
+            "weather_code": str(weather[0]["id"]) if weather and weather[0].get("id") is not None else None,
+            "payload_hash": hashes[j],
+        }
+        for name, column in _VALUE_COLUMNS:
+            row[column] = columns[name][j]
+        rows.append(row)
+    stored = len(insert_ignore(db, WeatherForecast, rows, _SNAPSHOT_KEY, returning=(WeatherForecast.id,)))
+    if stored < len(rows) and items:
+        # rows of this snapshot stored earlier without items get their payloads now
+        table = WeatherForecast.__table__
+        db.execute(
+            update(table)
+            .where(
+                table.c.location_id == location.id,
+                table.c.provider_id == provider.id,
+                table.c.kind == KIND,
+                table.c.snapshot_time == snapshot,
+                table.c.forecast_time == bindparam("step_time"),
+                table.c.payload_hash.is_(None),
+            )
+            .values(payload_hash=bindparam("step_hash")),
+            [{"step_time": row["forecast_time"], "step_hash": row["payload_hash"]} for row in rows if row["payload_hash"] is not None],
+        )
+    offset = series.city.get("timezone")
+    if offset is not None:
+        # the offset moves with DST; keep the one that goes with the newest snapshot
+        db.execute(
+            update(Location)
+            .where(Location.id == location.id, (Location.utc_offset.is_(None)) | (Location.utc_offset != int(offset)))
+            .values(utc_offset=int(offset))
+        )
+    db.commit()
+    return stored
+
+
+def _snapshots(db: Session, location_id: str, fresh_after: datetime) -> List[Tuple[str, datetime]]:
+    """(provider_id, snapshot_time) of each provider's newest fresh snapshot, newest first."""
+    newest = func.max(WeatherForecast.snapshot_time)
+    stmt = (
+        select(WeatherForecast.provider_id, newest)
+        .where(WeatherForecast.location_id == location_id, WeatherForecast.kind == KIND, WeatherForecast.snapshot_time >= fresh_after)
+        .group_by(WeatherForecast.provider_id)
+        .order_by(newest.desc())
+    )
+    return [(provider_id, snapshot) for provider_id, snapshot in db.execute(stmt)]
+
+
+def _load_snapshot(db: Session, location: LocationRef, provider_id: str, snapshot: datetime, now: float) -> Optional[ForecastSeries]:
+    stmt = (
+        select(WeatherForecast.forecast_time, WeatherForecast.payload_hash)
+        .where(
+            WeatherForecast.location_id == location.id,
+            WeatherForecast.provider_id == provider_id,
+            WeatherForecast.kind == KIND,
+            WeatherForecast.snapshot_time == snapshot,
+            WeatherForecast.forecast_time > _utc(now - STEP_SECONDS),
+        )
+        .order_by(WeatherForecast.forecast_time)
+    )
+    rows = db.execute(stmt).all()
+    if not rows or any(digest is None for _, digest in rows):
+        return None
+    if _epoch(rows[-1][0]) < now + settings.forecast_db_min_hours * 3600:
+        return None
+    payloads = payload_store.load_many(db, [digest for _, digest in rows])
+    if len(payloads) < len({digest for _, digest in rows}):
+        return None
+    provider = db.execute(select(Provider.name).where(Provider.id == provider_id)).scalar_one()
+    utc_offset = db.execute(select(Location.utc_offset).where(Location.id == location.id)).scalar_one()
+    return ForecastSeries.from_payload(
+        {
+            "list": [payloads[digest] for _, digest in rows],
+            "city": {"name": location.canonical_name, "country": "", "timezone": utc_offset or 0},
+            "provider": provider,
+        },
+        fetched_at=_epoch(snapshot),
+    )
+
+
+def latest(db: Session, lat: float, lon: float, now: Optional[float] = None) -> Optional[ForecastSeries]:
+    """The newest stored snapshot for (lat, lon) that can stand in for an upstream fetch."""
+    now = time.time() if now is None else now
+    series = None
+    location = identity.find_location(db, lat, lon)
+    if location is not None:
+        for provider_id, snapshot in _snapshots(db, location.id, _utc(now - settings.forecast_db_max_age)):
+            series = _load_snapshot(db, location, provider_id, snapshot, now)
+            if series is not None:
+                break
+    record_cache("forecast_db", series is not None)
+    return series
+
+
+def latest_for_tile(tile: Tile) -> Optional[ForecastSeries]:
+    """``latest`` in its own session; database errors count as a miss."""
+    try:
+        with SessionLocal() as db:
+            return latest(db, tile.lat, tile.lon)
+    except Exception as e:
+        logger.warning("stored forecast lookup failed for %s: %s", tile.key, e)
+        return None
+
+
+class WriteBack:
+    """Stores upstream forecasts from a single background worker."""
+
+    def __init__(self, max_pending: int) -> None:
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def submit(
+        self,
+        tile: Tile,
+        series: ForecastSeries,
+        base_url: Optional[str] = None,
+        items: Optional[Sequence[Dict[str, Any]]] = None,
+    ) -> bool:
+        """Queue ``series`` (and the provider ``items`` it came from) for storage against ``tile``; False if it was dropped."""
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not asyncio.get_running_loop():
+            self._queue = asyncio.Queue(self.max_pending)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+        try:
+            self._queue.put_nowait((tile, series, base_url, items))
+        except asyncio.QueueFull:
+            logger.warning("forecast write-back queue full; dropped %s", tile.key)
+            return False
+        return True
+
+    @staticmethod
+    def _store(tile: Tile, series: ForecastSeries, base_url: Optional[str], items: Optional[Sequence[Dict[str, Any]]]) -> int:
+        with SessionLocal() as db:
+            provider = identity.resolve_provider(db, series.provider, base_url)
+            location = identity.resolve_location(db, tile.lat, tile.lon, series.city.get("name") or None)
+            return store(db, location, provider, series, items)
+
+    async def _run(self) -> None:
+        while True:
+            tile, series, base_url, items = await self._queue.get()
+            try:
+                await run_in_threadpool(self._store, tile, series, base_url, items)
+            except Exception:
+                logger.exception("forecast write-back failed for %s", tile.key)
+            finally:
+                self._queue.task_done()
+
+    async def drain(self) -> None:
+        """Wait for queued series to be stored, then stop the worker."""
+        if self._worker is None:
+            return
+        if not self._worker.done():
+            await self._queue.join()
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
+
+write_back = WriteBack(settings.forecast_write_back_queue)
@@ -0,0 +1,189 @@
+"""Fingerprinted, precompressed frontend assets, built once at startup.
+
+``FrontendBundle.build`` copies every non-HTML file under ``FRONTEND_DIR``
+to ``FRONTEND_BUILD_DIR`` as ``<name>.<content hash>.<ext>`` next to
+``.gz`` and, if the ``brotli`` module is installed, ``.br`` variants.
+Compressed variants are only kept when they are smaller. Because a name
+changes whenever its content does, assets are served with
+``Cache-Control: immutable`` and a page load after the first fetches none
+of them.
+
+HTML pages are kept in memory with their ``href``/``src`` references to
+local assets rewritten to the fingerprinted URLs. Each page gets a small
+``window.WEATHER_BOOTSTRAP`` script before ``</head>``: the API base URL and,
+when this worker already holds it, the default location's summary, so the
+first paint needs no API round trip. Rendered pages are memoized per
+bootstrap, so a page is only re-rendered and recompressed when the
+bootstrap changes.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import tempfile
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from core.config import settings
+from services import climatology, geo_service
+from services.tiling import tile_scheme
+from services.weather_service import WeatherService, forecast_cache
+
+logger = logging.getLogger("weather.frontend")
+
+STATIC_PREFIX = "/static/"
+API_BASE = "/api/weather"
+# only text-like types are worth compressing
+_COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+_REFERENCE = re.compile(r'(?P<attr>\b(?:href|src)=)(?P<quote>["\'])(?P<url>[^"\']+)(?P=quote)')
+_HEAD_END = re.compile(rb"</head>", re.IGNORECASE)
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+@dataclass
+class Asset:
+    url: str
+    media_type: str
+    # encoding ("identity", "gzip", "br") -> (path, stat), stat taken once so serving never touches the disk first
+    files: Dict[str, Tuple[str, os.stat_result]] = field(default_factory=dict)
+
+
+class Rendered(NamedTuple):
+    body: bytes
+    gzipped: bytes
+    etag: str
+
+
+@dataclass
+class Page:
+    template: bytes
+    # bootstrap JSON -> rendered page
+    rendered: Dict[str, Rendered] = field(default_factory=dict)
+
+
+def _fingerprinted(rel_path: str, digest: str) -> str:
+    stem, ext = posixpath.splitext(rel_path)
+    return f"{stem}.{digest}{ext}"
+
+
+def _write(path: str, data: bytes) -> Tuple[str, os.stat_result]:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # workers sharing a build directory write identical files; replace atomically so none reads a partial one
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path, os.stat(path)
+
+
+def _script_json(value: Any) -> str:
+    """JSON that cannot close the ``<script>`` element it is inlined in."""
+    return json.dumps(value, separators=(",", ":")).replace("<", "\\u003c").replace("\u2028", "\\u2028").replace("\u2029", "\\u2029")
+
+
+class FrontendBundle:
+    def __init__(self):
+        self.assets: Dict[str, Asset] = {}
+        self.pages: Dict[str, Page] = {}
+        self.build_dir: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.pages)
+
+    def build(self, source_dir: str, build_dir: str = "") -> None:
+        """Fingerprint and compress ``source_dir`` into ``build_dir`` (a new temporary directory if empty)."""
+        source_dir = os.path.abspath(source_dir)
+        self.build_dir = os.path.abspath(build_dir) if build_dir else tempfile.mkdtemp(prefix="weather-frontend-")
+        brotli = _brotli()
+        assets: Dict[str, Asset] = {}
+        by_source: Dict[str, str] = {}
+        html: List[Tuple[str, bytes]] = []
+        for root, dirs, files in os.walk(source_dir):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                if name.startswith("."):
+                    continue
+                full = os.path.join(root, name)
+                rel = os.path.relpath(full, source_dir).replace(os.sep, "/")
+                with open(full, "rb") as f:
+                    data = f.read()
+                if name.endswith((".html", ".htm")):
+                    html.append((rel, data))
+                    continue
+                url_path = _fingerprinted(rel, hashlib.sha256(data).hexdigest()[:12])
+                media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                asset = Asset(STATIC_PREFIX + url_path, media_type)
+                target = os.path.join(self.build_dir, *url_path.split("/"))
+                asset.files["identity"] = _write(target, data)
+                if media_type.startswith(_COMPRESSIBLE):
+                    variants = [("gzip", ".gz", gzip.compress(data, 9, mtime=0))]
+                    if brotli is not None:
+                        variants.append(("br", ".br", brotli.compress(data, quality=11)))
+                    for encoding, suffix, body in variants:
+                        if len(body) < len(data):
+                            asset.files[encoding] = _write(target + suffix, body)
+                assets[asset.url] = asset
+                by_source[rel] = asset.url
+        self.assets = assets
+        self.pages = {rel: Page(self._link(rel, data, by_source)) for rel, data in html}
+        logger.info("frontend: %d assets, %d pages built into %s (brotli %s)", len(assets), len(html), self.build_dir, "on" if brotli else "off")
+
+    @staticmethod
+    def _link(page: str, data: bytes, by_source: Dict[str, str]) -> bytes:
+        """Point the page's references to local assets at their fingerprinted URLs."""
+        base = posixpath.dirname(page)
+
+        def swap(match: "re.Match[str]") -> str:
+            url = match.group("url")
+            if "://" in url or url.startswith(("/", "#", "data:", "mailto:")):
+                return match.group(0)
+            path = url.split("?", 1)[0].split("#", 1)[0]
+            target = by_source.get(posixpath.normpath(posixpath.join(base, path)))
+            if target is None:
+                return match.group(0)
+            return f'{match.group("attr")}{match.group("quote")}{target}{match.group("quote")}'
+
+        return _REFERENCE.sub(swap, data.decode("utf-8")).encode("utf-8")
+
+    def bootstrap(self) -> Dict[str, Any]:
+        """What the page needs before its first API call, from memory only."""
+        out: Dict[str, Any] = {"apiBase": API_BASE}
+        lat, lon = settings.default_lat, settings.default_lon
+        series = forecast_cache.peek(tile_scheme.tile_for(lat, lon).key)
+        if series is not None:
+            summary = WeatherService().build_context(series, None, climatology.baselines.peek(lat, lon))
+            summary["place"] = geo_service.cached_place(lat, lon) or summary["place"] or f"{lat:.4f}, {lon:.4f}"
+            out["summary"] = summary
+        return out
+
+    def render(self, page: str) -> Optional[Rendered]:
+        """``page`` with its bootstrap inlined; None if there is no such page."""
+        entry = self.pages.get(page)
+        if entry is None:
+            return None
+        boot = _script_json(self.bootstrap())
+        rendered = entry.rendered.get(boot)
+        if rendered is None:
+            script = f"<script>window.WEATHER_BOOTSTRAP={boot};</script>\n".encode("utf-8")
+            match = _HEAD_END.search(entry.template)
+            at = match.start() if match else 0
+            body = entry.template[:at] + script + entry.template[at:]
+            rendered = Rendered(body, gzip.compress(body, 6, mtime=0), '"' + hashlib.sha256(body).hexdigest()[:16] + '"')
+            # one bootstrap at a time: the previous one is stale
+            entry.rendered = {boot: rendered}
+        return rendered
+
+bundle = FrontendBundle()
@@ -1,30 +1,71 @@
+import asyncio
+import time
 from typing import Dict, Any, Optional, List
 import httpx
 from fastapi import HTTPException
+from core.admission import TokenBucket
 from core.config import settings
+from core import timing
+from core.metrics import observe_upstream
+
+
+class RateLimiter:
+    """Token bucket shared by every upstream geocoding call in this worker; a rate of 0 disables it."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._bucket = TokenBucket(self.burst, time.monotonic())
+
+    async def wait(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            delay = self._bucket.take(self.rate, self.burst, time.monotonic())
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+
+rate_limiter = RateLimiter(settings.geocode_rate_limit, settings.geocode_rate_burst)
 
 
 class GeoClient:
-    def __init__(self, base_url: str = "http://api.openweathermap.org/geo/1.0"):
-        self.base_url = base_url
+    def __init__(self, base_url: Optional[str] = None, http: Optional[httpx.AsyncClient] = None):
+        self.base_url = base_url or settings.geo_base_url
+        # a caller making many calls passes one client so they share its keep-alive connections
+        self.http = http
 
     async def get(self, path: str, params: Dict[str, Any]) -> Any:
         url = f"{self.base_url}/{path}"
         timeout = httpx.Timeout(settings.api_timeout)
+        # waiting for the rate limit is not upstream latency
+        await rate_limiter.wait()
+        started = time.perf_counter()
+        status = "error"
         try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.get(url, params=params)
-                if response.status_code == 401:
-                    raise HTTPException(
-                        status_code=502,
-                        detail="OpenWeather API authentication failed (401). Check API key."
-                    )
-                response.raise_for_status()
-                return response.json()
+            if self.http is not None:
+                response = await self.http.get(url, params=params)
+            else:
+                async with httpx.AsyncClient(timeout=timeout) as client:
+                    response = await client.get(url, params=params)
+            status = str(response.status_code)
+            if response.status_code == 401:
+                raise HTTPException(
+                    status_code=502,
+                    detail="OpenWeather API authentication failed (401). Check API key."
+                )
+            response.raise_for_status()
+            return response.json()
         except httpx.ReadTimeout:
+            status = "timeout"
             raise HTTPException(status_code=504, detail="Geocoding upstream request timed out")
         except httpx.HTTPError as e:
             raise HTTPException(status_code=502, detail=f"Geocoding upstream request failed: {str(e)}")
+        finally:
+            elapsed = time.perf_counter() - started
+            observe_upstream(f"geo/{path}", status, elapsed)
+            timing.record("geo", elapsed)
 
     async def direct(self, q: str, appid: str, limit: int = 1) -> List[Dict[str, Any]]:
         return await self.get("direct", {"q": q, "limit": limit, "appid": appid})
@@ -1,13 +1,50 @@
 from typing import Optional, Tuple
 from core.config import settings
+from services.cache import TTLCache
+from services.shared_cache import TieredCache, shared_backend
 from .geo_client import GeoClient
 
+# Place names change rarely, so geocodes are cached for a day and shared between workers.
+_MISSING = object()
+geocode_cache = TieredCache(TTLCache("geocode", settings.geocode_cache_ttl, 20000), shared_backend, settings.cache_namespace)
+
+
+def query_key(q: str) -> str:
+    # case, runs of whitespace and spaces around commas don't change what the geocoder finds
+    parts = (" ".join(part.split()) for part in q.casefold().split(","))
+    return "q:" + ",".join(part for part in parts if part)
+
+
+def _reverse_key(lat: float, lon: float) -> str:
+    # ~100 m: finer than any place name
+    return f"rev:{round(float(lat), 3)}:{round(float(lon), 3)}"
+
+
+def cached_coords(q: str) -> Optional[Tuple[float, float, str]]:
+    """The geocode of ``q`` if this worker already holds it."""
+    cached = geocode_cache.local.peek(query_key(q))
+    return tuple(cached) if cached else None
+
+
+def has_cached_place(lat: float, lon: float) -> bool:
+    """Whether this worker holds the reverse geocode of (lat, lon)."""
+    return geocode_cache.local.peek(_reverse_key(lat, lon), _MISSING) is not _MISSING
+
+
+def cached_place(lat: float, lon: float) -> Optional[str]:
+    """The reverse geocode of (lat, lon) if this worker holds it and it found a place."""
+    return geocode_cache.local.peek(_reverse_key(lat, lon))
+
+
 class GeoService:
     def __init__(self, client: GeoClient | None = None):
         self.client = client or GeoClient()
     async def  resolve_coords_from_query(self, q: str) -> Optional[Tuple[float, float, str]]:
         '''Returns latitude, longitude and city name of the given query.'''
+        cached = await geocode_cache.get_or_load(query_key(q), lambda: self._direct(q))
+        return tuple(cached) if cached else None
 
+    async def _direct(self, q: str) -> Optional[list]:
         rows = await self.client.direct(q=q, appid = settings.api_weather_key, limit = 1)
         if not rows:
             return None
@@ -17,11 +54,13 @@ class GeoService:
         country = row.get("country") or ""
         state = row.get("state") or ""
         place = ", ".join([p for p in [name, state, country] if p])
-        return (lat, lon, place)
+        return [lat, lon, place]
     async def resolve_place_from_coords(self, lat:float, lon:float) -> Optional[str]:
         '''Returns city name of the given latitude and longitude.'''
+        return await geocode_cache.get_or_load(_reverse_key(lat, lon), lambda: self._reverse(lat, lon))
+
+    async def _reverse(self, lat: float, lon: float) -> Optional[str]:
         rows = await self.client.reverse(lat=lat, lon=lon, appid=settings.api_weather_key, limit=1)
-        print(rows)
         if not rows:
             return None
         row = rows[0]
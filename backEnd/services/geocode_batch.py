@@ -0,0 +1,153 @@
+"""Geocode many place queries at once, asking upstream only for what is unknown.
+
+Queries are deduplicated by the key the geocode cache uses (case and
+whitespace folded), then answered in three passes:
+
+1. ``cache``: this worker's geocode cache;
+2. ``stored``: a stored location whose name or alias matches the query
+   (``location_index``, loaded from ``locations`` and ``location_aliases``);
+3. ``geocoder``: ``GeoService.resolve_coords_from_query``, which checks the
+   shared cache tier and coalesces concurrent lookups of the same query.
+
+OpenWeather's geocoder takes one query per call, so the remaining lookups
+share one HTTP connection pool, hold one of ``GEOCODE_BATCH_CONCURRENCY``
+upstream slots per worker (shared by every batch running in it) and wait
+for ``GEOCODE_RATE_LIMIT`` like any other geocoding call.
+
+Resolved points are then written with one batched location upsert
+(``identity.resolve_locations``) and one alias insert, so every item gets a
+``location_id`` and the next batch finds the same queries in pass 2.
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+from core.database import insert_ignore
+from models.model import LocationAlias, gen_uuid
+from services import geo_service, identity
+from services.geo_client import GeoClient
+from services.location_index import ensure_loaded as ensure_location_index, location_index, normalize as normalize_place
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ("cache", "stored", "geocoder")
+
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def _upstream_slots() -> asyncio.Semaphore:
+    # created on first use so it binds to the running loop
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(settings.geocode_batch_concurrency)
+    return _slots
+
+
+def _found(source: str, lat: float, lon: float, place: Optional[str], location_id: Optional[str] = None) -> Dict[str, Any]:
+    return {"status": "ok", "source": source, "lat": lat, "lon": lon, "place": place, "location_id": location_id}
+
+
+def _stored(db: Session, queries: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    """Queries matching a stored location's name or alias, by key."""
+    ensure_location_index(db)
+    out = {}
+    for key, q in queries.items():
+        match = location_index.lookup(q)
+        if match is not None:
+            out[key] = _found("stored", match["latitude"], match["longitude"], match["name"], match["location_id"])
+    return out
+
+
+def _persist(db: Session, results: Dict[str, Dict[str, Any]], queries: Dict[str, str]) -> None:
+    """Give every resolved result a location, and remember each query as an alias of it."""
+    unsaved = [key for key, r in results.items() if r["status"] == "ok" and r["location_id"] is None]
+    refs = identity.resolve_locations(db, [(results[k]["lat"], results[k]["lon"], results[k]["place"]) for k in unsaved])
+    for key, ref in zip(unsaved, refs):
+        results[key]["location_id"] = ref.id
+    aliases: Dict[Tuple[str, str], identity.LocationRef] = {}
+    for key, ref in zip(unsaved, refs):
+        alias = normalize_place(queries[key])
+        if alias and alias != normalize_place(ref.canonical_name):
+            aliases[(ref.id, alias)] = ref
+    if aliases:
+        rows = [{"id": gen_uuid(), "location_id": location_id, "alias": alias} for location_id, alias in aliases]
+        insert_ignore(db, LocationAlias, rows, ["location_id", "alias"])
+        db.commit()
+        for (_, alias), ref in aliases.items():
+            location_index.add(ref.id, ref.canonical_name, ref.latitude, ref.longitude, aliases=[alias])
+
+
+async def geocode(
+    db: Session,
+    queries: Sequence[str],
+    persist: bool = True,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, Any]:
+    """Resolve ``queries``; ``{"items": [...], "stats": {...}}`` with items in input order.
+
+    Each item is ``{"q", "status": "ok" | "not_found" | "error", "source",
+    "lat", "lon", "place", "location_id"}`` (``detail`` instead of the
+    point for errors). ``on_progress(done, total)`` is called as upstream
+    lookups finish.
+    """
+    keys = [geo_service.query_key(q) for q in queries]
+    unique: Dict[str, str] = {}
+    for key, q in zip(keys, queries):
+        unique.setdefault(key, q)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for key, q in unique.items():
+        cached = geo_service.cached_coords(q)
+        if cached is not None:
+            results[key] = _found("cache", *cached)
+    pending = {key: q for key, q in unique.items() if key not in results}
+    if pending:
+        results.update(await run_in_threadpool(_stored, db, pending))
+
+    upstream = [key for key in unique if key not in results]
+    done = 0
+    if on_progress is not None:
+        on_progress(done, len(upstream))
+    if upstream:
+        slots = _upstream_slots()
+        limits = httpx.Limits(max_connections=settings.geocode_batch_concurrency, max_keepalive_connections=settings.geocode_batch_concurrency)
+        async with httpx.AsyncClient(timeout=httpx.Timeout(settings.api_timeout), limits=limits) as http:
+            geo = geo_service.GeoService(GeoClient(http=http))
+
+            async def lookup(key: str) -> None:
+                nonlocal done
+                async with slots:
+                    try:
+                        resolved = await geo.resolve_coords_from_query(unique[key])
+                    except HTTPException as e:
+                        results[key] = {"status": "error", "source": "geocoder", "detail": e.detail}
+                    except Exception as e:
+                        # one bad answer fails its own item, not the batch
+                        logger.warning("batch geocode of %r failed: %r", unique[key], e)
+                        results[key] = {"status": "error", "source": "geocoder", "detail": "geocoding failed"}
+                    else:
+                        results[key] = _found("geocoder", *resolved) if resolved else {"status": "not_found", "source": "geocoder"}
+                done += 1
+                if on_progress is not None:
+                    on_progress(done, len(upstream))
+
+            await asyncio.gather(*(lookup(key) for key in upstream))
+
+    if persist:
+        await run_in_threadpool(_persist, db, results, unique)
+
+    stats = {"items": len(queries), "unique": len(unique), **{source: 0 for source in SOURCES}, "not_found": 0, "errors": 0}
+    for result in results.values():
+        if result["status"] == "ok":
+            stats[result["source"]] += 1
+        else:
+            stats["not_found" if result["status"] == "not_found" else "errors"] += 1
+    items: List[Dict[str, Any]] = [{"q": q, **results[key]} for q, key in zip(queries, keys)]
+    return {"items": items, "stats": stats}
@@ -0,0 +1,227 @@
+"""Gridded forecast fields over a bounding box for map overlays.
+
+Tile centers covering the box are fetched concurrently (through the shared
+forecast cache) under a concurrency and time budget, sampled at the requested
+forecast time, and interpolated to the output raster with NumPy.
+"""
+
+import asyncio
+import logging
+import struct
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.config import settings
+from services.cache import TTLCache
+from services.forecast_series import ForecastSeries
+from services.tiling import Tile, tile_scheme
+
+logger = logging.getLogger(__name__)
+
+STEP_SECONDS = 3 * 3600
+
+# variable name -> (ForecastSeries column, value when missing)
+EXTRACTORS = {
+    "temp": ("temp", np.nan),
+    "wind": ("wind_speed", np.nan),
+    "precip": ("rain_3h", 0.0),
+}
+
+# (tile keys, forecast time, variables) -> TileField; lets panning inside the
+# same tile set re-rasterize without touching the forecasts again
+field_cache = TTLCache("grid_field", ttl=settings.forecast_cache_ttl, max_entries=512)
+# full request key -> encoded payload
+raster_cache = TTLCache("grid_raster", ttl=settings.forecast_cache_ttl, max_entries=256)
+
+
+class GridError(ValueError):
+    pass
+
+
+class TileField:
+    __slots__ = ("lats", "lons", "values", "forecast_time")
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, values: np.ndarray, forecast_time: int):
+        self.lats = lats  # (R,)
+        self.lons = lons  # (C,)
+        self.values = values  # (R, C, V), nan where a tile is missing
+        self.forecast_time = forecast_time
+
+
+def parse_bbox(raw: str) -> Tuple[float, float, float, float]:
+    """Parse ``min_lon,min_lat,max_lon,max_lat``."""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(p) for p in raw.split(","))
+    except ValueError:
+        raise GridError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    if not (-90 <= min_lat < max_lat <= 90 and -180 <= min_lon < max_lon <= 180):
+        raise GridError("bbox is out of range or empty")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def parse_res(raw: str) -> Tuple[int, int]:
+    """Parse ``WxH`` or a single size for a square raster."""
+    try:
+        width, _, height = raw.lower().partition("x")
+        w = int(width)
+        h = int(height) if height else w
+    except ValueError:
+        raise GridError("res must be WIDTHxHEIGHT")
+    if not (1 <= w <= settings.grid_max_pixels and 1 <= h <= settings.grid_max_pixels):
+        raise GridError(f"res must be between 1 and {settings.grid_max_pixels} per side")
+    return w, h
+
+
+def _sample(series: ForecastSeries, target: Optional[int], variables: Sequence[str]) -> Tuple[int, List[float]]:
+    if not len(series):
+        return 0, [np.nan] * len(variables)
+    j = 0 if target is None else series.nearest(target)
+    values = []
+    for name in variables:
+        column, missing = EXTRACTORS[name]
+        value = series.column(column)[j]
+        values.append(missing if np.isnan(value) else float(value))
+    return int(series.dt[j]), values
+
+
+async def build_field(
+    fetch,
+    bbox: Tuple[float, float, float, float],
+    variables: Sequence[str],
+    target_time: Optional[int],
+) -> TileField:
+    """Fetch (or reuse) the tile forecasts covering ``bbox`` and sample them."""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lats, lons = tile_scheme.lattice(min_lat, min_lon, max_lat, max_lon)
+    if len(lats) * len(lons) > settings.grid_max_tiles:
+        raise GridError(f"bbox covers {len(lats) * len(lons)} tiles; zoom in (limit {settings.grid_max_tiles})")
+    tiles: List[List[Tile]] = [[tile_scheme.tile_for(la, lo) for lo in lons] for la in lats]
+    snapped = None if target_time is None else target_time - target_time % STEP_SECONDS
+    cache_key = (tuple(t.key for row in tiles for t in row), snapped, tuple(variables))
+    cached = field_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    semaphore = asyncio.Semaphore(settings.grid_fetch_concurrency)
+    values = np.full((len(lats), len(lons), len(variables)), np.nan)
+    times: List[int] = []
+
+    async def load(r: int, c: int, tile: Tile) -> None:
+        async with semaphore:
+            data = await fetch(tile.lat, tile.lon)
+        dt, sample = _sample(data, target_time, variables)
+        values[r, c, :] = sample
+        times.append(dt)
+
+    tasks = [asyncio.create_task(load(r, c, t)) for r, row in enumerate(tiles) for c, t in enumerate(row)]
+    done, pending = await asyncio.wait(tasks, timeout=settings.grid_fetch_budget)
+    for task in pending:
+        task.cancel()
+    # retrieve every finished task's exception, so none is reported as never retrieved
+    errors = [e for e in (t.exception() for t in done if not t.cancelled()) if e is not None]
+    if errors:
+        logger.warning("grid: %d of %d tile fetches failed, e.g. %r", len(errors), len(tasks), errors[0])
+    complete = not pending and not errors
+    if not times:
+        raise GridError("no forecasts available for this bbox within the fetch budget")
+
+    field = TileField(np.array(lats), np.array(lons), values, snapped if snapped is not None else min(times))
+    # only cache complete fields so a partial one is retried next time
+    if complete:
+        field_cache.set(cache_key, field)
+    return field
+
+
+def _pixel_centers(bbox: Tuple[float, float, float, float], width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+    min_lon, min_lat, max_lon, max_lat = bbox
+    lons = min_lon + (np.arange(width) + 0.5) * (max_lon - min_lon) / width
+    # row 0 is the top (northern) edge, as in images
+    lats = max_lat - (np.arange(height) + 0.5) * (max_lat - min_lat) / height
+    return lats, lons
+
+
+def bilinear(field: TileField, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Bilinear interpolation of the tile lattice to a (H, W, V) raster."""
+    R, C = len(field.lats), len(field.lons)
+
+    def axis(coords: np.ndarray, centers: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        if n == 1:
+            return np.zeros(coords.size, dtype=np.intp), np.zeros(coords.size)
+        step = centers[1] - centers[0]
+        pos = np.clip((coords - centers[0]) / step, 0, n - 1)
+        i0 = np.minimum(np.floor(pos).astype(np.intp), n - 2)
+        return i0, pos - i0
+
+    r0, fr = axis(lats, field.lats, R)
+    c0, fc = axis(lons, field.lons, C)
+    r1 = np.minimum(r0 + 1, R - 1)
+    c1 = np.minimum(c0 + 1, C - 1)
+    v = field.values
+    fr = fr[:, None, None]
+    fc = fc[None, :, None]
+    top = v[r0][:, c0] * (1 - fc) + v[r0][:, c1] * fc
+    bottom = v[r1][:, c0] * (1 - fc) + v[r1][:, c1] * fc
+    return top * (1 - fr) + bottom * fr
+
+
+def idw(field: TileField, lats: np.ndarray, lons: np.ndarray, power: float = 2.0) -> np.ndarray:
+    """Inverse-distance weighting from every known tile center to each pixel."""
+    grid_lat, grid_lon = np.meshgrid(field.lats, field.lons, indexing="ij")
+    flat_values = field.values.reshape(-1, field.values.shape[-1])
+    out = np.full((lats.size, lons.size, flat_values.shape[1]), np.nan)
+    for v in range(flat_values.shape[1]):
+        known = ~np.isnan(flat_values[:, v])
+        if not known.any():
+            continue
+        plat = grid_lat.ravel()[known]
+        plon = grid_lon.ravel()[known]
+        vals = flat_values[known, v]
+        # bound the (rows, W, N) temporaries to a few million elements
+        rows_per_chunk = max(1, 4_000_000 // (lons.size * plat.size))
+        for start in range(0, lats.size, rows_per_chunk):
+            chunk = lats[start:start + rows_per_chunk]
+            # equirectangular distance is plenty at viewport scale
+            scale = np.cos(np.radians(chunk))[:, None, None]
+            d2 = (chunk[:, None, None] - plat) ** 2 + ((lons[None, :, None] - plon) * scale) ** 2
+            w = 1.0 / np.maximum(d2, 1e-12) ** (power / 2)
+            out[start:start + rows_per_chunk, :, v] = (w @ vals) / w.sum(axis=-1)
+    return out
+
+
+def rasterize(field: TileField, bbox: Tuple[float, float, float, float], width: int, height: int, method: str) -> np.ndarray:
+    """Return a (V, H, W) float32 raster."""
+    lats, lons = _pixel_centers(bbox, width, height)
+    if method == "idw":
+        raster = idw(field, lats, lons)
+    else:
+        raster = bilinear(field, lats, lons)
+        holes = np.isnan(raster)
+        if holes.any():
+            raster = np.where(holes, idw(field, lats, lons), raster)
+    return np.ascontiguousarray(np.moveaxis(raster, -1, 0), dtype="<f4")
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def encode_png(band: np.ndarray) -> Tuple[bytes, float, float]:
+    """Encode one (H, W) band as 16-bit grayscale PNG scaled to its min/max.
+
+    Returns the PNG bytes and the (min, max) needed to decode pixel values;
+    NaN is written as 0 and valid values as 1..65535.
+    """
+    finite = np.isfinite(band)
+    lo = float(band[finite].min()) if finite.any() else 0.0
+    hi = float(band[finite].max()) if finite.any() else 0.0
+    span = (hi - lo) or 1.0
+    scaled = np.where(finite, 1 + np.round((np.nan_to_num(band, nan=lo) - lo) / span * 65534), 0).astype(">u2")
+    height, width = scaled.shape
+    # filter byte 0 (None) at the start of each scanline
+    rows = np.zeros((height, 1 + width * 2), dtype=np.uint8)
+    rows[:, 1:] = scaled.view(np.uint8).reshape(height, width * 2)
+    header = struct.pack(">IIBBBBB", width, height, 16, 0, 0, 0, 0)
+    png = b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header) + _png_chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)) + _png_chunk(b"IEND", b"")
+    return png, lo, hi
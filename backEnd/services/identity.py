@@ -0,0 +1,143 @@
+"""Process-wide identity cache for providers and locations.
+
+Providers are keyed by name and locations by coordinates rounded to five
+decimals (the ``uq_locations_lat_lon`` key). Neither row changes once it is
+created, so resolved ids are kept in bounded LRU caches and repeat requests
+for a place skip the database. Misses are resolved for a whole batch at once:
+one SELECT for rows that already exist, then ``INSERT ... ON CONFLICT DO
+NOTHING RETURNING`` for the rest. When two workers create the same place at
+the same time, the loser's insert is skipped and it reads back the winner's
+row instead of failing on the unique index.
+"""
+
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+
+from core.database import insert_ignore
+from models.model import Location, Provider, gen_uuid
+from services.cache import TTLCache
+from services.location_index import location_index
+
+COORD_DECIMALS = 5
+# coordinate pairs per SELECT; keeps SQLite well under its bound-parameter limit
+CHUNK_SIZE = 400
+# rows never change, so entries only leave the cache through LRU eviction
+_TTL = 7 * 86400
+
+
+class ProviderRef(NamedTuple):
+    id: str
+    name: str
+
+
+class LocationRef(NamedTuple):
+    id: str
+    canonical_name: str
+    latitude: float
+    longitude: float
+
+
+CoordKey = Tuple[float, float]
+
+provider_cache = TTLCache("provider_identity", ttl=_TTL, max_entries=256)
+location_cache = TTLCache("location_identity", ttl=_TTL, max_entries=50_000)
+
+_LOCATION_COLUMNS = (Location.id, Location.canonical_name, Location.latitude, Location.longitude)
+
+
+def coord_key(lat: float, lon: float) -> CoordKey:
+    return (round(float(lat), COORD_DECIMALS), round(float(lon), COORD_DECIMALS))
+
+
+def resolve_provider(db: Session, name: str, base_url: Optional[str] = None) -> ProviderRef:
+    ref = provider_cache.get(name)
+    if ref is not None:
+        return ref
+    row = db.execute(select(Provider.id, Provider.name).where(Provider.name == name)).first()
+    if row is None:
+        inserted = insert_ignore(
+            db, Provider, [{"id": gen_uuid(), "name": name, "base_url": base_url}], ["name"], returning=(Provider.id, Provider.name)
+        )
+        db.commit()
+        row = inserted[0] if inserted else db.execute(select(Provider.id, Provider.name).where(Provider.name == name)).one()
+    ref = ProviderRef(*row)
+    provider_cache.set(name, ref)
+    return ref
+
+
+def _chunks(items: Sequence, size: int = CHUNK_SIZE) -> Iterable[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _select_locations(db: Session, keys: Sequence[CoordKey]) -> Dict[CoordKey, LocationRef]:
+    found: Dict[CoordKey, LocationRef] = {}
+    for chunk in _chunks(keys):
+        stmt = select(*_LOCATION_COLUMNS).where(tuple_(Location.latitude, Location.longitude).in_(list(chunk)))
+        for row in db.execute(stmt):
+            ref = LocationRef(*row)
+            found[(ref.latitude, ref.longitude)] = ref
+    return found
+
+
+def _load_locations(db: Session, missing: Dict[CoordKey, Optional[str]]) -> Dict[CoordKey, LocationRef]:
+    found = _select_locations(db, list(missing))
+    new = [key for key in missing if key not in found]
+    if not new:
+        return found
+    rows = [
+        {"id": gen_uuid(), "latitude": lat, "longitude": lon, "canonical_name": missing[(lat, lon)] or f"{lat:.5f}, {lon:.5f}"}
+        for lat, lon in new
+    ]
+    created = [LocationRef(*row) for row in insert_ignore(db, Location, rows, ["latitude", "longitude"], returning=_LOCATION_COLUMNS)]
+    db.commit()
+    for ref in created:
+        found[(ref.latitude, ref.longitude)] = ref
+        location_index.add(ref.id, ref.canonical_name, ref.latitude, ref.longitude)
+    # rows another worker inserted first (or every row, when RETURNING is unavailable)
+    raced = [key for key in new if key not in found]
+    if raced:
+        found.update(_select_locations(db, raced))
+    return found
+
+
+def find_location(db: Session, lat: float, lon: float) -> Optional[LocationRef]:
+    """The location at (lat, lon) if one exists; never creates it."""
+    key = coord_key(lat, lon)
+    ref = location_cache.get(key)
+    if ref is None:
+        ref = _select_locations(db, [key]).get(key)
+        if ref is not None:
+            location_cache.set(key, ref)
+    return ref
+
+
+def resolve_locations(db: Session, points: Sequence[Tuple[float, float, Optional[str]]]) -> List[LocationRef]:
+    """Resolve (lat, lon, canonical_name) points to locations, creating missing ones.
+
+    The name is only used for rows this call creates. Results are in input
+    order; points that round to the same key share one location.
+    """
+    keys = [coord_key(lat, lon) for lat, lon, _ in points]
+    resolved: Dict[CoordKey, LocationRef] = {}
+    missing: Dict[CoordKey, Optional[str]] = {}
+    for key, (_, _, name) in zip(keys, points):
+        if key in resolved or key in missing:
+            continue
+        ref = location_cache.get(key)
+        if ref is not None:
+            resolved[key] = ref
+        else:
+            missing[key] = name
+    if missing:
+        loaded = _load_locations(db, missing)
+        for key, ref in loaded.items():
+            location_cache.set(key, ref)
+        resolved.update(loaded)
+    return [resolved[key] for key in keys]
+
+
+def resolve_location(db: Session, lat: float, lon: float, canonical_name: Optional[str] = None) -> LocationRef:
+    return resolve_locations(db, [(lat, lon, canonical_name)])[0]
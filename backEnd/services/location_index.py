@@ -0,0 +1,196 @@
+"""In-memory prefix index over location names and aliases for autocomplete.
+
+Normalized names live in a sorted list searched with ``bisect``; results are
+ranked by how many weather requests each location has received. Short
+prefixes match many entries, so their ranked results are memoized and
+invalidated as entries or popularity change. A trigram index gives a typo
+tolerant fallback when a prefix has too few matches.
+"""
+
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from models.model import Location, LocationAlias, Request as RequestModel
+
+# prefixes up to this length have their ranked results memoized
+MEMO_PREFIX_LEN = 3
+# stop scanning a prefix range after this many matching entries
+SCAN_LIMIT = 5000
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.casefold().replace(",", " ").split())
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class LocationIndex:
+    def __init__(self):
+        self._entries: List[Tuple[str, str]] = []  # (normalized key, location_id), sorted
+        self._keys: Set[Tuple[str, str]] = set()
+        self._keys_by_location: Dict[str, List[str]] = defaultdict(list)
+        self._meta: Dict[str, Tuple[str, float, float]] = {}  # location_id -> (name, lat, lon)
+        self._popularity: Dict[str, int] = defaultdict(int)
+        self._trigram_index: Dict[str, Set[int]] = defaultdict(set)
+        self._trigram_keys: List[Tuple[str, str]] = []
+        self._memo: Dict[str, List[str]] = {}
+        self._lock = threading.RLock()
+        self.loaded = False
+
+    def load(self, db: Session) -> None:
+        """Build the index from locations, aliases and request counts."""
+        locations = db.execute(select(Location.id, Location.canonical_name, Location.latitude, Location.longitude)).all()
+        aliases = db.execute(select(LocationAlias.location_id, LocationAlias.alias)).all()
+        counts = db.execute(select(RequestModel.location_id, func.count()).group_by(RequestModel.location_id)).all()
+        with self._lock:
+            self.__init__()
+            for loc_id, name, lat, lon in locations:
+                self._meta[loc_id] = (name, lat, lon)
+            pairs = [(normalize(name), loc_id) for loc_id, name, _, _ in locations]
+            pairs += [(normalize(alias), loc_id) for loc_id, alias in aliases if loc_id in self._meta]
+            for pair in pairs:
+                if pair[0] and pair not in self._keys:
+                    self._keys.add(pair)
+                    self._keys_by_location[pair[1]].append(pair[0])
+                    self._entries.append(pair)
+                    self._index_trigrams(pair)
+            self._entries.sort()
+            for loc_id, n in counts:
+                self._popularity[loc_id] = n
+            self.loaded = True
+
+    def _index_trigrams(self, pair: Tuple[str, str]) -> None:
+        slot = len(self._trigram_keys)
+        self._trigram_keys.append(pair)
+        for gram in _trigrams(pair[0]):
+            self._trigram_index[gram].add(slot)
+
+    def _invalidate(self, key: str) -> None:
+        for n in range(1, min(len(key), MEMO_PREFIX_LEN) + 1):
+            self._memo.pop(key[:n], None)
+
+    def add(self, location_id: str, name: str, lat: float, lon: float, aliases: Iterable[str] = ()) -> None:
+        """Incrementally index a new location (or new aliases of a known one)."""
+        with self._lock:
+            if not self.loaded:
+                return
+            self._meta.setdefault(location_id, (name, lat, lon))
+            for text in (name, *aliases):
+                pair = (normalize(text), location_id)
+                if not pair[0] or pair in self._keys:
+                    continue
+                self._keys.add(pair)
+                self._keys_by_location[location_id].append(pair[0])
+                insort(self._entries, pair)
+                self._index_trigrams(pair)
+                self._invalidate(pair[0])
+
+    def bump(self, location_id: str, amount: int = 1) -> None:
+        """Record a request for ``location_id`` so it ranks higher."""
+        with self._lock:
+            if not self.loaded:
+                return
+            self._popularity[location_id] += amount
+            # popularity reorders every memoized prefix of this location's keys
+            for key in self._keys_by_location.get(location_id, ()):
+                self._invalidate(key)
+
+    def _ranked(self, loc_ids: Iterable[str]) -> List[str]:
+        unique = dict.fromkeys(loc_ids)
+        return sorted(unique, key=lambda i: (-self._popularity.get(i, 0), self._meta[i][0]))
+
+    def _prefix_matches(self, key: str) -> List[str]:
+        memo = self._memo.get(key)
+        if memo is not None:
+            return memo
+        start = bisect_left(self._entries, (key, ""))
+        matches = []
+        for i in range(start, min(start + SCAN_LIMIT, len(self._entries))):
+            entry_key, loc_id = self._entries[i]
+            if not entry_key.startswith(key):
+                break
+            matches.append(loc_id)
+        ranked = self._ranked(matches)
+        if len(key) <= MEMO_PREFIX_LEN:
+            self._memo[key] = ranked
+        return ranked
+
+    def _fuzzy_matches(self, key: str, exclude: Set[str], limit: int) -> List[str]:
+        grams = _trigrams(key)
+        scores: Dict[int, int] = defaultdict(int)
+        for gram in grams:
+            for slot in self._trigram_index.get(gram, ()):
+                scores[slot] += 1
+        best: Dict[str, float] = {}
+        for slot, shared in scores.items():
+            entry_key, loc_id = self._trigram_keys[slot]
+            if loc_id in exclude:
+                continue
+            # compare against the same-length head of the entry so prefixes still score well
+            head = _trigrams(entry_key[:len(key) + 1])
+            similarity = shared / len(grams | head)
+            if similarity >= 0.3 and similarity > best.get(loc_id, 0.0):
+                best[loc_id] = similarity
+        ordered = sorted(best, key=lambda i: (-best[i], -self._popularity.get(i, 0)))
+        return ordered[:limit]
+
+    def lookup(self, text: str) -> Optional[Dict[str, Any]]:
+        """The most requested location whose name or an alias normalizes to ``text`` exactly."""
+        key = normalize(text)
+        if not key:
+            return None
+        with self._lock:
+            start = bisect_left(self._entries, (key, ""))
+            matches = []
+            for entry_key, loc_id in self._entries[start:start + SCAN_LIMIT]:
+                if entry_key != key:
+                    break
+                matches.append(loc_id)
+            if not matches:
+                return None
+            loc_id = self._ranked(matches)[0]
+            name, lat, lon = self._meta[loc_id]
+            return {"location_id": loc_id, "name": name, "latitude": lat, "longitude": lon}
+
+    def suggest(self, prefix: str, limit: int = 10, fuzzy: bool = True) -> List[Dict[str, Any]]:
+        key = normalize(prefix)
+        if not key:
+            return []
+        with self._lock:
+            exact = self._prefix_matches(key)[:limit]
+            results = [(loc_id, "prefix") for loc_id in exact]
+            if fuzzy and len(exact) < limit and len(key) >= 3:
+                extra = self._fuzzy_matches(key, set(exact), limit - len(exact))
+                results += [(loc_id, "fuzzy") for loc_id in extra]
+            out = []
+            for loc_id, match in results:
+                name, lat, lon = self._meta[loc_id]
+                out.append({
+                    "location_id": loc_id,
+                    "name": name,
+                    "latitude": lat,
+                    "longitude": lon,
+                    "requests": self._popularity.get(loc_id, 0),
+                    "match": match,
+                })
+            return out
+
+
+location_index = LocationIndex()
+
+
+def ensure_loaded(db: Session) -> LocationIndex:
+    if not location_index.loaded:
+        location_index.load(db)
+    return location_index
@@ -0,0 +1,164 @@
+"""Content-addressed, compressed storage for raw provider payloads.
+
+Each payload is serialized canonically (sorted keys, compact separators) and
+stored once in ``payload_blobs`` under its SHA-256, so identical items from
+repeated snapshots share a row. Blobs are zlib-compressed, with a preset
+dictionary trained on stored payloads when one exists; the dictionary id is
+kept on the blob so older blobs stay readable after retraining. Rows only
+hold the hash, and blobs are decompressed when a caller asks for them.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from core.database import insert_ignore
+from models.model import PayloadBlob, PayloadDictionary
+from services.cache import TTLCache
+
+# zlib only looks back 32 KiB, so larger dictionaries are wasted
+MAX_DICTIONARY_SIZE = 32 * 1024
+_TOKEN = re.compile(rb'"[^"]{1,40}":[\[{]*|"[^"]{1,40}"|[,}\]]+')
+
+_dictionaries: Dict[int, bytes] = {}
+_current: Optional[Tuple[int, bytes]] = None
+_lock = threading.Lock()
+payload_cache = TTLCache("payload", ttl=3600, max_entries=2000)
+
+
+def canonical(payload: Any) -> bytes:
+    return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+
+
+def content_hash(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def compress(raw: bytes, dictionary: Optional[bytes] = None) -> bytes:
+    compressor = zlib.compressobj(6, zdict=dictionary) if dictionary else zlib.compressobj(6)
+    return compressor.compress(raw) + compressor.flush()
+
+
+def decompress(data: bytes, dictionary: Optional[bytes] = None) -> bytes:
+    decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def train_dictionary(samples: Sequence[bytes], size: int = 16 * 1024) -> bytes:
+    """Build a zlib preset dictionary from sample payloads.
+
+    Keys and repeated string values are ranked by how many samples contain
+    them; zlib favors the end of the dictionary, so the most common
+    fragments go last, after one complete sample as a structural template.
+    """
+    counts: Counter = Counter()
+    for sample in samples:
+        counts.update(set(_TOKEN.findall(sample)))
+    template = samples[-1][: size // 4] if samples else b""
+    budget = min(size, MAX_DICTIONARY_SIZE) - len(template)
+    chosen: List[bytes] = []
+    for fragment, seen in counts.most_common():
+        if seen < 2 or budget < len(fragment):
+            continue
+        chosen.append(fragment)
+        budget -= len(fragment)
+    return template + b"".join(reversed(chosen))
+
+
+def _dictionary(db: Session, dictionary_id: int) -> bytes:
+    data = _dictionaries.get(dictionary_id)
+    if data is None:
+        data = db.execute(select(PayloadDictionary.data).where(PayloadDictionary.id == dictionary_id)).scalar_one()
+        _dictionaries[dictionary_id] = data
+    return data
+
+
+def current_dictionary(db: Session) -> Tuple[Optional[int], Optional[bytes]]:
+    global _current
+    if _current is None:
+        with _lock:
+            row = db.execute(select(PayloadDictionary.id, PayloadDictionary.data).order_by(PayloadDictionary.id.desc()).limit(1)).first()
+            _current = (row[0], row[1]) if row else (0, b"")
+            if row:
+                _dictionaries[row[0]] = row[1]
+    return (_current[0], _current[1]) if _current[0] else (None, None)
+
+
+def save_dictionary(db: Session, data: bytes) -> int:
+    """Store a trained dictionary and compress new blobs with it."""
+    global _current
+    row = PayloadDictionary(data=data)
+    db.add(row)
+    db.commit()
+    with _lock:
+        _dictionaries[row.id] = data
+        _current = (row.id, data)
+    return row.id
+
+
+def put_many(db: Session, payloads: Iterable[Any]) -> List[str]:
+    """Store payloads (deduplicated) and return their hashes in order.
+
+    Blobs are written in the caller's transaction; commit to persist them.
+    """
+    dictionary_id, dictionary = current_dictionary(db)
+    hashes: List[str] = []
+    pending: Dict[str, bytes] = {}
+    for payload in payloads:
+        raw = payload if isinstance(payload, bytes) else canonical(payload)
+        digest = content_hash(raw)
+        hashes.append(digest)
+        pending.setdefault(digest, raw)
+    if not pending:
+        return hashes
+    # skip compressing blobs that are already stored
+    known = set(db.execute(select(PayloadBlob.hash).where(PayloadBlob.hash.in_(list(pending)))).scalars())
+    rows = [
+        {"hash": digest, "dictionary_id": dictionary_id, "raw_size": len(raw), "data": compress(raw, dictionary)}
+        for digest, raw in pending.items()
+        if digest not in known
+    ]
+    if rows:
+        insert_ignore(db, PayloadBlob, rows, ["hash"])
+    return hashes
+
+
+def load(db: Session, digest: str) -> Optional[Any]:
+    """Decompress and parse the payload stored under ``digest``."""
+    cached = payload_cache.get(digest)
+    if cached is not None:
+        return cached
+    row = db.execute(select(PayloadBlob.dictionary_id, PayloadBlob.data).where(PayloadBlob.hash == digest)).first()
+    if row is None:
+        return None
+    dictionary = _dictionary(db, row[0]) if row[0] else None
+    payload = json.loads(decompress(row[1], dictionary))
+    payload_cache.set(digest, payload)
+    return payload
+
+
+def load_many(db: Session, digests: Iterable[str]) -> Dict[str, Any]:
+    """Like ``load`` for several hashes, with one query for the uncached ones."""
+    found: Dict[str, Any] = {}
+    missing: List[str] = []
+    for digest in dict.fromkeys(digests):
+        cached = payload_cache.get(digest)
+        if cached is not None:
+            found[digest] = cached
+        else:
+            missing.append(digest)
+    if missing:
+        rows = db.execute(select(PayloadBlob.hash, PayloadBlob.dictionary_id, PayloadBlob.data).where(PayloadBlob.hash.in_(missing)))
+        for digest, dictionary_id, data in rows:
+            dictionary = _dictionary(db, dictionary_id) if dictionary_id else None
+            payload = json.loads(decompress(data, dictionary))
+            payload_cache.set(digest, payload)
+            found[digest] = payload
+    return found
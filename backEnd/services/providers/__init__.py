@@ -0,0 +1,13 @@
+from .base import ForecastProvider
+from .open_meteo import OpenMeteoProvider
+from .openweather import OpenWeatherProvider
+from .router import ProviderRouter, ProviderStats, get_provider_router
+
+__all__ = [
+    "ForecastProvider",
+    "OpenMeteoProvider",
+    "OpenWeatherProvider",
+    "ProviderRouter",
+    "ProviderStats",
+    "get_provider_router",
+]
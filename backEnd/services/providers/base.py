@@ -0,0 +1,18 @@
+from typing import Any, Dict
+
+
+class ForecastProvider:
+    """Interface for upstream forecast vendors.
+
+    ``fetch`` returns the canonical forecast payload used throughout the app:
+    an OpenWeather-shaped ``{"city": {...}, "list": [...]}`` dict in metric
+    units (°C, m/s, mm) with 3-hourly ``list`` items, plus a ``"provider"`` key
+    naming the vendor that produced it. Keeping one shape means
+    ``build_context`` and ``db_store_forecasts`` don't care where data came from.
+    """
+
+    name: str = ""
+    base_url: str = ""
+
+    async def fetch(self, lat: float, lon: float) -> Dict[str, Any]:
+        raise NotImplementedError
@@ -0,0 +1,122 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from core.config import settings
+from services.api_forecast_client import ApiForecastClient
+from .base import ForecastProvider
+
+HOURLY_VARIABLES = (
+    "temperature_2m", "apparent_temperature", "relative_humidity_2m", "pressure_msl",
+    "precipitation", "precipitation_probability", "weather_code", "cloud_cover",
+    "wind_speed_10m", "wind_direction_10m", "wind_gusts_10m",
+)
+
+# Open-Meteo serves hourly steps; fold them into the canonical 3-hour items.
+STEP_HOURS = 3
+
+
+def wmo_condition(code: Optional[int]) -> Dict[str, Any]:
+    """Map a WMO weather interpretation code to an OpenWeather-style condition."""
+    if code is None:
+        return {"id": 0, "main": "Clouds", "description": "unknown", "icon": "04d"}
+    code = int(code)
+    if code == 0:
+        return {"id": code, "main": "Clear", "description": "clear sky", "icon": "01d"}
+    if code in (1, 2, 3):
+        return {"id": code, "main": "Clouds", "description": "partly cloudy", "icon": "03d"}
+    if code in (45, 48):
+        return {"id": code, "main": "Fog", "description": "fog", "icon": "50d"}
+    if 51 <= code <= 57:
+        return {"id": code, "main": "Drizzle", "description": "drizzle", "icon": "09d"}
+    if 61 <= code <= 67 or 80 <= code <= 82:
+        return {"id": code, "main": "Rain", "description": "rain", "icon": "10d"}
+    if 71 <= code <= 77 or code in (85, 86):
+        return {"id": code, "main": "Snow", "description": "snow", "icon": "13d"}
+    if code >= 95:
+        return {"id": code, "main": "Thunderstorm", "description": "thunderstorm", "icon": "11d"}
+    return {"id": code, "main": "Clouds", "description": "overcast", "icon": "04d"}
+
+
+def _at(series: Dict[str, List[Any]], key: str, i: int) -> Any:
+    values = series.get(key) or []
+    return values[i] if i < len(values) else None
+
+
+def normalize(payload: Dict[str, Any], max_items: int = 40) -> Dict[str, Any]:
+    """Convert an Open-Meteo hourly response into the canonical forecast payload."""
+    hourly = payload.get("hourly") or {}
+    times: List[int] = hourly.get("time") or []
+    now = int(datetime.now(tz=timezone.utc).timestamp())
+    items: List[Dict[str, Any]] = []
+    for i, ts in enumerate(times):
+        ts = int(ts)
+        if ts % (STEP_HOURS * 3600) or ts + STEP_HOURS * 3600 <= now:
+            continue
+        window = range(i, min(i + STEP_HOURS, len(times)))
+        temps = [t for t in (_at(hourly, "temperature_2m", j) for j in window) if t is not None]
+        precip = sum(p or 0.0 for p in (_at(hourly, "precipitation", j) for j in window))
+        pop = _at(hourly, "precipitation_probability", i)
+        item: Dict[str, Any] = {
+            "dt": ts,
+            "main": {
+                "temp": _at(hourly, "temperature_2m", i),
+                "feels_like": _at(hourly, "apparent_temperature", i),
+                "temp_min": min(temps) if temps else None,
+                "temp_max": max(temps) if temps else None,
+                "pressure": _at(hourly, "pressure_msl", i),
+                "humidity": _at(hourly, "relative_humidity_2m", i),
+            },
+            "weather": [wmo_condition(_at(hourly, "weather_code", i))],
+            "clouds": {"all": _at(hourly, "cloud_cover", i)},
+            "wind": {
+                "speed": _at(hourly, "wind_speed_10m", i),
+                "deg": _at(hourly, "wind_direction_10m", i),
+                "gust": _at(hourly, "wind_gusts_10m", i),
+            },
+            "pop": (pop / 100.0) if pop is not None else None,
+            "dt_txt": datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        if precip:
+            item["rain"] = {"3h": round(precip, 2)}
+        items.append(item)
+        if len(items) >= max_items:
+            break
+    return {
+        "cod": "200",
+        "cnt": len(items),
+        "list": items,
+        "city": {
+            "name": "",
+            "country": "",
+            "coord": {"lat": payload.get("latitude"), "lon": payload.get("longitude")},
+            "timezone": int(payload.get("utc_offset_seconds") or 0),
+        },
+    }
+
+
+class OpenMeteoProvider(ForecastProvider):
+    """Open-Meteo style JSON forecast API (no API key required)."""
+
+    name = "open-meteo"
+
+    def __init__(self, client: Optional[ApiForecastClient] = None):
+        self.client = client or ApiForecastClient(base_url=settings.open_meteo_base_url, name=self.name)
+
+    @property
+    def base_url(self) -> str:
+        return self.client.base_url
+
+    async def fetch(self, lat: float, lon: float) -> Dict[str, Any]:
+        params: Dict[str, Any] = {
+            "latitude": lat,
+            "longitude": lon,
+            "hourly": ",".join(HOURLY_VARIABLES),
+            "timeformat": "unixtime",
+            "timezone": "auto",
+            "forecast_days": 6,
+            "wind_speed_unit": "ms",
+        }
+        raw = await self.client._make_request("forecast", params)
+        data = normalize(raw)
+        data["provider"] = self.name
+        return data
@@ -0,0 +1,27 @@
+from typing import Any, Dict, Optional
+
+from core.config import settings
+from services.api_forecast_client import ApiForecastClient
+from services.units import CANONICAL
+from .base import ForecastProvider
+
+
+class OpenWeatherProvider(ForecastProvider):
+    name = "openweather"
+
+    def __init__(self, client: Optional[ApiForecastClient] = None):
+        self.client = client or ApiForecastClient()
+
+    @property
+    def base_url(self) -> str:
+        return getattr(self.client, "base_url", settings.forecast_base_url)
+
+    async def fetch(self, lat: float, lon: float) -> Dict[str, Any]:
+        params = {
+            'lat': lat, 'lon': lon,
+            'appid': settings.api_weather_key,
+            'units': CANONICAL,
+        }
+        data = await self.client._make_request('forecast', params)
+        data["provider"] = self.name
+        return data
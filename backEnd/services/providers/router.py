@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+
+from core.config import settings
+from core.metrics import REGISTRY, Counter, Gauge
+from .base import ForecastProvider
+from .open_meteo import OpenMeteoProvider
+from .openweather import OpenWeatherProvider
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_REQUESTS: Counter = REGISTRY.register(Counter(
+    "forecast_provider_requests_total", "Forecast provider attempts by outcome.", ("provider", "outcome"),
+))
+
+
+class ProviderStats:
+    """Latency and health bookkeeping for one provider."""
+
+    # weight of the newest sample in the latency moving average
+    ALPHA = 0.2
+    # consecutive failures before a provider is skipped, and for how long
+    FAILURE_THRESHOLD = 3
+    COOLDOWN_SECONDS = 30.0
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ewma_latency: Optional[float] = None
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+
+    def record_success(self, seconds: float) -> None:
+        self.successes += 1
+        self.consecutive_failures = 0
+        if self.ewma_latency is None:
+            self.ewma_latency = seconds
+        else:
+            self.ewma_latency += self.ALPHA * (seconds - self.ewma_latency)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_failure = time.monotonic()
+
+    @property
+    def healthy(self) -> bool:
+        if self.consecutive_failures < self.FAILURE_THRESHOLD:
+            return True
+        # half-open after the cooldown so a recovered vendor gets retried
+        return time.monotonic() - self.last_failure >= self.COOLDOWN_SECONDS
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "provider": self.name,
+            "healthy": self.healthy,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 2) if self.ewma_latency is not None else None,
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+class ProviderRouter:
+    """Pick a forecast provider per call.
+
+    ``fallback`` tries healthy providers in preference order, moving on when
+    one errors or exceeds ``timeout``. ``race`` starts all healthy providers at
+    once and returns the first successful payload, cancelling the rest.
+    """
+
+    def __init__(self, providers: Sequence[ForecastProvider], strategy: str = "fallback", timeout: Optional[float] = None):
+        if not providers:
+            raise ValueError("at least one forecast provider is required")
+        if strategy not in ("fallback", "race"):
+            raise ValueError("strategy must be 'fallback' or 'race'")
+        self.providers = list(providers)
+        self.strategy = strategy
+        self.timeout = timeout if timeout is not None else settings.provider_timeout
+        self.stats: Dict[str, ProviderStats] = {p.name: ProviderStats(p.name) for p in self.providers}
+
+    def get(self, name: str) -> Optional[ForecastProvider]:
+        for provider in self.providers:
+            if provider.name == name:
+                return provider
+        return None
+
+    def _candidates(self) -> List[ForecastProvider]:
+        healthy = [p for p in self.providers if self.stats[p.name].healthy]
+        # if everything is tripped, try them all rather than fail outright
+        return healthy or list(self.providers)
+
+    async def _attempt(self, provider: ForecastProvider, lat: float, lon: float) -> Dict[str, Any]:
+        stats = self.stats[provider.name]
+        started = time.perf_counter()
+        try:
+            data = await asyncio.wait_for(provider.fetch(lat, lon), timeout=self.timeout)
+        except asyncio.CancelledError:
+            PROVIDER_REQUESTS.labels(provider.name, "cancelled").inc()
+            raise
+        except asyncio.TimeoutError:
+            stats.record_failure()
+            PROVIDER_REQUESTS.labels(provider.name, "timeout").inc()
+            raise HTTPException(status_code=504, detail=f"{provider.name} timed out")
+        except Exception:
+            stats.record_failure()
+            PROVIDER_REQUESTS.labels(provider.name, "error").inc()
+            raise
+        stats.record_success(time.perf_counter() - started)
+        PROVIDER_REQUESTS.labels(provider.name, "ok").inc()
+        return data
+
+    async def fetch(self, lat: float, lon: float) -> Dict[str, Any]:
+        if self.strategy == "race":
+            return await self._race(lat, lon)
+        return await self._fallback(lat, lon)
+
+    async def _fallback(self, lat: float, lon: float) -> Dict[str, Any]:
+        last_error: Optional[Exception] = None
+        for provider in self._candidates():
+            try:
+                return await self._attempt(provider, lat, lon)
+            except Exception as e:
+                logger.warning("forecast provider %s failed: %s", provider.name, e)
+                last_error = e
+        raise self._as_http_error(last_error)
+
+    async def _race(self, lat: float, lon: float) -> Dict[str, Any]:
+        tasks = [asyncio.create_task(self._attempt(p, lat, lon)) for p in self._candidates()]
+        last_error: Optional[Exception] = None
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        raise self._as_http_error(last_error)
+
+    @staticmethod
+    def _as_http_error(error: Optional[Exception]) -> HTTPException:
+        if isinstance(error, HTTPException):
+            return error
+        return HTTPException(status_code=502, detail=f"All forecast providers failed: {error}")
+
+
+PROVIDER_CLASSES = {OpenWeatherProvider.name: OpenWeatherProvider, OpenMeteoProvider.name: OpenMeteoProvider}
+
+
+def _build_provider(name: str) -> ForecastProvider:
+    if name not in PROVIDER_CLASSES:
+        raise ValueError(f"unknown forecast provider {name!r}")
+    return PROVIDER_CLASSES[name]()
+
+
+_router: Optional[ProviderRouter] = None
+
+
+def get_provider_router() -> ProviderRouter:
+    """Process-wide router so latency and health stats survive across requests."""
+    global _router
+    if _router is None:
+        names = [n.strip() for n in settings.forecast_providers.split(",") if n.strip()]
+        _router = ProviderRouter([_build_provider(n) for n in names], strategy=settings.provider_strategy)
+    return _router
+
+
+def _latency_samples():
+    if _router is None:
+        return
+    for name, stats in _router.stats.items():
+        if stats.ewma_latency is not None:
+            yield (name,), stats.ewma_latency
+
+
+REGISTRY.register(Gauge("forecast_provider_latency_ewma_seconds", "Smoothed forecast provider latency.", ("provider",), collect=_latency_samples))
@@ -0,0 +1,191 @@
+"""Server-Sent Events fan-out of forecast updates per tile.
+
+Clients subscribe to a set of tiles. Whenever the shared forecast cache pulls a
+tile from upstream, its summary context is built once and offered to every
+subscriber of that tile. Each subscriber keeps at most one pending update per
+tile, so a slow client is sent the latest state (diffed against what it last
+received) rather than an ever-growing backlog. A single refresher task keeps
+subscribed tiles warm, which means one upstream call per tile per cache TTL no
+matter how many clients are watching.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from core.config import settings
+from core.metrics import REGISTRY, Gauge
+from services import climatology, weather_service
+from services.tiling import Tile
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    __slots__ = ("tiles", "units", "pending", "sent", "wakeup", "coalesced")
+
+    def __init__(self, tiles: List[Tile], units: str):
+        self.tiles = tiles
+        self.units = units
+        # tile key -> (version, context); bounded by len(tiles)
+        self.pending: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        # tile key -> last context delivered, for diffs
+        self.sent: Dict[str, Dict[str, Any]] = {}
+        self.wakeup = asyncio.Event()
+        self.coalesced = 0
+
+    def offer(self, key: str, version: int, context: Dict[str, Any]) -> None:
+        if key in self.pending:
+            self.coalesced += 1
+        self.pending[key] = (version, context)
+        self.wakeup.set()
+
+
+class PushHub:
+    def __init__(self):
+        self.subscribers: Dict[str, Set[Subscriber]] = {}
+        self.tiles: Dict[str, Tile] = {}
+        self.versions: Dict[str, int] = {}
+        self.connections = 0
+        self._refresher: Optional[asyncio.Task] = None
+
+    def subscribe(self, tiles: List[Tile], units: str) -> Subscriber:
+        sub = Subscriber(tiles, units)
+        self.connections += 1
+        for tile in tiles:
+            self.subscribers.setdefault(tile.key, set()).add(sub)
+            self.tiles[tile.key] = tile
+            cached = weather_service.forecast_cache.peek(tile.key)
+            if cached is not None:
+                sub.offer(tile.key, self.versions.get(tile.key, 0), self._context(tile, cached, units))
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self.connections -= 1
+        for tile in sub.tiles:
+            subs = self.subscribers.get(tile.key)
+            if subs is None:
+                continue
+            subs.discard(sub)
+            if not subs:
+                del self.subscribers[tile.key]
+                self.tiles.pop(tile.key, None)
+
+    def _context(self, tile: Tile, data: Dict[str, Any], units: str) -> Dict[str, Any]:
+        # place comes from the client's own geocoding, not the tile
+        # fan-out runs on the event loop: only baselines already in memory are used
+        baseline = climatology.baselines.peek(tile.lat, tile.lon)
+        ctx = weather_service.WeatherService().build_context(data, units, baseline)
+        ctx.pop("place", None)
+        return ctx
+
+    def publish(self, key: str, data: Dict[str, Any]) -> None:
+        """Refresh listener: build the context once per unit system and offer it to all subscribers."""
+        subs = self.subscribers.get(key)
+        if not subs:
+            return
+        version = self.versions.get(key, 0) + 1
+        self.versions[key] = version
+        contexts: Dict[str, Dict[str, Any]] = {}
+        for sub in subs:
+            ctx = contexts.get(sub.units)
+            if ctx is None:
+                ctx = contexts[sub.units] = self._context(self.tiles[key], data, sub.units)
+            sub.offer(key, version, ctx)
+
+    async def _refresh_once(self, semaphore: asyncio.Semaphore) -> None:
+        wx = weather_service.WeatherService()
+
+        async def refresh(tile: Tile) -> None:
+            async with semaphore:
+                try:
+                    await wx.fetch_data(tile.lat, tile.lon)
+                except Exception as e:
+                    logger.warning("push refresh failed for %s: %s", tile.key, e)
+
+        stale = [t for key, t in list(self.tiles.items()) if weather_service.forecast_cache.peek(key) is None]
+        if stale:
+            await asyncio.gather(*(refresh(t) for t in stale))
+
+    async def _run_refresher(self) -> None:
+        semaphore = asyncio.Semaphore(settings.push_refresh_concurrency)
+        while True:
+            try:
+                await self._refresh_once(semaphore)
+            except Exception:
+                logger.exception("push refresher iteration failed")
+            await asyncio.sleep(settings.push_refresh_check)
+
+    def start(self) -> None:
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.get_running_loop().create_task(self._run_refresher())
+
+    async def stop(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+    async def prime(self, sub: Subscriber) -> None:
+        """Fetch tiles that had nothing cached when ``sub`` connected."""
+        wx = weather_service.WeatherService()
+        missing = [t for t in sub.tiles if t.key not in sub.pending]
+        for tile in missing:
+            try:
+                data = await wx.fetch_data(tile.lat, tile.lon)
+            except Exception as e:
+                logger.warning("push prime failed for %s: %s", tile.key, e)
+                continue
+            # a cache hit doesn't publish, so deliver the first snapshot here
+            if tile.key not in sub.sent and tile.key not in sub.pending:
+                sub.offer(tile.key, self.versions.get(tile.key, 0), self._context(tile, data, sub.units))
+
+    async def stream(self, tiles: List[Tile], units: str) -> AsyncIterator[str]:
+        """Subscribe to ``tiles`` and yield SSE frames until the client disconnects.
+
+        The subscription is made on first iteration, so a response that is
+        never started never leaves one behind.
+        """
+        sub = self.subscribe(tiles, units)
+        prime = asyncio.create_task(self.prime(sub))
+        try:
+            yield f"retry: 5000\nevent: subscribed\ndata: {json.dumps({'tiles': [t.key for t in sub.tiles]})}\n\n"
+            while True:
+                try:
+                    await asyncio.wait_for(sub.wakeup.wait(), timeout=settings.push_keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                sub.wakeup.clear()
+                pending, sub.pending = sub.pending, {}
+                for key, (version, ctx) in pending.items():
+                    previous = sub.sent.get(key)
+                    if previous is None:
+                        event, payload = "snapshot", ctx
+                    else:
+                        changed = {k: v for k, v in ctx.items() if previous.get(k) != v}
+                        if not changed:
+                            continue
+                        event, payload = "update", changed
+                    sub.sent[key] = ctx
+                    body = json.dumps({"tile": key, "data": payload}, separators=(",", ":"))
+                    yield f"id: {key}:{version}\nevent: {event}\ndata: {body}\n\n"
+        finally:
+            prime.cancel()
+            self.unsubscribe(sub)
+
+
+hub = PushHub()
+weather_service.refresh_listeners.append(hub.publish)
+
+
+def _push_samples():
+    yield ("connections",), hub.connections
+    yield ("tiles",), len(hub.subscribers)
+
+
+REGISTRY.register(Gauge("push_subscriptions", "Open SSE connections and subscribed tiles.", ("kind",), collect=_push_samples))
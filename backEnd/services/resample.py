@@ -0,0 +1,242 @@
+"""Time-bucketed aggregates of stored observations and forecasts, computed in SQL.
+
+A bucket spec is ``<n>h``, ``<n>d``, ``1w`` or ``1mo``. Hour and day buckets
+are aligned to the Unix epoch (UTC), weeks start on Monday and months on the
+1st. The bucket start is computed by the database (``strftime`` /
+``datetime(..., 'unixepoch')`` on SQLite, ``date_trunc`` / ``date_bin`` on
+Postgres) and rows are reduced with ``GROUP BY`` over the range selected by
+``idx_obs_loc_time`` / ``idx_fc_loc_time``; only one row per bucket comes
+back.
+
+Aggregates are ``min``, ``max``, ``mean``, ``sum``, ``count`` and ``pNN``
+percentiles (linear interpolation, like ``numpy.percentile``). Postgres
+computes percentiles with ``percentile_cont``; SQLite has no percentile
+aggregate, so they are ranked with window functions, one query per field.
+
+Forecast steps are stored once per snapshot; only the newest snapshot of
+each step (per provider) is aggregated.
+"""
+
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import Float, Integer, Numeric, case, cast, func, literal_column, select, type_coerce
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+
+from core import wire
+from models.model import Provider, WeatherForecast, WeatherObservation
+
+SOURCES = ("observations", "forecasts")
+BUCKET_PATTERN = r"^([1-9]\d{0,2})(h|d)$|^1(w|mo)$"
+_BUCKET = re.compile(BUCKET_PATTERN)
+_PERCENTILE = re.compile(r"^p(\d{1,2}(?:\.\d+)?|100)$")
+SIMPLE_AGGREGATES = ("min", "max", "mean", "sum", "count")
+
+# numeric columns per source, in model order
+FIELDS: Dict[str, Tuple[str, ...]] = {
+    source: tuple(c.name for c in model.__table__.columns if isinstance(c.type, Numeric))
+    for source, model in (("observations", WeatherObservation), ("forecasts", WeatherForecast))
+}
+
+
+class Bucket(NamedTuple):
+    count: int
+    unit: str  # "h", "d", "w" or "mo"
+
+    @property
+    def approx_seconds(self) -> int:
+        return self.count * {"h": 3600, "d": 86400, "w": 7 * 86400, "mo": 28 * 86400}[self.unit]
+
+
+def parse_bucket(spec: str) -> Bucket:
+    match = _BUCKET.match(spec)
+    if not match:
+        raise ValueError("bucket must look like 3h, 1d, 7d, 1w or 1mo")
+    if match.group(1):
+        return Bucket(int(match.group(1)), match.group(2))
+    return Bucket(1, match.group(3))
+
+
+def parse_aggregates(spec: str) -> List[str]:
+    names = [a.strip().lower() for a in spec.split(",") if a.strip()]
+    bad = [a for a in names if a not in SIMPLE_AGGREGATES and not _PERCENTILE.match(a)]
+    if bad or not names:
+        raise ValueError(f"unknown aggregates: {', '.join(bad) or spec!r}; use {', '.join(SIMPLE_AGGREGATES)} or p0-p100")
+    return list(dict.fromkeys(names))
+
+
+def parse_fields(source: str, spec: str) -> List[str]:
+    names = [f.strip() for f in spec.split(",") if f.strip()]
+    bad = [f for f in names if f not in FIELDS[source]]
+    if bad or not names:
+        raise ValueError(f"unknown fields for {source}: {', '.join(bad) or spec!r}; use {', '.join(FIELDS[source])}")
+    return list(dict.fromkeys(names))
+
+
+def bucket_start(dialect: str, column: ColumnElement, bucket: Bucket) -> ColumnElement:
+    """SQL expression for the start of the bucket ``column`` falls in."""
+    count, unit = bucket
+    if dialect == "sqlite":
+        if unit == "w":
+            return func.date(column, "-6 days", "weekday 1")
+        if unit == "mo":
+            return func.strftime("%Y-%m-01", column)
+        step = count * (3600 if unit == "h" else 86400)
+        return func.datetime(cast(func.strftime("%s", column), Integer) // step * step, "unixepoch")
+    if dialect == "postgresql":
+        if unit in ("w", "mo") or count == 1:
+            return func.date_trunc({"h": "hour", "d": "day", "w": "week", "mo": "month"}[unit], column)
+        width = f"{count} {'hours' if unit == 'h' else 'days'}"
+        return func.date_bin(literal_column(f"INTERVAL '{width}'"), column, literal_column("TIMESTAMP '1970-01-01'"))
+    raise ValueError(f"resampling is not supported on {dialect}")
+
+
+def _base(source: str, location_id: str, start: datetime, end: datetime, provider_id: Optional[str], fields: Sequence[str]):
+    """Rows in [start, end) as a subquery with a ``t`` column and the requested fields."""
+    if source == "observations":
+        model, time_column = WeatherObservation, WeatherObservation.observed_at
+    else:
+        model, time_column = WeatherForecast, WeatherForecast.forecast_time
+    criteria = [model.location_id == location_id, time_column >= start, time_column < end]
+    if provider_id is not None:
+        criteria.append(model.provider_id == provider_id)
+    columns = [time_column.label("t")] + [type_coerce(getattr(model, f), Float).label(f) for f in fields]
+    if source == "observations":
+        return select(*columns).where(*criteria).subquery()
+    # one row per step and provider: the newest snapshot's
+    newest = func.row_number().over(
+        partition_by=(WeatherForecast.provider_id, WeatherForecast.forecast_time),
+        order_by=WeatherForecast.snapshot_time.desc(),
+    ).label("rn")
+    ranked = select(*columns, newest).where(*criteria, WeatherForecast.kind == "hourly").subquery()
+    return select(ranked.c.t, *(ranked.c[f] for f in fields)).where(ranked.c.rn == 1).subquery()
+
+
+def _simple(column: ColumnElement, name: str) -> ColumnElement:
+    return {"min": func.min, "max": func.max, "mean": func.avg, "sum": func.sum, "count": func.count}[name](column)
+
+
+def _quantile(name: str) -> float:
+    return float(_PERCENTILE.match(name).group(1)) / 100
+
+
+def _windowed_percentiles(db: Session, base, dialect: str, bucket: Bucket, field: str, names: Sequence[str]) -> Dict[Any, List[Optional[float]]]:
+    """bucket -> values of the ``names`` percentiles of ``field``, ranked with window functions."""
+    value = base.c[field]
+    key = bucket_start(dialect, base.c.t, bucket)
+    ranked = select(
+        key.label("bucket"),
+        value.label("v"),
+        (func.row_number().over(partition_by=key, order_by=value) - 1).label("i"),
+        func.count(value).over(partition_by=key).label("n"),
+    ).where(value.isnot(None)).subquery()
+    columns = []
+    for name in names:
+        position = ranked.c.n * _quantile(name) - _quantile(name)  # q * (n - 1)
+        below = cast(position, Integer)
+        lo = func.max(case((ranked.c.i == below, ranked.c.v)))
+        hi = func.coalesce(func.max(case((ranked.c.i == below + 1, ranked.c.v))), lo)
+        columns.append((lo + (hi - lo) * func.max(position - below)).label(name))
+    stmt = select(ranked.c.bucket, *columns).group_by(ranked.c.bucket)
+    return {row[0]: list(row[1:]) for row in db.execute(stmt)}
+
+
+def naive_utc(moment: datetime) -> datetime:
+    """``moment`` as the naive UTC datetime the tables store; naive input is taken as UTC."""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _iso(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # SQLite returns text: "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS"
+    return datetime.fromisoformat(str(value)).isoformat()
+
+
+def _number(value: Any) -> Optional[float]:
+    return None if value is None else float(value)
+
+
+def resample(
+    db: Session,
+    location_id: str,
+    source: str,
+    bucket: Bucket,
+    aggregates: Sequence[str],
+    fields: Sequence[str],
+    start: datetime,
+    end: datetime,
+    provider: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Aggregate ``fields`` of ``source`` rows per bucket, as columnar JSON.
+
+    Returns ``{"time": [bucket starts], "count": [rows], "values": {field:
+    {aggregate: [...]}}}`` plus the request echoed back; empty buckets are
+    left out.
+    """
+    dialect = db.get_bind().dialect.name
+    provider_id = None
+    if provider is not None:
+        provider_id = db.execute(select(Provider.id).where(Provider.name == provider)).scalar()
+        if provider_id is None:
+            raise LookupError(f"unknown provider {provider!r}")
+    base = _base(source, location_id, start, end, provider_id, fields)
+    key = bucket_start(dialect, base.c.t, bucket).label("bucket")
+    simple = [a for a in aggregates if a in SIMPLE_AGGREGATES]
+    percentiles = [a for a in aggregates if a not in SIMPLE_AGGREGATES]
+    native = dialect == "postgresql"
+    columns = [func.count().label("rows")]
+    for field in fields:
+        columns += [_simple(base.c[field], a) for a in simple]
+        if native:
+            columns += [func.percentile_cont(_quantile(p)).within_group(base.c[field]) for p in percentiles]
+    rows = db.execute(select(key, *columns).group_by(key).order_by(key)).all()
+
+    windowed = {}
+    if percentiles and not native:
+        windowed = {field: _windowed_percentiles(db, base, dialect, bucket, field, percentiles) for field in fields}
+
+    values: Dict[str, Dict[str, List[Optional[float]]]] = {f: {a: [] for a in aggregates} for f in fields}
+    per_field = len(simple) + (len(percentiles) if native else 0)
+    for row in rows:
+        offset = 2
+        for field in fields:
+            out = values[field]
+            for name, value in zip(simple + (percentiles if native else []), row[offset:offset + per_field]):
+                out[name].append(_number(value))
+            offset += per_field
+            if windowed:
+                ranked = windowed[field].get(row[0]) or [None] * len(percentiles)
+                for name, value in zip(percentiles, ranked):
+                    out[name].append(_number(value))
+    return {
+        "location_id": location_id,
+        "source": source,
+        "bucket": f"{bucket.count}{bucket.unit}",
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "time": [_iso(row[0]) for row in rows],
+        "count": [row[1] for row in rows],
+        "values": values,
+    }
+
+
+def as_table(out: Dict[str, Any]) -> wire.Table:
+    """``resample`` output as Arrow columns: ``time``, ``count`` and one ``field.aggregate`` per series."""
+    columns: Dict[str, List[Any]] = {"time": [datetime.fromisoformat(t) for t in out["time"]], "count": out["count"]}
+    types = {"time": wire.TIMESTAMP, "count": wire.INTEGER}
+    for field, series in out["values"].items():
+        for aggregate, values in series.items():
+            columns[f"{field}.{aggregate}"] = values
+            types[f"{field}.{aggregate}"] = wire.FLOAT
+    metadata = {k: out[k] for k in ("location_id", "source", "bucket", "start", "end")}
+    return wire.Table(columns, types, metadata)
+
+
+def max_buckets(start: datetime, end: datetime, bucket: Bucket) -> int:
+    """Upper bound on the buckets [start, end) spans."""
+    return int((end - start) / timedelta(seconds=bucket.approx_seconds)) + 2
@@ -0,0 +1,385 @@
+"""Retention and downsampling for forecast snapshots and observations.
+
+Every refresh stores a new snapshot of each forecast step, so the forecast
+table grows with time x refresh rate. Retention thins it in tiers, by the
+age of the snapshot:
+
+1. newer than ``retention_full_days``: every snapshot is kept.
+2. up to ``retention_bucket_days``: per forecast step, only the latest
+   snapshot in each lead-time bucket (``retention_lead_buckets``, hours).
+3. older: hourly rows of a day are folded into one ``kind='daily'`` rollup
+   per location and provider, built from the shortest-lead snapshot of each
+   step.
+
+Rollups older than ``retention_max_days`` and observations older than
+``retention_observation_days`` are deleted (0 keeps them forever), then
+payload blobs nothing references any more are collected.
+
+Deletes run in batches of ``retention_batch_size`` rows, each in its own
+short transaction, so writers are never locked out for long. SQLite files
+are then shrunk with ``PRAGMA incremental_vacuum`` when they use
+``auto_vacuum=INCREMENTAL`` (see ``tools/retention.py``).
+
+On Postgres, if ``weather_forecasts`` / ``weather_observations`` have been
+converted to native partitions by month (``PARTITION BY RANGE
+(forecast_time)`` / ``(observed_at)``, with the partition key in the
+primary key), upcoming monthly partitions are created ahead of time and
+expiry drops whole partitions instead of deleting rows.
+"""
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import delete, exists, func, select, text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from core.config import settings
+from core.database import SessionLocal
+from models.model import PayloadBlob, WeatherForecast, WeatherObservation
+
+logger = logging.getLogger(__name__)
+
+# locations rolled up per query, so one day's rows are never all in memory at once
+_ROLLUP_LOCATIONS = 100
+# what _daily reads; payload columns stay in the database
+_ROLLUP_COLUMNS = (
+    WeatherForecast.id,
+    WeatherForecast.location_id,
+    WeatherForecast.provider_id,
+    WeatherForecast.forecast_time,
+    WeatherForecast.snapshot_time,
+    WeatherForecast.temperature_c,
+    WeatherForecast.temp_min_c,
+    WeatherForecast.temp_max_c,
+    WeatherForecast.humidity_pct,
+    WeatherForecast.pressure_hpa,
+    WeatherForecast.wind_speed_ms,
+    WeatherForecast.wind_gust_ms,
+    WeatherForecast.wind_deg,
+    WeatherForecast.precip_mm,
+    WeatherForecast.snow_mm,
+    WeatherForecast.cloud_pct,
+    WeatherForecast.pop_pct,
+    WeatherForecast.weather_code,
+)
+
+
+def lead_buckets() -> List[float]:
+    return sorted(float(b) for b in settings.retention_lead_buckets.split(",") if b.strip())
+
+
+def _f(value: Any) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+def _mean(values: Sequence[Optional[float]]) -> Optional[float]:
+    present = [v for v in values if v is not None]
+    return round(sum(present) / len(present), 2) if present else None
+
+
+class Retention:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    # -- batched deletes -------------------------------------------------
+
+    def _delete_ids(self, db: Session, model, ids: List[str]) -> int:
+        batch = settings.retention_batch_size
+        for start in range(0, len(ids), batch):
+            db.execute(delete(model).where(model.id.in_(ids[start:start + batch])))
+            db.commit()
+            # let other writers take the (SQLite) write lock between batches
+            time.sleep(settings.retention_batch_pause)
+        return len(ids)
+
+    def _delete_older(self, db: Session, model, column, cutoff: datetime, *criteria) -> int:
+        removed = 0
+        while True:
+            ids = db.execute(
+                select(model.id).where(column < cutoff, *criteria).limit(settings.retention_batch_size)
+            ).scalars().all()
+            if not ids:
+                return removed
+            removed += self._delete_ids(db, model, ids)
+
+    def _days(self, db: Session, *criteria) -> List[datetime]:
+        lo, hi = db.execute(select(func.min(WeatherForecast.forecast_time), func.max(WeatherForecast.forecast_time)).where(*criteria)).one()
+        if lo is None:
+            return []
+        day = datetime(lo.year, lo.month, lo.day)
+        days = []
+        while day <= hi:
+            days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    # -- tiers -----------------------------------------------------------
+
+    def downsample(self, db: Session, now: datetime) -> int:
+        """Keep one snapshot per forecast step and lead bucket past the full tier."""
+        full_cutoff = now - timedelta(days=settings.retention_full_days)
+        rollup_cutoff = now - timedelta(days=settings.retention_bucket_days)
+        bounds = lead_buckets()
+        aged = (
+            WeatherForecast.kind == "hourly",
+            WeatherForecast.snapshot_time < full_cutoff,
+            WeatherForecast.forecast_time >= rollup_cutoff,
+        )
+        removed = 0
+        for day in self._days(db, *aged):
+            rows = db.execute(
+                select(
+                    WeatherForecast.id,
+                    WeatherForecast.location_id,
+                    WeatherForecast.provider_id,
+                    WeatherForecast.forecast_time,
+                    WeatherForecast.snapshot_time,
+                )
+                .where(*aged, WeatherForecast.forecast_time >= day, WeatherForecast.forecast_time < day + timedelta(days=1))
+                .order_by(WeatherForecast.snapshot_time.desc())
+            ).all()
+            seen = set()
+            doomed = []
+            for row_id, loc, prov, forecast_time, snapshot_time in rows:
+                lead = (forecast_time - snapshot_time).total_seconds() / 3600
+                key = (loc, prov, forecast_time, bisect_left(bounds, lead))
+                if key in seen:
+                    doomed.append(row_id)
+                else:
+                    seen.add(key)
+            removed += self._delete_ids(db, WeatherForecast, doomed)
+        return removed
+
+    def rollup(self, db: Session, now: datetime) -> Dict[str, int]:
+        """Fold hourly rows older than the bucket tier into daily rollups.
+
+        Hourly rows of a day that already has a rollup for their location and
+        provider (e.g. backfilled after it was made) are left alone until
+        they expire rather than deleted unrolled.
+        """
+        cutoff = now - timedelta(days=settings.retention_bucket_days)
+        cutoff = datetime(cutoff.year, cutoff.month, cutoff.day)
+        aged = (WeatherForecast.kind == "hourly", WeatherForecast.forecast_time < cutoff)
+        created = removed = 0
+        for day in self._days(db, *aged):
+            in_day = (*aged, WeatherForecast.forecast_time >= day, WeatherForecast.forecast_time < day + timedelta(days=1))
+            locations = db.execute(select(WeatherForecast.location_id).where(*in_day).distinct()).scalars().all()
+            for start in range(0, len(locations), _ROLLUP_LOCATIONS):
+                batch = locations[start:start + _ROLLUP_LOCATIONS]
+                rows = db.execute(
+                    select(*_ROLLUP_COLUMNS)
+                    .where(*in_day, WeatherForecast.location_id.in_(batch))
+                    .order_by(WeatherForecast.snapshot_time.desc())
+                ).all()
+                rolled = set(db.execute(
+                    select(WeatherForecast.location_id, WeatherForecast.provider_id).where(
+                        WeatherForecast.location_id.in_(batch),
+                        WeatherForecast.kind == "daily",
+                        WeatherForecast.forecast_time == day,
+                    )
+                ).tuples().all())
+                groups: Dict[tuple, Dict[datetime, Any]] = defaultdict(dict)
+                doomed = []
+                for row in rows:
+                    group = (row.location_id, row.provider_id)
+                    if group in rolled:
+                        continue
+                    # newest snapshot first, so setdefault keeps the shortest lead per step
+                    groups[group].setdefault(row.forecast_time, row)
+                    doomed.append(row.id)
+                for (loc, prov), steps in groups.items():
+                    db.add(self._daily(loc, prov, day, list(steps.values())))
+                db.commit()
+                created += len(groups)
+                removed += self._delete_ids(db, WeatherForecast, doomed)
+        return {"rollups_created": created, "hourly_rolled_up": removed}
+
+    @staticmethod
+    def _daily(loc: str, prov: str, day: datetime, steps: List[Any]) -> WeatherForecast:
+        temps = [_f(s.temperature_c) for s in steps]
+        mins = [v for v in (_f(s.temp_min_c) for s in steps) if v is not None] or [t for t in temps if t is not None]
+        maxs = [v for v in (_f(s.temp_max_c) for s in steps) if v is not None] or [t for t in temps if t is not None]
+        gusts = [v for v in (_f(s.wind_gust_ms) for s in steps) if v is not None]
+        pops = [v for v in (_f(s.pop_pct) for s in steps) if v is not None]
+        codes = Counter(s.weather_code for s in steps if s.weather_code)
+        leads = [(s.forecast_time - s.snapshot_time).total_seconds() / 3600 for s in steps]
+        return WeatherForecast(
+            location_id=loc,
+            provider_id=prov,
+            kind="daily",
+            snapshot_time=max(s.snapshot_time for s in steps),
+            forecast_time=day,
+            horizon_hours=max(0, int(min(leads))),
+            temperature_c=_mean(temps),
+            temp_min_c=min(mins) if mins else None,
+            temp_max_c=max(maxs) if maxs else None,
+            humidity_pct=_mean([_f(s.humidity_pct) for s in steps]),
+            pressure_hpa=_mean([_f(s.pressure_hpa) for s in steps]),
+            wind_speed_ms=_mean([_f(s.wind_speed_ms) for s in steps]),
+            wind_gust_ms=max(gusts) if gusts else None,
+            wind_deg=_mean([_f(s.wind_deg) for s in steps]),
+            precip_mm=round(sum(_f(s.precip_mm) or 0.0 for s in steps), 2),
+            snow_mm=round(sum(_f(s.snow_mm) or 0.0 for s in steps), 2),
+            cloud_pct=_mean([_f(s.cloud_pct) for s in steps]),
+            pop_pct=max(pops) if pops else None,
+            weather_code=codes.most_common(1)[0][0] if codes else None,
+        )
+
+    def expire(self, db: Session, now: datetime) -> Dict[str, int]:
+        stats = {"forecasts_expired": 0, "observations_expired": 0, "partitions_dropped": 0}
+        partitioned = db.get_bind().dialect.name == "postgresql"
+        if settings.retention_max_days:
+            cutoff = now - timedelta(days=settings.retention_max_days)
+            if partitioned and is_partitioned(db, "weather_forecasts"):
+                stats["partitions_dropped"] += drop_expired_partitions(db, "weather_forecasts", cutoff)
+            stats["forecasts_expired"] = self._delete_older(db, WeatherForecast, WeatherForecast.forecast_time, cutoff)
+        if settings.retention_observation_days:
+            cutoff = now - timedelta(days=settings.retention_observation_days)
+            if partitioned and is_partitioned(db, "weather_observations"):
+                stats["partitions_dropped"] += drop_expired_partitions(db, "weather_observations", cutoff)
+            stats["observations_expired"] = self._delete_older(db, WeatherObservation, WeatherObservation.observed_at, cutoff)
+        return stats
+
+    def collect_blobs(self, db: Session) -> int:
+        """Delete payload blobs no forecast row points at any more."""
+        orphan = ~exists().where(WeatherForecast.payload_hash == PayloadBlob.hash)
+        removed = 0
+        while True:
+            hashes = db.execute(select(PayloadBlob.hash).where(orphan).limit(settings.retention_batch_size)).scalars().all()
+            if not hashes:
+                return removed
+            db.execute(delete(PayloadBlob).where(PayloadBlob.hash.in_(hashes)))
+            db.commit()
+            removed += len(hashes)
+            time.sleep(settings.retention_batch_pause)
+
+    def vacuum(self, db: Session) -> int:
+        """Return free pages to the OS on SQLite files in incremental auto-vacuum mode."""
+        if db.get_bind().dialect.name != "sqlite":
+            return 0
+        conn = db.connection()
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+            return 0
+        free = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        db.commit()
+        # the pragma frees one page per VM step; executescript steps it to completion
+        raw = db.connection().connection
+        raw.executescript(f"PRAGMA incremental_vacuum({int(settings.retention_vacuum_pages)});")
+        return free - db.connection().exec_driver_sql("PRAGMA freelist_count").scalar()
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """One full retention pass; safe to interrupt and re-run."""
+        now = now or datetime.utcnow()
+        started = time.perf_counter()
+        with SessionLocal() as db:
+            stats: Dict[str, Any] = {}
+            if db.get_bind().dialect.name == "postgresql":
+                for table in ("weather_forecasts", "weather_observations"):
+                    if is_partitioned(db, table):
+                        ensure_partitions(db, table, now, settings.partition_months_ahead)
+            stats["snapshots_downsampled"] = self.downsample(db, now)
+            stats.update(self.rollup(db, now))
+            stats.update(self.expire(db, now))
+            stats["blobs_collected"] = self.collect_blobs(db)
+            stats["pages_vacuumed"] = self.vacuum(db)
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        stats["ran_at"] = now.isoformat()
+        self.last_run = stats
+        logger.info("retention pass: %s", stats)
+        return stats
+
+    # -- scheduling ------------------------------------------------------
+
+    async def _lease(self) -> bool:
+        # with a shared cache backend only one worker runs each pass
+        from services.shared_cache import shared_backend
+
+        if shared_backend is None:
+            return True
+        try:
+            return await shared_backend.add(f"{settings.cache_namespace}:retention", b"1", settings.retention_interval * 0.9)
+        except Exception as e:
+            logger.warning("retention lease failed: %s", e)
+            return True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.retention_interval)
+            try:
+                if await self._lease():
+                    await run_in_threadpool(self.run_once)
+            except Exception:
+                logger.exception("retention pass failed")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# -- Postgres monthly partitions ---------------------------------------------
+
+
+def _month(dt: datetime, offset: int = 0) -> datetime:
+    index = dt.year * 12 + dt.month - 1 + offset
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def is_partitioned(db: Session, table: str) -> bool:
+    return db.execute(
+        text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :t"),
+        {"t": table},
+    ).first() is not None
+
+
+def ensure_partitions(db: Session, table: str, now: datetime, months_ahead: int) -> None:
+    """Create monthly partitions from this month through ``months_ahead``."""
+    for offset in range(0, months_ahead + 1):
+        lo, hi = _month(now, offset), _month(now, offset + 1)
+        name = f"{table}_y{lo.year:04d}m{lo.month:02d}"
+        db.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{lo:%Y-%m-%d}') TO ('{hi:%Y-%m-%d}')"
+        ))
+    db.commit()
+
+
+def drop_expired_partitions(db: Session, table: str, cutoff: datetime) -> int:
+    """Drop monthly partitions that end on or before ``cutoff``."""
+    names = db.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :t"
+        ),
+        {"t": table},
+    ).scalars().all()
+    dropped = 0
+    for name in names:
+        suffix = name[len(table) + 1:]
+        try:
+            start = datetime.strptime(suffix, "y%Ym%m")
+        except ValueError:
+            continue  # not one of ours (e.g. a default partition)
+        if _month(start, 1) <= cutoff:
+            db.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+            dropped += 1
+    db.commit()
+    return dropped
+
+
+retention = Retention()
@@ -0,0 +1,419 @@
+"""Cache tier shared between worker processes.
+
+Each worker keeps its in-process ``TTLCache`` (L1) in front of an optional
+shared backend (L2) so that ``uvicorn --workers N`` or several containers fill
+a key from upstream once instead of N times:
+
+* ``sqlite`` -- a WAL-mode SQLite file, for workers on one host.
+* ``redis`` -- anything speaking the Redis protocol (see ``tools/resp_server.py``
+  for a local stand-in), for workers on several hosts.
+
+Values are stored as a small versioned header in front of the bytes the
+cache's ``dumps`` produces (compact JSON by default; forecasts use
+``ForecastSeries.to_bytes``), zlib compressed when large. A worker that
+misses takes a short fill lease in the backend; other workers wait for the
+entry to appear instead of calling upstream themselves.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from core.config import settings
+from core.metrics import record_cache
+from services.cache import SingleFlight, TTLCache
+
+logger = logging.getLogger(__name__)
+
+# bump when the header layout changes; entries with another version are misses
+FORMAT_VERSION = 2
+_HEADER = struct.Struct(">BBdd")  # format version, codec, stored_at, expires_at
+# how the body after the header is stored; what it encodes is up to dumps/loads
+_CODEC_RAW = 0
+_CODEC_ZLIB = 1
+_COMPRESS_OVER = 512
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def encode(value: Any, ttl: float, dumps: Callable[[Any], bytes] = _json_dumps) -> bytes:
+    now = time.time()
+    body = dumps(value)
+    codec = _CODEC_RAW
+    if len(body) > _COMPRESS_OVER:
+        body = zlib.compress(body, 1)
+        codec = _CODEC_ZLIB
+    return _HEADER.pack(FORMAT_VERSION, codec, now, now + ttl) + body
+
+
+def decode(blob: bytes, loads: Callable[[bytes], Any] = json.loads) -> Optional[Tuple[Any, float]]:
+    """Return (value, seconds left), or None for expired or foreign entries."""
+    if len(blob) < _HEADER.size:
+        return None
+    version, codec, _stored_at, expires_at = _HEADER.unpack_from(blob)
+    remaining = expires_at - time.time()
+    if version != FORMAT_VERSION or remaining <= 0:
+        return None
+    body = blob[_HEADER.size:]
+    if codec == _CODEC_ZLIB:
+        body = zlib.decompress(body)
+    elif codec != _CODEC_RAW:
+        return None
+    return loads(body), remaining
+
+
+class CacheBackend:
+    """Byte store with per-key expiry shared between processes."""
+
+    name = "backend"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        raise NotImplementedError
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """Set ``key`` only if absent (or expired); True when this call set it."""
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def delete_if(self, key: str, value: bytes) -> bool:
+        """Delete ``key`` only while it holds ``value``; True when this call deleted it."""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class SQLiteBackend(CacheBackend):
+    """WAL-mode SQLite file; readers never block the single writer."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key: str) -> Optional[bytes]:
+        row = self._conn().execute(
+            "SELECT value FROM cache_entries WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)", (key, value, now + ttl))
+        self._writes += 1
+        if self._writes % 500 == 0:
+            conn.execute("DELETE FROM cache_entries WHERE expires <= ?", (now,))
+
+    def _add(self, key: str, value: bytes, ttl: float) -> bool:
+        now = time.time()
+        cur = self._conn().execute(
+            "INSERT INTO cache_entries (key, value, expires) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires "
+            "WHERE cache_entries.expires <= ?",
+            (key, value, now + ttl, now),
+        )
+        return cur.rowcount == 1
+
+    def _delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def _delete_if(self, key: str, value: bytes) -> bool:
+        cur = self._conn().execute("DELETE FROM cache_entries WHERE key = ? AND value = ?", (key, value))
+        return cur.rowcount == 1
+
+    # sqlite3 calls block, so they run off the event loop
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return await asyncio.to_thread(self._add, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    async def delete_if(self, key: str, value: bytes) -> bool:
+        return await asyncio.to_thread(self._delete_if, key, value)
+
+
+class RespError(Exception):
+    pass
+
+
+# compare-and-delete in one step, so a lease that expired and was retaken is left to its new holder
+DELETE_IF_SCRIPT = 'if redis.call("GET", KEYS[1]) == ARGV[1] then return redis.call("DEL", KEYS[1]) else return 0 end'
+
+
+class RedisBackend(CacheBackend):
+    """Minimal Redis protocol (RESP2) client using GET/SET/DEL over asyncio streams."""
+
+    name = "redis"
+
+    def __init__(self, url: str, pool_size: int = 8):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.pool_size = pool_size
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), timeout=1.0)
+        conn = (reader, writer)
+        if self.password:
+            await self._roundtrip(conn, "AUTH", self.password)
+        if self.db:
+            await self._roundtrip(conn, "SELECT", str(self.db))
+        return conn
+
+    @staticmethod
+    def _pack(*parts: Any) -> bytes:
+        out = [b"*%d\r\n" % len(parts)]
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode()
+            out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(out)
+
+    @staticmethod
+    async def _read_reply(reader: asyncio.StreamReader) -> Any:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RespError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0:
+                return None
+            data = await reader.readexactly(size + 2)
+            return data[:-2]
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [await RedisBackend._read_reply(reader) for _ in range(size)]
+        raise RespError(f"unexpected reply {line!r}")
+
+    async def _roundtrip(self, conn, *parts: Any) -> Any:
+        reader, writer = conn
+        writer.write(self._pack(*parts))
+        await writer.drain()
+        return await asyncio.wait_for(self._read_reply(reader), timeout=1.0)
+
+    async def _command(self, *parts: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # connections are bound to the loop that opened them
+            self._idle = []
+            self._loop = loop
+        conn = self._idle.pop() if self._idle else await self._connect()
+        try:
+            reply = await self._roundtrip(conn, *parts)
+        except BaseException:
+            conn[1].close()
+            raise
+        if len(self._idle) < self.pool_size:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+        return reply
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._command("GET", key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._command("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return await self._command("SET", key, value, "NX", "PX", max(1, int(ttl * 1000))) is not None
+
+    async def delete(self, key: str) -> None:
+        await self._command("DEL", key)
+
+    async def delete_if(self, key: str, value: bytes) -> bool:
+        return await self._command("EVAL", DELETE_IF_SCRIPT, 1, key, value) == 1
+
+    async def close(self) -> None:
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = []
+
+
+def backend_from_settings() -> Optional[CacheBackend]:
+    kind = settings.cache_backend.lower()
+    if kind == "local":
+        return None
+    if kind == "sqlite":
+        return SQLiteBackend(settings.cache_url or os.path.join(os.getcwd(), "cache.db"))
+    if kind == "redis":
+        return RedisBackend(settings.cache_url or "redis://127.0.0.1:6379/0")
+    raise ValueError("CACHE_BACKEND must be 'local', 'sqlite' or 'redis'")
+
+
+class TieredCache:
+    """A worker-local ``TTLCache`` in front of an optional shared backend.
+
+    Backend failures are logged and treated as misses, so a dead Redis degrades
+    to per-worker caching rather than failing requests.
+    """
+
+    def __init__(
+        self,
+        local: TTLCache,
+        backend: Optional[CacheBackend],
+        namespace: str,
+        dumps: Callable[[Any], bytes] = _json_dumps,
+        loads: Callable[[bytes], Any] = json.loads,
+    ):
+        self.local = local
+        self.backend = backend
+        self.prefix = f"{namespace}:{local.name}:"
+        self.dumps = dumps
+        self.loads = loads
+        self._flight = SingleFlight()
+        self.owner = uuid.uuid4().hex
+
+    async def _shared_get(self, key: str) -> Optional[Tuple[Any, float]]:
+        if self.backend is None:
+            return None
+        try:
+            blob = await self.backend.get(self.prefix + key)
+            entry = decode(blob, self.loads) if blob is not None else None
+        except Exception as e:
+            logger.warning("%s cache get failed: %s", self.backend.name, e)
+            return None
+        record_cache(f"{self.local.name}_shared", entry is not None)
+        return entry
+
+    async def _shared_set(self, key: str, value: Any, ttl: float) -> None:
+        if self.backend is None:
+            return
+        try:
+            await self.backend.set(self.prefix + key, encode(value, ttl, self.dumps), ttl)
+        except Exception as e:
+            logger.warning("%s cache set failed: %s", self.backend.name, e)
+
+    async def get(self, key: str) -> Any:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        entry = await self._shared_get(key)
+        if entry is None:
+            return None
+        value, remaining = entry
+        self.local.set(key, value, ttl=remaining)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.local.ttl if ttl is None else ttl
+        self.local.set(key, value, ttl=ttl)
+        await self._shared_set(key, value, ttl)
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        return await self.load(key, loader)
+
+    async def _acquire_fill(self, key: str) -> Optional[bytes]:
+        """The lease token when this worker may fill ``key``, else None."""
+        token = f"{self.owner}:{uuid.uuid4().hex}".encode()
+        if self.backend is None:
+            return token
+        try:
+            return token if await self.backend.add(f"{self.prefix}fill:{key}", token, settings.cache_fill_wait) else None
+        except Exception as e:
+            logger.warning("%s cache lease failed: %s", self.backend.name, e)
+            return token
+
+    async def _release_fill(self, key: str, token: bytes) -> None:
+        try:
+            # the lease may have run out during a slow fill and belong to another worker now
+            await self.backend.delete_if(f"{self.prefix}fill:{key}", token)
+        except Exception as e:
+            logger.warning("%s cache lease release failed: %s", self.backend.name, e)
+
+    async def load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        on_fill: Optional[Callable[[Any], None]] = None,
+        ttl: Optional[Callable[[Any], float]] = None,
+    ) -> Any:
+        """Return the value for ``key`` after a local miss.
+
+        Tries the shared tier, then fills from ``loader`` while holding the
+        fill lease. Concurrent callers in this worker share one attempt;
+        callers in other workers poll the shared tier until the lease holder
+        stores the value (or the lease runs out). ``on_fill`` runs for values
+        that are new to this worker; ``ttl(value)`` overrides the TTL of
+        loaded values.
+        """
+
+        async def fill() -> Any:
+            entry = await self._shared_get(key)
+            deadline = time.monotonic() + settings.cache_fill_wait
+            delay = 0.025
+            while entry is None:
+                lease = await self._acquire_fill(key)
+                # past the deadline the lease holder is slow or gone; fetch ourselves
+                if lease is not None or time.monotonic() >= deadline:
+                    try:
+                        value = await loader()
+                        await self.set(key, value, ttl(value) if ttl is not None else None)
+                    finally:
+                        if lease is not None and self.backend is not None:
+                            await self._release_fill(key, lease)
+                    break
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.25)
+                entry = await self._shared_get(key)
+            else:
+                value, remaining = entry
+                self.local.set(key, value, ttl=remaining)
+            if on_fill is not None:
+                on_fill(value)
+            return value
+
+        return await self._flight.do(key, fill)
+
+
+shared_backend = backend_from_settings()
@@ -0,0 +1,169 @@
+"""Snap coordinates to forecast tiles so nearby users share cache entries.
+
+Upstream models resolve kilometers, not meters, so forecasts are looked up and
+stored for the tile center rather than the user's exact point. Two schemes are
+supported: a fixed-degree grid and geohash cells.
+"""
+
+import math
+import threading
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+from core.config import settings
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+class Tile(NamedTuple):
+    key: str
+    lat: float
+    lon: float
+
+
+def geohash_encode(lat: float, lon: float, precision: int) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars: List[str] = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                value = (value << 1) | 1
+                lon_lo = mid
+            else:
+                value <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = (value << 1) | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def geohash_bounds(code: str) -> Tuple[float, float, float, float]:
+    """Return (lat_lo, lat_hi, lon_lo, lon_hi) of a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+    for ch in code:
+        value = _BASE32.index(ch)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lat_hi, lon_lo, lon_hi
+
+
+class TileScheme:
+    def __init__(self, scheme: str = "grid", size_deg: float = 0.05, precision: int = 5):
+        if scheme not in ("grid", "geohash", "none"):
+            raise ValueError("tile scheme must be 'grid', 'geohash' or 'none'")
+        self.scheme = scheme
+        self.size_deg = size_deg
+        self.precision = precision
+
+    def tile_for(self, lat: float, lon: float) -> Tile:
+        lat = max(-90.0, min(90.0, float(lat)))
+        lon = ((float(lon) + 180.0) % 360.0) - 180.0
+        if self.scheme == "geohash":
+            code = geohash_encode(lat, lon, self.precision)
+            lat_lo, lat_hi, lon_lo, lon_hi = geohash_bounds(code)
+            return Tile(f"gh:{code}", round((lat_lo + lat_hi) / 2, 5), round((lon_lo + lon_hi) / 2, 5))
+        if self.scheme == "grid":
+            # the pole belongs to the band below it, not a band of its own past 90
+            row = min(math.floor(lat / self.size_deg), math.ceil(90.0 / self.size_deg) - 1)
+            col = math.floor(lon / self.size_deg)
+            # a size that doesn't divide 90 (180) leaves the edge cells' centres past the pole (antimeridian)
+            center_lat = round(max(-90.0, min(90.0, (row + 0.5) * self.size_deg)), 5)
+            center_lon = round(max(-180.0, min(180.0, (col + 0.5) * self.size_deg)), 5)
+            return Tile(f"g{self.size_deg}:{row}:{col}", center_lat, center_lon)
+        key_lat, key_lon = round(lat, 5), round(lon, 5)
+        return Tile(f"pt:{key_lat}:{key_lon}", key_lat, key_lon)
+
+    def cell_size(self) -> Tuple[float, float, float, float]:
+        """Return (dlat, dlon, lat_origin, lon_origin) of the tile lattice.
+
+        Exact-point mode has no lattice of its own and borrows the grid size.
+        """
+        if self.scheme == "geohash":
+            bits = 5 * self.precision
+            lon_bits = (bits + 1) // 2
+            lat_bits = bits // 2
+            return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits), -90.0, -180.0
+        return self.size_deg, self.size_deg, 0.0, 0.0
+
+    def lattice(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float, pad: int = 1) -> Tuple[List[float], List[float]]:
+        """Tile-center latitudes and longitudes covering a box, padded by ``pad`` cells."""
+        dlat, dlon, lat0, lon0 = self.cell_size()
+        r0 = math.floor((min_lat - lat0) / dlat) - pad
+        r1 = math.floor((max_lat - lat0) / dlat) + pad
+        c0 = math.floor((min_lon - lon0) / dlon) - pad
+        c1 = math.floor((max_lon - lon0) / dlon) + pad
+        lats = [lat0 + (r + 0.5) * dlat for r in range(r0, r1 + 1) if -90.0 < lat0 + (r + 0.5) * dlat < 90.0]
+        lons = [lon0 + (c + 0.5) * dlon for c in range(c0, c1 + 1)]
+        return lats, lons
+
+
+class TileStats:
+    """Per-tile hit/miss counters, bounded to ``max_tiles`` distinct tiles."""
+
+    def __init__(self, max_tiles: int = 10000):
+        self.max_tiles = max_tiles
+        self._tiles: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.untracked = 0
+
+    def record(self, key: str, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        counts = self._tiles.get(key)
+        if counts is None:
+            with self._lock:
+                if len(self._tiles) >= self.max_tiles:
+                    self.untracked += 1
+                    return
+                counts = self._tiles.setdefault(key, [0, 0])
+        counts[0 if hit else 1] += 1
+
+    def snapshot(self, top: int = 20) -> Dict[str, Any]:
+        tiles = list(self._tiles.items())
+        tiles.sort(key=lambda kv: kv[1][0] + kv[1][1], reverse=True)
+        total = self.hits + self.misses
+        return {
+            "lookups": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+            "distinct_tiles": len(tiles),
+            "untracked_lookups": self.untracked,
+            "top_tiles": [
+                {"tile": key, "hits": h, "misses": m, "hit_ratio": round(h / (h + m), 4)}
+                for key, (h, m) in tiles[:top]
+            ],
+        }
+
+
+tile_scheme = TileScheme(settings.tile_scheme, settings.tile_size_deg, settings.geohash_precision)
+tile_stats = TileStats()
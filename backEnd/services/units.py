@@ -0,0 +1,74 @@
+"""Unit systems for forecast output.
+
+Upstream forecasts are always fetched and cached in metric (°C, m/s, mm), so a
+tile costs one upstream call and one cache entry however many unit systems
+clients ask for. ``convert`` maps a cached series to the requested system with
+one multiply-add over its value matrix; metric is returned as is.
+"""
+
+from typing import Dict
+
+import numpy as np
+
+from core.config import settings
+from services.forecast_series import COLUMN_INDEX, COLUMNS, ForecastSeries
+
+CANONICAL = "metric"
+UNIT_SYSTEMS = ("metric", "imperial", "standard")
+# for Query(pattern=...)
+UNITS_PATTERN = "^(" + "|".join(UNIT_SYSTEMS) + ")$"
+
+LABELS: Dict[str, Dict[str, str]] = {
+    "metric": {"temp": "°C", "wind": "m/s", "precip": "mm"},
+    "imperial": {"temp": "°F", "wind": "mph", "precip": "in"},
+    "standard": {"temp": "K", "wind": "m/s", "precip": "mm"},
+}
+
+_TEMPERATURE = ("temp", "feels_like", "temp_min", "temp_max")
+_WIND = ("wind_speed", "wind_gust")
+_PRECIPITATION = ("rain_3h", "snow_3h")
+
+
+def _affine(temp: tuple, wind: float, precip: float):
+    scale = np.ones(len(COLUMNS))
+    offset = np.zeros(len(COLUMNS))
+    for name in _TEMPERATURE:
+        scale[COLUMN_INDEX[name]], offset[COLUMN_INDEX[name]] = temp
+    for name in _WIND:
+        scale[COLUMN_INDEX[name]] = wind
+    for name in _PRECIPITATION:
+        scale[COLUMN_INDEX[name]] = precip
+    # (V, 1) so they broadcast over the steps of a (V, N) matrix
+    return scale[:, None], offset[:, None]
+
+
+# value_in_units = metric_value * scale + offset, per column
+_FROM_METRIC = {
+    "imperial": _affine((9 / 5, 32.0), 2.236936, 1 / 25.4),
+    "standard": _affine((1.0, 273.15), 1.0, 1.0),
+}
+
+
+def resolve(units: str | None) -> str:
+    """The requested unit system, defaulting to ``WEATHER_UNITS``."""
+    units = units or settings.units
+    if units not in UNIT_SYSTEMS:
+        raise ValueError(f"units must be one of: {', '.join(UNIT_SYSTEMS)}")
+    return units
+
+
+def convert(series: ForecastSeries, units: str) -> ForecastSeries:
+    """Return ``series`` expressed in ``units``; NaN stays NaN."""
+    if units == CANONICAL:
+        return series
+    scale, offset = _FROM_METRIC[units]
+    return ForecastSeries(series.provider, series.city, series.dt, series.values * scale + offset, series.codes, series.fetched_at)
+
+
+def convert_value(column: str, value: float, units: str) -> float:
+    """A single metric ``column`` value expressed in ``units``."""
+    if units == CANONICAL:
+        return value
+    scale, offset = _FROM_METRIC[units]
+    i = COLUMN_INDEX[column]
+    return float(value * scale[i, 0] + offset[i, 0])
@@ -1,8 +1,17 @@
+import asyncio
+import time
 from datetime import datetime, timedelta, timezone, date
-from collections import defaultdict
-from typing import Dict, Any, List
+from typing import Callable, Collection, Dict, Any, List
+import numpy as np
 from core.config import settings
-from services.api_forecast_client import ApiForecastClient
+from core.timing import timed
+from services.cache import TTLCache
+from services import climatology, forecast_store
+from services import units as unit_systems
+from services.forecast_series import ForecastSeries
+from services.providers import OpenWeatherProvider, ProviderRouter, get_provider_router
+from services.shared_cache import TieredCache, shared_backend
+from services.tiling import tile_scheme, tile_stats
 
 
 def _pick_icon(weather_argument):
@@ -12,63 +21,146 @@ def _pick_icon(weather_argument):
         "clear": "☀️", "clouds": "☁️", "rain": "🌧️", "drizzle": "🌦️",
         "thunderstorm": "🌩️", "snow": "🌨️", "mist": "🌫️", "fog": "🌫️", "haze": "🌫️"
     }.get(main, "☁️")
+def _precip(series: ForecastSeries, units: str) -> float:
+    '''Rain plus snow over the first step, rounded for display.'''
+    if not len(series):
+        return 0
+    total = float(np.nan_to_num(series.column("rain_3h")[0]) + np.nan_to_num(series.column("snow_3h")[0]))
+    return round(total, 2 if units == "imperial" else 1)
 def _to_local_time(ts_utc: int, offset_sec: int) -> datetime:
     return datetime.fromtimestamp(ts_utc, tz=timezone.utc) + timedelta(seconds=offset_sec)
 
 
+# top-level keys of the summary document, in order
+SUMMARY_FIELDS = ("place", "date", "units", "current", "hourly", "daily", "anomaly")
+# Shared across requests: forecasts are keyed by tile, not by exact point.
+forecast_cache = TTLCache("forecast", settings.forecast_cache_ttl, settings.forecast_cache_max_entries)
+# forecast_cache is this worker's tier; the shared tier lets workers fill a tile once.
+# Entries are always metric; the unit system in the namespace keeps them apart
+# from entries written by builds that cached in WEATHER_UNITS.
+shared_forecasts = TieredCache(
+    forecast_cache,
+    shared_backend,
+    f"{settings.cache_namespace}:{unit_systems.CANONICAL}",
+    dumps=ForecastSeries.to_bytes,
+    loads=ForecastSeries.from_bytes,
+)
+# Called as listener(tile_key, series) whenever a tile's forecast is refreshed from upstream.
+refresh_listeners: List[Callable[[str, ForecastSeries], None]] = []
+# floor for the cache TTL of a series served from the database
+_MIN_DB_TTL = 30.0
+
+
+def _cache_ttl(series: ForecastSeries) -> float:
+    '''Cache a series only until it would be too old to serve from the database.'''
+    if not settings.forecast_db_max_age:
+        return settings.forecast_cache_ttl
+    left = series.fetched_at + settings.forecast_db_max_age - time.time()
+    return min(settings.forecast_cache_ttl, max(left, _MIN_DB_TTL))
+
+
 class WeatherService:
-    def __init__(self, client = None):
-        self.client = client if client is not None else ApiForecastClient()
-        
-    async def fetch_data(self, lat: float, lon:float) -> Dict[str, Any]:
-        params = {
-            'lat': lat, 'lon': lon,
-            'appid': settings.api_weather_key,
-            'units': settings.units
-        }
-        return await self.client._make_request('forecast', params)
+    def __init__(self, client = None, router: ProviderRouter | None = None):
+        # an explicit client pins the service to OpenWeather (handy for tests)
+        if router is None:
+            router = ProviderRouter([OpenWeatherProvider(client)]) if client is not None else get_provider_router()
+        self.router = router
+
+    async def fetch_data(self, lat: float, lon:float) -> ForecastSeries:
+        '''Fetch the forecast for the tile containing (lat, lon).
+
+        Provider payloads are converted to a ``ForecastSeries`` once, on
+        ingest; ``series.provider`` names the vendor used. The series is in
+        metric units whatever ``WEATHER_UNITS`` says; see ``units.convert``. Concurrent misses for the
+        same tile share one upstream call, across workers when a shared
+        cache backend is configured. A miss is first answered from a fresh
+        snapshot stored in the database (``forecast_store``); forecasts
+        fetched upstream are written back to it in the background.
+        '''
+        tile = tile_scheme.tile_for(lat, lon)
+        data = forecast_cache.get(tile.key)
+        tile_stats.record(tile.key, data is not None)
+        if data is not None:
+            return data
+
+        async def load() -> ForecastSeries:
+            if settings.forecast_db_max_age > 0:
+                stored = await asyncio.to_thread(forecast_store.latest_for_tile, tile)
+                if stored is not None:
+                    return stored
+            payload = await self.router.fetch(tile.lat, tile.lon)
+            fresh = ForecastSeries.from_payload(payload)
+            if settings.forecast_write_back:
+                source = self.router.get(fresh.provider)
+                # the series keeps only its columns; the store gets the items as the provider sent them
+                forecast_store.write_back.submit(tile, fresh, source.base_url if source is not None else None, payload.get("list"))
+            return fresh
+
+        def notify(fresh: ForecastSeries) -> None:
+            for listener in refresh_listeners:
+                listener(tile.key, fresh)
+
+        return await shared_forecasts.load(tile.key, load, on_fill=notify, ttl=_cache_ttl)
         
-    def build_context(self, data: Dict[str, Any]) -> Dict[str, Any]:
-        city = data.get("city", {})
-        place = f'{city.get("name", "")}, {city.get("country", "")}'.strip(", ")
-        if not place:
-            place = "Unknown"
+    @timed("build")
+    def build_context(self, series: ForecastSeries, units: str | None = None, baseline: climatology.Baseline | None = None, fields: Collection[str] | None = None) -> Dict[str, Any]:
+        '''The summary document; ``fields`` limits it to those ``SUMMARY_FIELDS``, and only they are computed.'''
+        wanted = SUMMARY_FIELDS if fields is None else fields
+        units = unit_systems.resolve(units)
+        labels = unit_systems.LABELS[units]
+        ctx: Dict[str, Any] = {}
+        city = series.city
         time_zone = int(city.get("timezone", 0))
-        now_local = datetime.utcnow().replace(tzinfo=timezone.utc)+timedelta(seconds=time_zone)
-        nice_date = now_local.strftime("%A, %b %d, %Y")
-        items: List[Dict[str, Any]] = data.get("list", [])
-        first = items[0] if items else {}
-        main = first.get("main", {})
-        wind = first.get("wind", {})
-        current = {
-            "temp": round(float(main.get("temp", 0))),
-            "feels_like": round(float(main.get("feels_like", 0))),
-            "humidity": int(main.get("humidity", 0)),
-            "wind": f'{round(float(wind.get("speed", 0)))} km/h',
-            "precip": "0 mm",
-            "icon": _pick_icon(first.get("weather", [])),
-        }
+        if "place" in wanted:
+            place = f'{city.get("name", "")}, {city.get("country", "")}'.strip(", ")
+            ctx["place"] = place or "Unknown"
+        if "date" in wanted:
+            now_local = datetime.utcnow().replace(tzinfo=timezone.utc)+timedelta(seconds=time_zone)
+            ctx["date"] = now_local.strftime("%A, %b %d, %Y")
+        if "units" in wanted:
+            ctx["units"] = {"system": units, **labels}
+        if "anomaly" in wanted:
+            # z-scores compare metric values with metric normals
+            ctx["anomaly"] = climatology.score(baseline, series, units, settings.climatology_min_samples) if baseline is not None else None
+        if not {"current", "hourly", "daily"} & set(wanted):
+            return {k: ctx[k] for k in SUMMARY_FIELDS if k in ctx}
+        series = unit_systems.convert(series, units)
+        n = len(series)
+        # missing values read as 0, as they did with the dict payload
+        temps = np.nan_to_num(series.column("temp"))
+        if "current" in wanted:
+            ctx["current"] = {
+                "temp": round(float(temps[0])) if n else 0,
+                "feels_like": round(float(np.nan_to_num(series.column("feels_like")[0]))) if n else 0,
+                "humidity": int(np.nan_to_num(series.column("humidity")[0])) if n else 0,
+                "wind": f'{round(float(np.nan_to_num(series.column("wind_speed")[0]))) if n else 0} {labels["wind"]}',
+                "precip": f'{_precip(series, units):g} {labels["precip"]}',
+                "icon": _pick_icon(series.weather(0) if n else []),
+            }
 
         '''Hourly data: next 8 *3 hours'''
-        hourly = []
-        for item in items[:8]:
-            time = _to_local_time(item.get("dt"), time_zone)
-            temp = round(float(item.get("main", {}).get("temp", 0)))
-            hourly.append({
-                "time": time.strftime("%I %p").lstrip("0") if hasattr(time, "strftime") else "",
-                "icon": _pick_icon(item.get("weather", [])),
-                "temp": temp
-            })
+        if "hourly" in wanted:
+            hourly = []
+            for j in range(min(8, n)):
+                time = _to_local_time(int(series.dt[j]), time_zone)
+                hourly.append({
+                    "time": time.strftime("%I %p").lstrip("0"),
+                    "icon": _pick_icon(series.weather(j)),
+                    "temp": round(float(temps[j]))
+                })
+            ctx["hourly"] = hourly
 
         '''Daily data: next 7 days'''
-        groups = defaultdict(list)
-        for item in items:
-            date = _to_local_time(item["dt"], time_zone).date()
-            groups[date].append(item)
-        daily = []
-        for date in sorted(groups.keys())[:7]:
-            temps = [float(x.get("main", {}).get("temp", 0)) for x in groups[date]]
-            hi, lo = (round(max(temps)) if temps else 0, round(min(temps)) if temps else 0)
-            mid = groups[date][len(groups[date]) // 2]
-            daily.append({"name": date.strftime("%a"), "hi": hi, "lo": lo, "icon": _pick_icon(mid.get("weather", []))})
-        return{"place":place, "date":nice_date, "current":current, "hourly":hourly, "daily":daily}
\ No newline at end of file
+        if "daily" in wanted:
+            daily = []
+            if n:
+                # steps are sorted, so each local day is one contiguous run
+                days = (series.dt + time_zone) // 86400
+                bounds = np.append(np.flatnonzero(np.r_[True, days[1:] != days[:-1]]), n)
+                for lo, hi in zip(bounds[:7], bounds[1:8]):
+                    chunk = temps[lo:hi]
+                    date = _to_local_time(int(series.dt[lo]), time_zone).date()
+                    mid = lo + (hi - lo) // 2
+                    daily.append({"name": date.strftime("%a"), "hi": round(float(chunk.max())), "lo": round(float(chunk.min())), "icon": _pick_icon(series.weather(mid))})
+            ctx["daily"] = daily
+        return {k: ctx[k] for k in SUMMARY_FIELDS if k in ctx}
@@ -0,0 +1,51 @@
+import asyncio
+import unittest
+
+from services.cache import SingleFlight
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+    async def test_cancelled_leader_does_not_cancel_followers(self):
+        flight = SingleFlight()
+        started = asyncio.Event()
+        release = asyncio.Event()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            started.set()
+            await release.wait()
+            return "value"
+
+        leader = asyncio.ensure_future(flight.do("key", loader))
+        await started.wait()
+        follower = asyncio.ensure_future(flight.do("key", loader))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await follower, "value")
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        self.assertEqual(calls, 1)
+
+    async def test_error_reaches_every_caller_and_clears_key(self):
+        flight = SingleFlight()
+
+        async def loader():
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(flight.do("key", loader), flight.do("key", loader), return_exceptions=True)
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+        async def ok():
+            return 1
+
+        self.assertEqual(await flight.do("key", ok), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
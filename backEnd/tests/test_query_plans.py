@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+import unittest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class QueryPlanTest(unittest.TestCase):
+    def test_no_full_scans_of_large_tables(self):
+        # a process of its own: the check points DATABASE_URL at a scratch file before the engine is created
+        env = {k: v for k, v in os.environ.items() if k != "DATABASE_URL"}
+        result = subprocess.run(
+            [sys.executable, "-m", "tools.check_query_plans"],
+            cwd=BACKEND,
+            env=env,
+            capture_output=True,
+            text=True,
+            timeout=600,
+        )
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
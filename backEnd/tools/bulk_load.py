@@ -0,0 +1,86 @@
+"""Bulk-load historical observations or forecasts from CSV, NDJSON or Parquet.
+
+    python -m tools.bulk_load observations stations.csv --provider noaa-isd
+    python -m tools.bulk_load forecasts era5.parquet --provider era5 --map temperature_c=t2m
+    zcat obs.ndjson.gz | python -m tools.bulk_load observations - --format ndjson --provider synop
+
+Progress is saved to ``<input>.checkpoint`` after every chunk; running the
+same command again resumes after the last committed chunk (``--restart``
+starts over). See ``services/bulk_load.py`` for the column matching.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from core import migrations
+from core.database import SessionLocal, engine
+from services import bulk_load
+
+
+def _mapping(pairs):
+    mapping = {}
+    for pair in pairs:
+        target, sep, source = pair.partition("=")
+        if not sep:
+            raise SystemExit(f"--map expects target=source, got {pair!r}")
+        mapping[target] = source
+    return mapping
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream observations or forecasts into the database.")
+    parser.add_argument("kind", choices=bulk_load.KINDS)
+    parser.add_argument("input", help="file to load, or - for stdin")
+    parser.add_argument("--provider", required=True, help="provider name the rows are attributed to")
+    parser.add_argument("--format", choices=bulk_load.FORMATS, default=None, help="default: from the file extension")
+    parser.add_argument("--map", action="append", default=[], metavar="TARGET=SOURCE", help="use SOURCE for column TARGET")
+    parser.add_argument("--chunk-size", type=int, default=bulk_load.DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--skip", type=int, default=0, help="leave out the first N records")
+    parser.add_argument("--checkpoint", default=None, help="default: <input>.checkpoint (none for stdin)")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+
+    stdin = args.input == "-"
+    if stdin and args.format is None:
+        raise SystemExit("--format is required when reading stdin")
+    fmt = args.format or bulk_load.detect_format(args.input)
+    checkpoint = None
+    path = args.checkpoint or (None if stdin else args.input + ".checkpoint")
+    if path:
+        source = {"input": "-" if stdin else os.path.abspath(args.input), "kind": args.kind, "provider": args.provider}
+        if not stdin:
+            source["size"] = os.path.getsize(args.input)
+        if args.restart and os.path.exists(path):
+            os.remove(path)
+        checkpoint = bulk_load.Checkpoint(path, source)
+
+    last = [0.0]
+
+    def report(progress):
+        now = time.monotonic()
+        if now - last[0] >= 1.0:
+            last[0] = now
+            print(f"{progress.records} records, {progress.inserted} inserted, {progress.rows_per_second} rows/s", file=sys.stderr)
+
+    migrations.upgrade(engine)
+    stream = sys.stdin.buffer if stdin else open(args.input, "rb")
+    try:
+        with SessionLocal() as db:
+            progress = bulk_load.load(
+                db, stream, fmt, args.kind, args.provider,
+                mapping=_mapping(args.map), chunk_size=args.chunk_size, skip=args.skip,
+                checkpoint=checkpoint, on_progress=report,
+            )
+    except bulk_load.BulkLoadError as e:
+        raise SystemExit(str(e))
+    finally:
+        if not stdin:
+            stream.close()
+    print(json.dumps(progress.as_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
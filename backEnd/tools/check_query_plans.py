@@ -0,0 +1,219 @@
+"""Fail when an API query would scan a large table end to end.
+
+Drives every DB-backed endpoint once against a scratch database migrated to
+the latest version, with tools/owm_emulator.py standing in for the upstream
+APIs, records each SELECT/UPDATE/DELETE the app issues and asks the database
+how it would run it:
+
+- SQLite: ``EXPLAIN QUERY PLAN``; a bare ``SCAN <table>`` (no index) fails.
+- Postgres: ``EXPLAIN`` with ``enable_seqscan = off``, so a ``Seq Scan`` is
+  only chosen when no index can serve the query; that fails too.
+
+Only tables that grow with traffic are checked (``LARGE_TABLES``); reads that
+are full scans by design are listed in ``ALLOWED`` with the reason.
+
+    python -m tools.check_query_plans                    # scratch SQLite file
+    python -m tools.check_query_plans --database-url postgresql://.../scratch
+
+The target database is written to; never point it at real data.
+``tests/test_query_plans.py`` runs the SQLite check with the test suite.
+"""
+
+import argparse
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+LARGE_TABLES = frozenset((
+    "locations",
+    "location_aliases",
+    "requests",
+    "weather_forecasts",
+    "weather_observations",
+    "payload_blobs",
+    "climatology",
+))
+
+# (pattern over the whitespace-collapsed statement, why a full read is fine)
+ALLOWED: Tuple[Tuple[str, str], ...] = (
+    (r"^SELECT locations\.id, locations\.canonical_name, locations\.latitude, locations\.longitude FROM locations$",
+     "location_index.load reads every location once per worker"),
+    (r"^SELECT location_aliases\.location_id, location_aliases\.alias FROM location_aliases$",
+     "location_index.load reads every alias once per worker"),
+    (r"^SELECT payload_blobs\.hash FROM payload_blobs WHERE NOT \(EXISTS",
+     "retention blob GC walks payload_blobs in batches, probing weather_forecasts by index"),
+)
+
+_CHECKED = ("SELECT", "UPDATE", "DELETE")
+_SQLITE_SCAN = re.compile(r"^SCAN (\w+)(?: AS (\w+))?$")
+_PG_SEQ_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_emulator(port: int):
+    import uvicorn
+
+    from tools.owm_emulator import EmulatorConfig, create_app
+
+    server = uvicorn.Server(uvicorn.Config(create_app(EmulatorConfig(api_key="plan-check")), port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def _exercise(client, admin_token: str) -> None:
+    """Hit each DB-backed route at least once, leaving rows behind for the later ones."""
+    from core.database import SessionLocal
+    from services import climatology, forecast_store
+    from services.tiling import tile_scheme
+
+    start = date.today()
+    window = {"start_date": start.isoformat(), "end_date": (start + timedelta(days=2)).isoformat(), "granularity": "hourly"}
+
+    def call(method: str, path: str, **kw) -> Any:
+        response = client.request(method, path, **kw)
+        if response.status_code >= 500:
+            raise SystemExit(f"{method} {path} -> {response.status_code}: {response.text[:200]}")
+        return response.json() if response.content else None
+
+    created = call("POST", "/api/weather/requests", json={"q": "Plancheck City", **window})
+    call("POST", "/api/weather/requests", json={"lat": 40.7, "lon": -74.0, **window})
+    call("GET", "/api/weather/requests")
+    call("GET", f"/api/weather/requests/{created['request_id']}")
+    call("PATCH", f"/api/weather/requests/{created['request_id']}", json={"granularity": "daily"})
+
+    fav = call("POST", "/api/weather/favorites", json={"q": "Plancheck City"})
+    call("POST", "/api/weather/favorites", json={"lat": 40.7, "lon": -74.0})
+    call("GET", "/api/weather/favorites")
+    call("GET", "/api/weather/locations/suggest", params={"prefix": "plan"})
+    call("POST", "/api/weather/geocode/batch", json={"queries": ["Plancheck City", "Batchcheck Town", "Batchcheck Town"]})
+    # the stored-snapshot tier is only read on a forecast cache miss
+    forecast_store.latest_for_tile(tile_scheme.tile_for(40.7, -74.0))
+
+    forecasts = call("GET", "/api/weather/forecasts", params={"start_date": start.isoformat()})
+    location_id = forecasts[0]["location_id"]
+    call("GET", "/api/weather/forecasts", params={"location_id": location_id, "start_date": start.isoformat(), "end_date": start.isoformat()})
+    call("GET", "/api/weather/forecasts", params={"location_id": location_id, "fields": "forecast_time,temperature_c"})
+    forecast_id = forecasts[0]["id"]
+    call("GET", f"/api/weather/forecasts/{forecast_id}/payload")
+    call("PATCH", f"/api/weather/forecasts/{forecast_id}", json={"temperature_c": 21.5})
+    call("GET", "/api/weather/ensemble", params={"location_id": location_id})
+    # the baseline of a location is read once per worker, then served from memory
+    climatology.baselines.get(40.7, -74.0)
+    with SessionLocal() as db:
+        climatology.baselines.load(db, location_id)
+    series = {"start": start.isoformat(), "end": (start + timedelta(days=2)).isoformat(), "agg": "mean,p50"}
+    call("GET", f"/api/weather/series/{location_id}", params={**series, "source": "forecasts"})
+    call("GET", f"/api/weather/series/{location_id}", params={**series, "bucket": "6h", "provider": "OpenWeatherMap"})
+
+    call("DELETE", f"/api/weather/forecasts/{forecast_id}")
+    call("DELETE", f"/api/weather/favorites/{fav['id']}")
+    call("DELETE", f"/api/weather/requests/{created['request_id']}")
+    call("POST", "/api/admin/retention/run", headers={"X-Admin-Token": admin_token})
+
+
+def _plan_sqlite(conn, statement: str, params: Any) -> List[str]:
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, params).all()
+    return [row[-1] for row in rows]
+
+
+def _plan_postgres(conn, statement: str, params: Any) -> List[str]:
+    conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    return [row[0] for row in conn.exec_driver_sql("EXPLAIN " + statement, params).all()]
+
+
+def _full_scans(dialect: str, plan: List[str]) -> List[str]:
+    tables = []
+    for line in plan:
+        if dialect == "sqlite":
+            match = _SQLITE_SCAN.match(line.strip())
+            if match:
+                tables.append(match.group(1))
+        else:
+            tables.extend(_PG_SEQ_SCAN.findall(line))
+    return [t for t in tables if t in LARGE_TABLES]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="EXPLAIN every API query and fail on full scans of large tables.")
+    parser.add_argument("--database-url", default=None, help="scratch database to use (default: a temporary SQLite file)")
+    parser.add_argument("--verbose", action="store_true", help="print every plan, not just failures")
+    args = parser.parse_args(argv)
+
+    if args.database_url is None:
+        args.database_url = os.path.join(tempfile.mkdtemp(prefix="plancheck-"), "plans.db")
+    port = _free_port()
+    admin_token = "plan-check"
+    # settings and the engine are read at import time
+    os.environ.update({
+        "DATABASE_URL": args.database_url,
+        "API_WEATHER_KEY": "plan-check",
+        "FORECAST_BASE_URL": f"http://127.0.0.1:{port}/data/2.5",
+        "GEO_BASE_URL": f"http://127.0.0.1:{port}/geo/1.0",
+        "OPEN_METEO_BASE_URL": f"http://127.0.0.1:{port}/v1",
+        "CACHE_BACKEND": "local",
+        "RETENTION_ENABLED": "false",
+        "ADMIN_TOKEN": admin_token,
+    })
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    from core.database import engine
+    from main import app
+
+    captured: Dict[str, Any] = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if verb in _CHECKED and "schema_migrations" not in statement:
+            captured.setdefault(statement, parameters[0] if executemany else parameters)
+
+    server = _start_emulator(port)
+    try:
+        # startup (migrations) has run by the time the client is entered
+        with TestClient(app) as client:
+            event.listen(engine, "before_cursor_execute", record)
+            try:
+                _exercise(client, admin_token)
+            finally:
+                event.remove(engine, "before_cursor_execute", record)
+    finally:
+        server.should_exit = True
+
+    dialect = engine.dialect.name
+    explain = _plan_sqlite if dialect == "sqlite" else _plan_postgres
+    failures = 0
+    for statement, params in captured.items():
+        flat = " ".join(statement.split())
+        with engine.begin() as conn:
+            plan = explain(conn, statement, params)
+        scans = _full_scans(dialect, plan)
+        allowed: Optional[str] = next((why for pattern, why in ALLOWED if re.search(pattern, flat)), None)
+        if scans and not allowed:
+            failures += 1
+            print(f"FULL SCAN of {', '.join(sorted(set(scans)))}:\n  {flat}")
+            print("".join(f"    {line}\n" for line in plan), end="")
+        elif args.verbose:
+            note = f" (allowed: {allowed})" if scans else ""
+            print(f"ok{note}: {flat}")
+            print("".join(f"    {line}\n" for line in plan), end="")
+
+    print(f"{len(captured)} statements checked on {dialect}, {failures} full scans")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Async load generator for the Weather API.
+
+Drives a mix of endpoints at a fixed concurrency and reports throughput and
+p50/p95/p99 latency per endpoint. Pair with tools/owm_emulator.py so no real
+API quota is spent::
+
+    python -m tools.loadgen --base-url http://127.0.0.1:8000 --concurrency 64 --duration 30
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+# name -> (method, path, body factory)
+Scenario = Tuple[str, str, Optional[Callable[[random.Random], Dict[str, Any]]]]
+
+
+def _coords(rng: random.Random) -> Dict[str, float]:
+    return {"lat": round(rng.uniform(-60, 70), 3), "lon": round(rng.uniform(-180, 180), 3)}
+
+
+def _request_body(rng: random.Random) -> Dict[str, Any]:
+    start = date.today()
+    return {**_coords(rng), "start_date": start.isoformat(), "end_date": (start + timedelta(days=2)).isoformat(), "granularity": "hourly"}
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "summary": ("GET", "/api/weather/summary", None),
+    "summary_q": ("GET", "/api/weather/summary", None),
+    "requests_post": ("POST", "/api/weather/requests", _request_body),
+    "requests_list": ("GET", "/api/weather/requests", None),
+    "favorites_post": ("POST", "/api/weather/favorites", _coords),
+    "favorites_list": ("GET", "/api/weather/favorites", None),
+}
+
+DEFAULT_MIX = "summary=6,summary_q=2,requests_post=1,requests_list=1,favorites_post=1,favorites_list=1"
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct * len(sorted_values) / 100.0) - 1))
+    return sorted_values[rank]
+
+
+def parse_mix(raw: str) -> List[Tuple[str, int]]:
+    mix = []
+    for part in raw.split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix.append((name, int(weight or 1)))
+    return mix
+
+
+class LoadResult:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.elapsed = 0.0
+
+    def record(self, name: str, status: int, seconds: float) -> None:
+        self.latencies[name].append(seconds)
+        self.statuses[name][status] += 1
+
+    def report(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"elapsed_s": round(self.elapsed, 3), "endpoints": {}}
+        total = 0
+        for name, values in sorted(self.latencies.items()):
+            values.sort()
+            total += len(values)
+            out["endpoints"][name] = {
+                "count": len(values),
+                "rps": round(len(values) / self.elapsed, 2) if self.elapsed else 0.0,
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+                "status": dict(sorted(self.statuses[name].items())),
+            }
+        out["total"] = total
+        out["rps"] = round(total / self.elapsed, 2) if self.elapsed else 0.0
+        return out
+
+
+async def run_load(
+    base_url: str,
+    concurrency: int = 32,
+    duration: float = 10.0,
+    total_requests: Optional[int] = None,
+    mix: Optional[List[Tuple[str, int]]] = None,
+    queries: Optional[List[str]] = None,
+    seed: int = 42,
+    timeout: float = 30.0,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> LoadResult:
+    """Run ``concurrency`` workers until ``duration`` elapses or ``total_requests`` are sent."""
+    mix = mix or parse_mix(DEFAULT_MIX)
+    names = [n for n, _ in mix]
+    weights = [w for _, w in mix]
+    queries = queries or ["Seattle", "London", "Tokyo", "Ashgabat", "Lima", "Oslo"]
+    result = LoadResult()
+    sent = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id: int, client: httpx.AsyncClient) -> None:
+        nonlocal sent
+        rng = random.Random(seed + worker_id)
+        while time.perf_counter() < deadline:
+            if total_requests is not None:
+                if sent >= total_requests:
+                    return
+                sent += 1
+            name = rng.choices(names, weights)[0]
+            method, path, body_factory = SCENARIOS[name]
+            params = None
+            if name == "summary":
+                params = _coords(rng)
+            elif name == "summary_q":
+                params = {"q": rng.choice(queries)}
+            body = body_factory(rng) if body_factory else None
+            started = time.perf_counter()
+            try:
+                resp = await client.request(method, path, params=params, json=body)
+                status = resp.status_code
+            except httpx.HTTPError:
+                status = 0
+            result.record(name, status, time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits, transport=transport) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i, client) for i in range(concurrency)))
+        result.elapsed = time.perf_counter() - started
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Load-test the Weather API.")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--requests", type=int, default=None, help="stop after this many requests")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="comma separated scenario=weight pairs")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(
+        run_load(
+            args.base_url,
+            concurrency=args.concurrency,
+            duration=args.duration,
+            total_requests=args.requests,
+            mix=parse_mix(args.mix),
+            seed=args.seed,
+        )
+    )
+    print(json.dumps(result.report(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Move inline ``weather_forecasts.payload_raw`` JSON into ``payload_blobs``.
+
+Upgrades the schema (which adds ``payload_hash``), optionally trains a
+compression dictionary from a sample of existing payloads, then rewrites rows
+in batches: each payload is stored once by content hash and the row's
+``payload_raw`` is cleared. Safe to re-run; rows that already have a hash are skipped.
+
+    python -m tools.migrate_payload_blobs --train --vacuum
+"""
+
+import argparse
+import json
+import time
+
+from sqlalchemy import func, select, update
+
+from core import migrations
+from core.database import SessionLocal, engine
+from models.model import PayloadBlob, WeatherForecast
+from services import payload_store
+
+
+def _db_size(db) -> int:
+    if engine.dialect.name != "sqlite":
+        return 0
+    page_count = db.connection().exec_driver_sql("PRAGMA page_count").scalar()
+    page_size = db.connection().exec_driver_sql("PRAGMA page_size").scalar()
+    return page_count * page_size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move forecast payload_raw into content-addressed blobs.")
+    parser.add_argument("--batch", type=int, default=2000)
+    parser.add_argument("--train", action="store_true", help="train a compression dictionary from existing payloads first")
+    parser.add_argument("--train-samples", type=int, default=2000)
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM afterwards (SQLite) to return freed pages")
+    args = parser.parse_args(argv)
+
+    migrations.upgrade(engine)
+    pending = WeatherForecast.payload_raw.isnot(None) & WeatherForecast.payload_hash.is_(None)
+
+    with SessionLocal() as db:
+        size_before = _db_size(db)
+        if args.train:
+            rows = db.execute(select(WeatherForecast.payload_raw).where(WeatherForecast.payload_raw.isnot(None)).limit(args.train_samples)).scalars()
+            samples = [payload_store.canonical(json.loads(raw)) for raw in rows]
+            if samples:
+                dictionary_id = payload_store.save_dictionary(db, payload_store.train_dictionary(samples))
+                print(f"trained dictionary {dictionary_id} from {len(samples)} samples")
+
+        started = time.perf_counter()
+        migrated = raw_bytes = 0
+        while True:
+            batch = db.execute(select(WeatherForecast.id, WeatherForecast.payload_raw).where(pending).limit(args.batch)).all()
+            if not batch:
+                break
+            payloads = [payload_store.canonical(json.loads(raw)) for _, raw in batch]
+            hashes = payload_store.put_many(db, payloads)
+            db.execute(
+                update(WeatherForecast),
+                [{"id": row_id, "payload_hash": digest, "payload_raw": None} for (row_id, _), digest in zip(batch, hashes)],
+            )
+            db.commit()
+            migrated += len(batch)
+            raw_bytes += sum(len(raw) for _, raw in batch)
+        elapsed = time.perf_counter() - started
+
+        blobs, stored_bytes = db.execute(select(func.count(), func.coalesce(func.sum(func.length(PayloadBlob.data)), 0))).one()
+        print(f"migrated {migrated} rows in {elapsed:.1f}s ({migrated / elapsed if elapsed else 0:.0f} rows/s)")
+        print(f"payload_raw bytes moved: {raw_bytes}; blobs: {blobs}, compressed bytes: {stored_bytes}")
+        if args.vacuum and engine.dialect.name == "sqlite":
+            db.commit()
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.exec_driver_sql("VACUUM")
+        if size_before:
+            print(f"database size: {size_before} -> {_db_size(db)} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Local stand-in for api.openweathermap.org used for load testing.
+
+Serves deterministic synthetic payloads for:
+
+- GET /data/2.5/forecast
+- GET /geo/1.0/direct
+- GET /geo/1.0/reverse
+- GET /v1/forecast (Open-Meteo style, for the second forecast provider)
+
+Point the backend at it with::
+
+    FORECAST_BASE_URL=http://127.0.0.1:9001/data/2.5
+    GEO_BASE_URL=http://127.0.0.1:9001/geo/1.0
+    OPEN_METEO_BASE_URL=http://127.0.0.1:9001/v1
+
+Run with ``python -m tools.owm_emulator --port 9001`` from ``backEnd/``.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import math
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+
+_CONDITIONS = [
+    (800, "Clear", "clear sky", "01"),
+    (801, "Clouds", "few clouds", "02"),
+    (803, "Clouds", "broken clouds", "04"),
+    (500, "Rain", "light rain", "10"),
+    (300, "Drizzle", "light intensity drizzle", "09"),
+    (211, "Thunderstorm", "thunderstorm", "11"),
+    (600, "Snow", "light snow", "13"),
+    (701, "Mist", "mist", "50"),
+]
+
+
+@dataclass
+class EmulatorConfig:
+    # Latency distribution: "none", "fixed", "uniform", "exponential" or "lognormal"
+    latency: str = "none"
+    latency_ms: float = 50.0
+    # Spread: half-width for uniform, sigma for lognormal
+    latency_jitter: float = 0.5
+    # Probability of answering 500
+    error_rate: float = 0.0
+    # Probability of answering 429 even when under the rate limit
+    throttle_rate: float = 0.0
+    # Requests per second allowed per appid before answering 429 (0 disables)
+    rate_limit_rps: float = 0.0
+    # When set, any other appid is answered with 401
+    api_key: Optional[str] = None
+    seed: int = 1234
+
+
+def _stable_seed(*parts: Any) -> int:
+    raw = "|".join(str(p) for p in parts).encode()
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), "big")
+
+
+def _convert_temp(celsius: float, units: str) -> float:
+    if units == "imperial":
+        return celsius * 9 / 5 + 32
+    if units == "metric":
+        return celsius
+    return celsius + 273.15
+
+
+def build_forecast(lat: float, lon: float, units: str = "standard", now: Optional[float] = None, cnt: int = 40) -> Dict[str, Any]:
+    """Return a synthetic 5 day / 3 hour forecast shaped like OpenWeather's."""
+    now = time.time() if now is None else now
+    start = int(now // 10800 + 1) * 10800
+    key_lat, key_lon = round(lat, 2), round(lon, 2)
+    rng = random.Random(_stable_seed("forecast", key_lat, key_lon, start))
+    base_c = 25.0 - abs(key_lat) * 0.45 + rng.uniform(-3, 3)
+    tz_offset = int(round(key_lon / 15.0)) * 3600
+    wind_scale = 2.237 if units == "imperial" else 1.0
+
+    items: List[Dict[str, Any]] = []
+    for i in range(min(int(cnt), 40)):
+        dt = start + i * 10800
+        local_hour = ((dt + tz_offset) % 86400) / 3600
+        diurnal = 5.0 * math.sin((local_hour - 9) / 24 * 2 * math.pi)
+        temp_c = base_c + diurnal + rng.uniform(-1.0, 1.0)
+        code, main, desc, icon = _CONDITIONS[rng.randrange(len(_CONDITIONS))]
+        pod = "d" if 6 <= local_hour < 18 else "n"
+        item: Dict[str, Any] = {
+            "dt": dt,
+            "main": {
+                "temp": round(_convert_temp(temp_c, units), 2),
+                "feels_like": round(_convert_temp(temp_c - rng.uniform(0, 2), units), 2),
+                "temp_min": round(_convert_temp(temp_c - 0.8, units), 2),
+                "temp_max": round(_convert_temp(temp_c + 0.8, units), 2),
+                "pressure": 1000 + rng.randrange(30),
+                "humidity": 40 + rng.randrange(55),
+            },
+            "weather": [{"id": code, "main": main, "description": desc, "icon": f"{icon}{pod}"}],
+            "clouds": {"all": rng.randrange(101)},
+            "wind": {
+                "speed": round(rng.uniform(0.5, 12.0) * wind_scale, 2),
+                "deg": rng.randrange(360),
+                "gust": round(rng.uniform(1.0, 18.0) * wind_scale, 2),
+            },
+            "visibility": 10000,
+            "pop": round(rng.random(), 2),
+            "sys": {"pod": pod},
+            "dt_txt": datetime.fromtimestamp(dt, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        if main in ("Rain", "Drizzle", "Thunderstorm"):
+            item["rain"] = {"3h": round(rng.uniform(0.1, 6.0), 2)}
+        items.append(item)
+
+    return {
+        "cod": "200",
+        "message": 0,
+        "cnt": len(items),
+        "list": items,
+        "city": {
+            "id": _stable_seed("city", key_lat, key_lon) % 10_000_000,
+            "name": f"Synthetic {key_lat:.2f},{key_lon:.2f}",
+            "coord": {"lat": key_lat, "lon": key_lon},
+            "country": "ZZ",
+            "population": 0,
+            "timezone": tz_offset,
+            "sunrise": start - 6 * 3600,
+            "sunset": start + 6 * 3600,
+        },
+    }
+
+
+def build_open_meteo(lat: float, lon: float, forecast_days: int = 6, now: Optional[float] = None) -> Dict[str, Any]:
+    """Return a synthetic Open-Meteo hourly response (metric units, unixtime)."""
+    now = time.time() if now is None else now
+    start = int(now // 3600) * 3600
+    start -= start % 10800
+    key_lat, key_lon = round(lat, 2), round(lon, 2)
+    rng = random.Random(_stable_seed("open-meteo", key_lat, key_lon, start))
+    base_c = 25.0 - abs(key_lat) * 0.45 + rng.uniform(-3, 3)
+    tz_offset = int(round(key_lon / 15.0)) * 3600
+    codes = (0, 1, 2, 3, 45, 51, 61, 63, 71, 80, 95)
+    hourly: Dict[str, List[Any]] = {k: [] for k in (
+        "time", "temperature_2m", "apparent_temperature", "relative_humidity_2m", "pressure_msl",
+        "precipitation", "precipitation_probability", "weather_code", "cloud_cover",
+        "wind_speed_10m", "wind_direction_10m", "wind_gusts_10m",
+    )}
+    for i in range(max(1, min(int(forecast_days), 16)) * 24):
+        ts = start + i * 3600
+        local_hour = ((ts + tz_offset) % 86400) / 3600
+        temp = base_c + 5.0 * math.sin((local_hour - 9) / 24 * 2 * math.pi) + rng.uniform(-1, 1)
+        code = codes[rng.randrange(len(codes))]
+        hourly["time"].append(ts)
+        hourly["temperature_2m"].append(round(temp, 1))
+        hourly["apparent_temperature"].append(round(temp - rng.uniform(0, 2), 1))
+        hourly["relative_humidity_2m"].append(40 + rng.randrange(55))
+        hourly["pressure_msl"].append(round(1000 + rng.uniform(0, 30), 1))
+        hourly["precipitation"].append(round(rng.uniform(0.1, 2.0), 1) if code >= 51 else 0.0)
+        hourly["precipitation_probability"].append(rng.randrange(101))
+        hourly["weather_code"].append(code)
+        hourly["cloud_cover"].append(rng.randrange(101))
+        hourly["wind_speed_10m"].append(round(rng.uniform(0.5, 12.0), 1))
+        hourly["wind_direction_10m"].append(rng.randrange(360))
+        hourly["wind_gusts_10m"].append(round(rng.uniform(1.0, 18.0), 1))
+    return {
+        "latitude": key_lat,
+        "longitude": key_lon,
+        "utc_offset_seconds": tz_offset,
+        "timezone": "GMT",
+        "hourly": hourly,
+    }
+
+
+def build_direct(q: str, limit: int = 1) -> List[Dict[str, Any]]:
+    """Map a free-text query to deterministic coordinates."""
+    name = (q.split(",")[0].strip() or "Nowhere").title()
+    rng = random.Random(_stable_seed("direct", q.strip().lower()))
+    rows = []
+    for i in range(max(1, min(int(limit), 5))):
+        rows.append({
+            "name": name,
+            "lat": round(rng.uniform(-60, 70), 4),
+            "lon": round(rng.uniform(-180, 180), 4),
+            "country": "ZZ",
+            "state": f"Region {i + 1}",
+        })
+    return rows
+
+
+def build_reverse(lat: float, lon: float, limit: int = 1) -> List[Dict[str, Any]]:
+    return [{
+        "name": f"Place {lat:.2f},{lon:.2f}",
+        "lat": lat,
+        "lon": lon,
+        "country": "ZZ",
+        "state": "Synthetic",
+    }][: max(1, int(limit))]
+
+
+class _Behavior:
+    """Latency, failure and throttling decisions shared by all routes."""
+
+    def __init__(self, config: EmulatorConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.buckets: Dict[str, List[float]] = {}
+
+    def latency_seconds(self) -> float:
+        c = self.config
+        if c.latency == "fixed":
+            ms = c.latency_ms
+        elif c.latency == "uniform":
+            ms = c.latency_ms * (1 + self.rng.uniform(-c.latency_jitter, c.latency_jitter))
+        elif c.latency == "exponential":
+            ms = self.rng.expovariate(1.0 / c.latency_ms) if c.latency_ms > 0 else 0.0
+        elif c.latency == "lognormal":
+            mu = math.log(c.latency_ms) if c.latency_ms > 0 else 0.0
+            ms = self.rng.lognormvariate(mu, c.latency_jitter)
+        else:
+            ms = 0.0
+        return max(ms, 0.0) / 1000.0
+
+    def _over_limit(self, appid: str) -> bool:
+        rps = self.config.rate_limit_rps
+        if rps <= 0:
+            return False
+        now = time.monotonic()
+        # below 1 rps the bucket must still hold a whole token
+        capacity = max(1.0, rps)
+        # bucket = [tokens, last_refill]
+        bucket = self.buckets.setdefault(appid, [capacity, now])
+        bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rps)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return True
+        bucket[0] -= 1
+        return False
+
+    async def gate(self, appid: Optional[str]) -> Optional[JSONResponse]:
+        delay = self.latency_seconds()
+        if delay:
+            await asyncio.sleep(delay)
+        c = self.config
+        if c.api_key and appid != c.api_key:
+            return JSONResponse({"cod": 401, "message": "Invalid API key."}, status_code=401)
+        if self._over_limit(appid or "") or (c.throttle_rate and self.rng.random() < c.throttle_rate):
+            return JSONResponse({"cod": 429, "message": "Too many requests."}, status_code=429, headers={"Retry-After": "1"})
+        if c.error_rate and self.rng.random() < c.error_rate:
+            return JSONResponse({"cod": 500, "message": "Internal error."}, status_code=500)
+        return None
+
+
+def create_app(config: Optional[EmulatorConfig] = None) -> FastAPI:
+    behavior = _Behavior(config or EmulatorConfig())
+    app = FastAPI(title="OpenWeather emulator")
+    app.state.behavior = behavior
+
+    @app.get("/data/2.5/forecast")
+    async def forecast(
+        lat: float = Query(...),
+        lon: float = Query(...),
+        units: str = Query("standard"),
+        cnt: int = Query(40),
+        appid: Optional[str] = Query(None),
+    ):
+        denied = await behavior.gate(appid)
+        if denied is not None:
+            return denied
+        return build_forecast(lat, lon, units, cnt=cnt)
+
+    @app.get("/v1/forecast")
+    async def open_meteo(
+        latitude: float = Query(...),
+        longitude: float = Query(...),
+        forecast_days: int = Query(6),
+    ):
+        # Open-Meteo is keyless, so only latency and failures apply here
+        denied = await behavior.gate(behavior.config.api_key)
+        if denied is not None:
+            return denied
+        return build_open_meteo(latitude, longitude, forecast_days)
+
+    @app.get("/geo/1.0/direct")
+    async def direct(q: str = Query(...), limit: int = Query(1), appid: Optional[str] = Query(None)):
+        denied = await behavior.gate(appid)
+        if denied is not None:
+            return denied
+        return build_direct(q, limit)
+
+    @app.get("/geo/1.0/reverse")
+    async def reverse(lat: float = Query(...), lon: float = Query(...), limit: int = Query(1), appid: Optional[str] = Query(None)):
+        denied = await behavior.gate(appid)
+        if denied is not None:
+            return denied
+        return build_reverse(lat, lon, limit)
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve a local OpenWeather stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    parser.add_argument("--latency", default="none", choices=["none", "fixed", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--latency-jitter", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rps", type=float, default=0.0)
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args(argv)
+
+    config = EmulatorConfig(
+        latency=args.latency,
+        latency_ms=args.latency_ms,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        rate_limit_rps=args.rate_limit_rps,
+        api_key=args.api_key,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Tiny in-memory Redis protocol server for local multi-worker testing.
+
+Implements just what ``services.shared_cache.RedisBackend`` uses: PING, AUTH,
+SELECT, GET, SET (with NX / EX / PX), DEL, FLUSHALL and EVAL of its one
+compare-and-delete script. Not persistent and
+single process; point real deployments at Redis or Valkey instead.
+
+    python -m tools.resp_server --port 6380
+    CACHE_BACKEND=redis CACHE_URL=redis://127.0.0.1:6380/0 uvicorn main:app --workers 4
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# the only script RedisBackend sends: delete KEYS[1] if it holds ARGV[1]
+DELETE_IF_SCRIPT = b'if redis.call("GET", KEYS[1]) == ARGV[1] then return redis.call("DEL", KEYS[1]) else return 0 end'
+
+
+class RespStore:
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry[0]
+
+    def execute(self, args: List[bytes]) -> Any:
+        cmd = args[0].upper()
+        if cmd == b"PING":
+            return "PONG"
+        if cmd in (b"AUTH", b"SELECT"):
+            return "OK"
+        if cmd == b"GET":
+            return self.get(args[1])
+        if cmd == b"SET":
+            key, value = args[1], args[2]
+            expires = None
+            nx = False
+            opts = [a.upper() for a in args[3:]]
+            i = 0
+            while i < len(opts):
+                if opts[i] == b"NX":
+                    nx = True
+                elif opts[i] in (b"EX", b"PX"):
+                    amount = float(args[3 + i + 1])
+                    expires = time.monotonic() + (amount if opts[i] == b"EX" else amount / 1000)
+                    i += 1
+                else:
+                    return RuntimeError(f"unsupported SET option {opts[i].decode()}")
+                i += 1
+            if nx and self.get(key) is not None:
+                return None
+            self.data[key] = (value, expires)
+            return "OK"
+        if cmd == b"DEL":
+            return sum(1 for key in args[1:] if self.data.pop(key, None) is not None)
+        if cmd == b"EVAL":
+            if args[1] != DELETE_IF_SCRIPT or args[2] != b"1":
+                return RuntimeError("only the compare-and-delete script is supported")
+            key, value = args[3], args[4]
+            if self.get(key) != value:
+                return 0
+            del self.data[key]
+            return 1
+        if cmd == b"FLUSHALL":
+            self.data.clear()
+            return "OK"
+        return RuntimeError(f"unknown command '{cmd.decode()}'")
+
+
+def _encode(reply: Any) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, RuntimeError):
+        return b"-ERR %s\r\n" % str(reply).encode()
+    if isinstance(reply, str):
+        return b"+%s\r\n" % reply.encode()
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+
+async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # inline command, e.g. from telnet
+        return line.split()
+    args = []
+    for _ in range(int(line[1:-2])):
+        size = int((await reader.readline())[1:-2])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+def make_handler(store: RespStore):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                args = await _read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                writer.write(_encode(store.execute(args)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def serve(host: str, port: int) -> None:
+    server = await asyncio.start_server(make_handler(RespStore()), host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve an in-memory Redis protocol stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
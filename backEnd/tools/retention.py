@@ -0,0 +1,41 @@
+"""Run forecast retention once from the command line.
+
+    python -m tools.retention                      # one pass with the configured tiers
+    python -m tools.retention --enable-incremental-vacuum
+
+SQLite only hands freed pages back to the OS in ``auto_vacuum=INCREMENTAL``
+mode, and switching an existing file to it takes one full VACUUM;
+``--enable-incremental-vacuum`` does that (it rewrites the whole file, so run
+it while the API is stopped). Afterwards each retention pass releases up to
+``RETENTION_VACUUM_PAGES`` pages.
+"""
+
+import argparse
+import json
+from datetime import datetime
+
+from core.database import engine
+from services.retention import retention
+
+
+def enable_incremental_vacuum() -> None:
+    if engine.dialect.name != "sqlite":
+        raise SystemExit("incremental vacuum only applies to SQLite")
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+        print("auto_vacuum =", conn.exec_driver_sql("PRAGMA auto_vacuum").scalar())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Downsample and expire old forecast snapshots.")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true")
+    parser.add_argument("--now", type=datetime.fromisoformat, default=None, help="pretend the current UTC time is this")
+    args = parser.parse_args(argv)
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum()
+    print(json.dumps(retention.run_once(args.now), indent=2))
+
+
+if __name__ == "__main__":
+    main()
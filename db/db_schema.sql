@@ -1,6 +1,7 @@
 
 -- SQLite-compatible schema for WeatherAnalytics
 -- Note: IDs stored as TEXT (UUID strings). Timestamps use DATETIME with CURRENT_TIMESTAMP defaults.
+-- Index names match backEnd/models/model.py and backEnd/core/migrations.py; change all three together.
 PRAGMA foreign_keys = ON;
 
 -- =========================================
@@ -41,14 +42,27 @@ admin2 TEXT,
 postal_code TEXT,
 landmark TEXT,
 tz_name TEXT,
+utc_offset INTEGER,
 created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  UNIQUE (latitude, longitude),
-  UNIQUE (canonical_name, country_code, admin1, admin2, postal_code)
+updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
+CREATE UNIQUE INDEX IF NOT EXISTS uq_locations_lat_lon ON locations (latitude, longitude);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_locations_canonical ON locations (canonical_name, country_code, admin1, admin2, postal_code);
 CREATE INDEX IF NOT EXISTS idx_locations_canon ON locations (canonical_name);
 CREATE INDEX IF NOT EXISTS idx_locations_geo ON locations (latitude, longitude);
 
+-- =========================================
+-- location_aliases — alternate spellings users searched for
+-- =========================================
+CREATE TABLE IF NOT EXISTS location_aliases (
+id TEXT PRIMARY KEY,
+location_id TEXT NOT NULL REFERENCES locations (id) ON DELETE CASCADE,
+alias TEXT NOT NULL,
+created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_location_aliases_location_alias ON location_aliases (location_id, alias);
+CREATE INDEX IF NOT EXISTS idx_location_aliases_alias ON location_aliases (alias);
+
 -- =========================================
 -- requests — every user query (location + date range)
 -- Max results window: 7 days (inclusive)
@@ -73,6 +87,7 @@ CHECK (
 CREATE INDEX IF NOT EXISTS idx_requests_loc_dates ON requests (location_id, start_date, end_date);
 CREATE INDEX IF NOT EXISTS idx_requests_user ON requests (user_id);
 CREATE INDEX IF NOT EXISTS idx_requests_status ON requests (status);
+CREATE INDEX IF NOT EXISTS idx_requests_created ON requests (created_at);
 
 -- =========================================
 -- weather_observations — point-in-time actuals (past/current)
@@ -95,12 +110,42 @@ visibility_m NUMERIC,
 uv_index NUMERIC,
 weather_code TEXT,
 payload_raw TEXT,
-ingested_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  UNIQUE (location_id, provider_id, observed_at)
+ingested_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
+CREATE UNIQUE INDEX IF NOT EXISTS uq_obs_loc_provider_time ON weather_observations (location_id, provider_id, observed_at);
 CREATE INDEX IF NOT EXISTS idx_obs_loc_time ON weather_observations (location_id, observed_at);
-
 CREATE INDEX IF NOT EXISTS idx_obs_provider_time ON weather_observations (provider_id, observed_at);
+CREATE INDEX IF NOT EXISTS idx_obs_time ON weather_observations (observed_at);
+
+-- =========================================
+-- climatology — per-day-of-year running statistics of observations
+-- =========================================
+CREATE TABLE IF NOT EXISTS climatology (
+location_id TEXT NOT NULL REFERENCES locations (id) ON DELETE CASCADE,
+field TEXT NOT NULL,
+day_of_year INTEGER NOT NULL CHECK (day_of_year BETWEEN 1 AND 366),
+count INTEGER NOT NULL,
+mean REAL NOT NULL,
+m2 REAL NOT NULL,
+PRIMARY KEY (location_id, field, day_of_year)
+);
+
+-- =========================================
+-- payload_blobs — compressed raw payloads, deduplicated by content hash
+-- =========================================
+CREATE TABLE IF NOT EXISTS payload_dictionaries (
+id INTEGER PRIMARY KEY AUTOINCREMENT,
+data BLOB NOT NULL,
+created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS payload_blobs (
+hash TEXT PRIMARY KEY,
+dictionary_id INTEGER REFERENCES payload_dictionaries (id),
+raw_size INTEGER NOT NULL,
+data BLOB NOT NULL,
+created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
 
 -- =========================================
 -- weather_forecasts — snapshot of predictions
@@ -127,11 +172,14 @@ cloud_pct NUMERIC,
 pop_pct NUMERIC,
   weather_code    TEXT,
 payload_raw TEXT,
-ingested_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  UNIQUE (location_id, provider_id, kind, snapshot_time, forecast_time)
+payload_hash TEXT REFERENCES payload_blobs (hash),
+ingested_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
+CREATE UNIQUE INDEX IF NOT EXISTS uq_fc_loc_provider_kind_snap_time ON weather_forecasts (location_id, provider_id, kind, snapshot_time, forecast_time);
 CREATE INDEX IF NOT EXISTS idx_fc_loc_time ON weather_forecasts (location_id, forecast_time);
 CREATE INDEX IF NOT EXISTS idx_fc_loc_kind_snap ON weather_forecasts (location_id, kind, snapshot_time);
+CREATE INDEX IF NOT EXISTS idx_fc_time ON weather_forecasts (forecast_time);
+CREATE INDEX IF NOT EXISTS ix_weather_forecasts_payload_hash ON weather_forecasts (payload_hash);
 
 -- =========================================
 -- favorites (optional)
@@ -142,6 +190,7 @@ user_id TEXT REFERENCES users (id) ON DELETE SET NULL,
 location_id TEXT NOT NULL REFERENCES locations (id) ON DELETE CASCADE,
 created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
 );
+CREATE INDEX IF NOT EXISTS idx_favorites_loc_user ON favorites (location_id, user_id);
 
 -- Helpful view
 CREATE VIEW IF NOT EXISTS v_recent_requests AS
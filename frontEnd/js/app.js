@@ -1,6 +1,8 @@
 // Configuration
 // Configuration - Update this URL to match your backend
-const API_BASE_URL = 'http://localhost:8000/api/weather';
+// When the backend serves this page it inlines window.WEATHER_BOOTSTRAP with its API base and the default summary
+const BOOTSTRAP = window.WEATHER_BOOTSTRAP || {};
+const API_BASE_URL = BOOTSTRAP.apiBase || 'http://localhost:8000/api/weather';
 
 // DOM Elements
 const searchForm = document.getElementById('searchForm');
@@ -9,10 +11,20 @@ const loadingEl = document.getElementById('loading');
 const errorEl = document.getElementById('error');
 const weatherContent = document.getElementById('weatherContent');
 
+// Live updates pushed by the backend (Server-Sent Events)
+let updateStream = null;
+let currentData = null;
+
 // Initialize the app when DOM is loaded
 document.addEventListener('DOMContentLoaded', () => {
-    // Load default weather on page load
-    loadWeather();
+    // Load default weather on page load, from the inlined summary when there is one
+    if (BOOTSTRAP.summary) {
+        currentData = BOOTSTRAP.summary;
+        renderWeather(currentData);
+        subscribeToUpdates();
+    } else {
+        loadWeather();
+    }
     
     // Handle search form submission
     searchForm.addEventListener('submit', (e) => {
@@ -26,6 +38,37 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 });
 
+// Autocomplete known places as the user types
+const suggestList = document.getElementById('placeSuggestions');
+let suggestTimer = null;
+let suggestController = null;
+
+searchInput.addEventListener('input', () => {
+    clearTimeout(suggestTimer);
+    const prefix = searchInput.value.trim();
+    if (prefix.length < 2) return;
+    suggestTimer = setTimeout(() => loadSuggestions(prefix), 150);
+});
+
+async function loadSuggestions(prefix) {
+    if (suggestController) suggestController.abort();
+    suggestController = new AbortController();
+    try {
+        const params = new URLSearchParams({ prefix, limit: 8 });
+        const response = await fetch(`${API_BASE_URL}/locations/suggest?${params.toString()}`, { signal: suggestController.signal });
+        if (!response.ok) return;
+        const suggestions = await response.json();
+        suggestList.innerHTML = '';
+        suggestions.forEach(s => {
+            const option = document.createElement('option');
+            option.value = s.name;
+            suggestList.appendChild(option);
+        });
+    } catch (err) {
+        if (err.name !== 'AbortError') console.error('Suggest failed:', err);
+    }
+}
+
 // Fetch weather data from Python backend API
 async function loadWeather(query = null, lat = null, lon = null) {
     showLoading();
@@ -57,8 +100,10 @@ async function loadWeather(query = null, lat = null, lon = null) {
         const data = await response.json();
         console.log('Weather data received:', data);
         
+        currentData = data;
         renderWeather(data);
         hideLoading();
+        subscribeToUpdates(query, lat, lon);
         
     } catch (error) {
         console.error('Error loading weather:', error);
@@ -67,6 +112,35 @@ async function loadWeather(query = null, lat = null, lon = null) {
     }
 }
 
+// Replace polling: the server pushes a diff whenever the forecast refreshes
+function subscribeToUpdates(query = null, lat = null, lon = null) {
+    if (!window.EventSource) {
+        return;
+    }
+    if (updateStream) {
+        updateStream.close();
+    }
+    const params = new URLSearchParams();
+    if (query) {
+        params.append('q', query);
+    } else if (lat && lon) {
+        params.append('loc', `${lat},${lon}`);
+    }
+    updateStream = new EventSource(`${API_BASE_URL}/stream?${params.toString()}`);
+
+    const apply = (event) => {
+        const message = JSON.parse(event.data);
+        if (!currentData) {
+            return;
+        }
+        // keep the place name resolved for the user's own point
+        currentData = { ...currentData, ...message.data, place: currentData.place };
+        renderWeather(currentData);
+    };
+    updateStream.addEventListener('snapshot', apply);
+    updateStream.addEventListener('update', apply);
+}
+
 // Render weather data to the page
 function renderWeather(data) {
     // Update current weather